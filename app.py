@@ -2,7 +2,9 @@
 import streamlit as st
 import pandas as pd
 import datetime
-from herbal_engine import HerbalFormulator
+import os
+from herbal_engine import FormulaCache, FormulaSession, ReloadingFormulator
+from herbal_table import ui_profile
 
 # --- Configuration ---
 st.set_page_config(
@@ -65,13 +67,27 @@ st.markdown("""
 
 # --- Initialization ---
 DB_PATH = "/Users/rodrigoperezcordero/Documents/TRABAJO/plants_db.json"
+FORMULA_TABLE_PATH = os.path.join(os.path.dirname(DB_PATH), "formula_table.json") # Built by herbal_table.py
 
 @st.cache_resource
 def load_engine():
-    return HerbalFormulator(DB_PATH)
+    # Edits to plants_db.json are picked up within a few seconds, keeping every session's warm state
+    engine = ReloadingFormulator(DB_PATH, interval=2.0, cache=FormulaCache(maxsize=4096))
+    if os.path.exists(FORMULA_TABLE_PATH):
+        try:
+            engine.load_formula_table(FORMULA_TABLE_PATH)
+        except ValueError as e:
+            st.warning(f"Formula table ignored: {e}")
+    return engine
 
 engine = load_engine()
 
+def formula_session() -> FormulaSession:
+    """Per browser session; each press only recomputes the stages whose inputs changed since the last one."""
+    if "formula_session" not in st.session_state:
+        st.session_state.formula_session = FormulaSession(engine, explain=True)
+    return st.session_state.formula_session
+
 # --- Helpers ---
 def render_header():
     st.title("Herbal Formula System")
@@ -83,9 +99,10 @@ def sidebar_admin():
     with st.sidebar:
         st.header("Settings")
         st.info(f"Engine Loaded: {len(engine.db)} Plants")
+        st.caption(f"Catalog version {engine.db_hash[:12]}")
         
         if st.checkbox("View Plant Rules"):
-             st.dataframe(pd.DataFrame([vars(p) for p in engine.db]))
+             st.dataframe(pd.DataFrame([p.to_dict() for p in engine.db]))
 
 # --- Main App ---
 def main():
@@ -124,32 +141,11 @@ def main():
         focus = st.slider("Brain Fog / Focus", 0, 10, 3)
 
     # Prepare Profile
-    profile_data = {
-        "priorities": [],
-        "conditions": {
-            "pregnancy": pregnancy,
-            "medications": medications, # General polypharmacy
-            "medication_polypharmacy": medications,
-            "asteraceae_allergy": asteraceae,
-            "gastritis": gastritis,
-            "high_anxiety": (anxiety >= 7),
-            "insomnia": (insomnia >= 6), # Active insomnia condition
-            "daytime_anxiety": (anxiety >= 5 and insomnia < 5) # Heuristic for daytime
-        },
-        "anxiety_level": anxiety,
-        "insomnia_level": insomnia
-    }
-    
-    # Map map priorities
-    prio_map = {
-        "anxiety": anxiety, "sleep": insomnia, "digestion": digestion,
-        "energy": fatigue, "inflammation": inflammation, "immunity": immunity, 
-        "focus": focus, "memory": focus, "stress": anxiety, "bloating": digestion
-    }
-    
-    # Strictly order priorities
-    sorted_prio = sorted(prio_map.items(), key=lambda x: x[1], reverse=True)
-    profile_data["priorities"] = [k for k, v in sorted_prio if v >= 4]
+    profile_data = ui_profile(
+        {"anxiety": anxiety, "insomnia": insomnia, "digestion": digestion, "fatigue": fatigue,
+         "inflammation": inflammation, "immunity": immunity, "focus": focus},
+        {"pregnancy": pregnancy, "medications": medications, "asteraceae": asteraceae, "gastritis": gastritis}
+    )
 
     with col2:
         st.subheader("Formula Generation")
@@ -165,7 +161,7 @@ def main():
                 st.error("Please select at least one priority condition (Score ≥ 4).")
             else:
                 with st.spinner("Analyzing constraints, safety caps, and synergistic roles..."):
-                    result = engine.generate_formula(profile_data)
+                    result = formula_session().update(**profile_data)
                     
                     components = result.get('components', [])
                     total_g = result.get('total_grams', 4.0)
@@ -174,6 +170,10 @@ def main():
                         st.warning("No suitable plants found matching strict safety criteria.")
                     else:
                         st.success(f"Formula optimized for {name}")
+                        if result.get('dosing') == 'short':
+                            st.warning("Plant maximums cannot fill 100% of this blend; every plant is at its cap.")
+                        elif result.get('dosing') == 'infeasible':
+                            st.warning("Minimum doses conflict with the family caps; minimums were relaxed.")
                         
                         # --- Results Card ---
                         st.markdown(f"### Total Dose: {total_g}g per infusion")
@@ -210,5 +210,11 @@ def main():
                             st.write("**Priority Axis:**")
                             st.write(profile_data["priorities"])
 
+                            st.write("**Decision Trace:**")
+                            trace = result.get('trace', [])
+                            if not trace: st.markdown("- No rules fired for this profile")
+                            for n, event in enumerate(trace, start=1):
+                                st.markdown(f"{n}. `{event['kind']}` **{event['plant']}** — {event['text']}")
+
 if __name__ == "__main__":
     main()
@@ -0,0 +1,62 @@
+"""
+Concurrency stress benchmark for HerbalFormulator.
+
+Drives one shared engine from a thread pool with a mix of profiles and checks every
+result against a serial run, so cross-request state leaks show up as mismatches.
+
+    python benchmarks/bench_concurrency.py --threads 8 --requests 20000
+"""
+import argparse
+import logging
+import os
+import random
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from herbal_engine import HerbalFormulator
+
+DEFAULT_DB = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "plants_db.json")
+AXES = ["anxiety", "sleep", "digestion", "energy", "inflammation", "immunity", "focus", "memory", "stress", "bloating"]
+CONDITIONS = ["pregnancy", "medication_polypharmacy", "asteraceae_allergy", "gastritis", "daytime_anxiety"]
+
+def random_profiles(n: int, seed: int = 0):
+    rng = random.Random(seed)
+    return [
+        {
+            "priorities": rng.sample(AXES, rng.randint(1, 4)),
+            "conditions": {c: rng.random() < 0.2 for c in CONDITIONS},
+            "anxiety_level": rng.randint(0, 10),
+            "insomnia_level": rng.randint(0, 10),
+            "stress_level": rng.randint(0, 10),
+        }
+        for _ in range(n)
+    ]
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--db", default=DEFAULT_DB)
+    parser.add_argument("--threads", type=int, default=8)
+    parser.add_argument("--requests", type=int, default=20000)
+    parser.add_argument("--profiles", type=int, default=200, help="distinct profiles in the mix")
+    args = parser.parse_args()
+
+    logging.disable(logging.INFO)
+    engine = HerbalFormulator(args.db)
+    profiles = random_profiles(args.profiles)
+    expected = [engine.generate_formula(p) for p in profiles]
+    jobs = [i % len(profiles) for i in range(args.requests)]
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.threads) as pool:
+        results = list(pool.map(lambda i: engine.generate_formula(profiles[i]), jobs))
+    elapsed = time.perf_counter() - start
+
+    mismatches = sum(1 for i, r in zip(jobs, results) if r != expected[i])
+    print(f"threads={args.threads} requests={args.requests} elapsed={elapsed:.3f}s "
+          f"throughput={args.requests / elapsed:,.0f} req/s mismatches={mismatches}")
+    return 1 if mismatches else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,183 @@
+"""
+Latency, throughput and per-stage timing suite for HerbalFormulator.generate_formula.
+
+`run` measures each catalog size (the real plants_db.json, plus seeded synthetic catalogs
+from generate_plants_db.py) and writes a JSON report. It records p50/p95/p99 request
+latency, serial requests per second, and the p50/p95/p99 of each pipeline stage:
+    _score_plants, safety (the memoized condition index pass), _select_composition,
+    _apply_synergies, check_antagonisms, _calculate_dosages
+`compare` diffs two reports and exits 1 if any metric regressed past --threshold percent.
+
+    python benchmarks/bench_engine.py run --sizes 19 1000 10000 100000 --out base.json
+    python benchmarks/bench_engine.py run --out new.json
+    python benchmarks/bench_engine.py compare base.json new.json --threshold 10
+"""
+import argparse
+import json
+import logging
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Dict, Any, List, Tuple
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from herbal_catalog import write_catalog
+from herbal_engine import ConstraintEngine, HerbalFormulator, _present
+from bench_batch import scaled_records
+from bench_concurrency import DEFAULT_DB, random_profiles
+
+STAGES = ("_score_plants", "safety", "_select_composition", "_apply_synergies", "check_antagonisms",
+          "_calculate_dosages")
+PERCENTILES = (50, 95, 99)
+
+def staged_formula(engine: HerbalFormulator, profile_dict: Dict[str, Any]) -> Tuple[Dict[str, Any], List[float]]:
+    """HerbalFormulator._formulate with a clock around every stage; returns (formula, stage seconds)."""
+    clock = time.perf_counter
+    profile = engine._build_profile(profile_dict)
+    t0 = clock()
+    states = engine._score_plants(profile)
+    t1 = clock()
+    safety = engine._safety(profile, states)
+    excluded, shifted = safety.excluded, safety.shifted
+    t2 = clock()
+    selected = [s for role in engine._select_composition(states, excluded, shifted, profile).values() for s in role]
+    t3 = clock()
+    selected = engine._apply_synergies(selected, profile)
+    t4 = clock()
+    selected = ConstraintEngine.check_antagonisms(selected, profile, engine._interactions)
+    t5 = clock()
+    selected, status = engine._calculate_dosages(selected, profile)
+    t6 = clock()
+    formula = _present(engine._format_output(selected, status, states.trace), False, engine.db_hash, engine._symbols.ids)
+    return formula, [t1 - t0, t2 - t1, t3 - t2, t4 - t3, t5 - t4, t6 - t5]
+
+def summarize(seconds) -> Dict[str, float]:
+    ms = np.asarray(seconds) * 1e3
+    summary = {f"p{p}": float(np.percentile(ms, p)) for p in PERCENTILES}
+    summary["mean"] = float(ms.mean())
+    return summary
+
+def measure(engine: HerbalFormulator, profiles: List[Dict[str, Any]], warmup: int) -> Dict[str, Any]:
+    for p in profiles[:warmup]: engine.generate_formula(p)
+
+    latencies = []
+    start = time.perf_counter()
+    for p in profiles:
+        t = time.perf_counter()
+        engine.generate_formula(p)
+        latencies.append(time.perf_counter() - t)
+    total = time.perf_counter() - start
+
+    stages = []
+    for p in profiles:
+        formula, timings = staged_formula(engine, p)
+        stages.append(timings)
+    if formula != engine.generate_formula(profiles[-1]):
+        raise RuntimeError("staged pipeline diverged from generate_formula; update staged_formula")
+    stages = np.asarray(stages)
+    return {
+        "plants": len(engine.db),
+        "requests": len(profiles),
+        "latency_ms": summarize(latencies),
+        "throughput_rps": len(profiles) / total,
+        "stages_ms": {name: summarize(stages[:, k]) for k, name in enumerate(STAGES)},
+    }
+
+def load_engine(db_path: str, plants: int, tmp: str) -> HerbalFormulator:
+    """The real catalog for plants == its size (or 0), otherwise a synthetic .hcat of that size."""
+    with open(db_path, 'r', encoding='utf-8') as f:
+        base = len(json.load(f))
+    if plants in (0, base): return HerbalFormulator(db_path)
+    path = os.path.join(tmp, f"plants_{plants}.hcat")
+    write_catalog(scaled_records(db_path, plants), path)
+    return HerbalFormulator(path)
+
+def environment(db_path: str) -> Dict[str, Any]:
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                                cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+    except OSError:
+        commit = ""
+    return {"timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"), "commit": commit, "db": os.path.abspath(db_path),
+            "python": platform.python_version(), "numpy": np.__version__, "machine": platform.machine(),
+            "platform": platform.platform()}
+
+def run(args) -> int:
+    logging.disable(logging.INFO)
+    report = {"environment": environment(args.db), "results": []}
+    with tempfile.TemporaryDirectory() as tmp:
+        for plants in args.sizes:
+            engine = load_engine(args.db, plants, tmp)
+            requests = args.requests if len(engine.db) <= 10000 else max(args.requests // 10, 50)
+            result = measure(engine, random_profiles(requests, seed=args.seed), args.warmup)
+            report["results"].append(result)
+            lat = result["latency_ms"]
+            print(f"plants={result['plants']:>7} requests={requests:>5}  p50 {lat['p50']:.3f} ms  p95 {lat['p95']:.3f} ms  "
+                  f"p99 {lat['p99']:.3f} ms  {result['throughput_rps']:,.0f} req/s", file=sys.stderr)
+            for name in STAGES:
+                stage = result["stages_ms"][name]
+                print(f"    {name:<20} p50 {stage['p50']:.4f} ms  p99 {stage['p99']:.4f} ms", file=sys.stderr)
+            del engine
+    text = json.dumps(report, indent=2)
+    if args.out:
+        with open(args.out, 'w', encoding='utf-8') as f: f.write(text + "\n")
+    else:
+        print(text)
+    return 0
+
+def metrics(result: Dict[str, Any]) -> Dict[str, Tuple[float, bool]]:
+    """Flattened metric -> (value, higher is better)."""
+    flat = {f"latency.{k}": (v, False) for k, v in result["latency_ms"].items()}
+    flat["throughput_rps"] = (result["throughput_rps"], True)
+    for stage, summary in result["stages_ms"].items():
+        for k, v in summary.items(): flat[f"{stage}.{k}"] = (v, False)
+    return flat
+
+def compare(args) -> int:
+    with open(args.base, 'r', encoding='utf-8') as f: base = json.load(f)
+    with open(args.new, 'r', encoding='utf-8') as f: new = json.load(f)
+    base_by_size = {r["plants"]: r for r in base["results"]}
+    regressions = 0
+    print(f"base {base['environment'].get('commit') or args.base}  vs  new {new['environment'].get('commit') or args.new}")
+    for result in new["results"]:
+        old = base_by_size.get(result["plants"])
+        if old is None: continue
+        print(f"\nplants={result['plants']}")
+        old_metrics = metrics(old)
+        for name, (value, higher_better) in metrics(result).items():
+            if name not in old_metrics or (not args.all and not name.endswith(("p50", "p99", "rps"))): continue
+            before = old_metrics[name][0]
+            change = (value - before) / before * 100 if before else 0.0
+            worse = -change if higher_better else change
+            flag = "REGRESSION" if worse > args.threshold else ""
+            regressions += bool(flag)
+            print(f"  {name:<30} {before:>12.4f} -> {value:>12.4f}  {change:>+7.1f}%  {flag}")
+    print(f"\n{regressions} regression(s) above {args.threshold}%")
+    return 1 if regressions else 0
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    commands = parser.add_subparsers(dest="command", required=True)
+    run_cmd = commands.add_parser("run", help="measure and write a JSON report")
+    run_cmd.add_argument("--db", default=DEFAULT_DB)
+    run_cmd.add_argument("--sizes", type=int, nargs="+", default=[19, 1000, 10000, 100000],
+                         help="catalog sizes; the real DB size uses plants_db.json as is")
+    run_cmd.add_argument("--requests", type=int, default=2000, help="timed requests per size (a tenth above 10k plants)")
+    run_cmd.add_argument("--warmup", type=int, default=100)
+    run_cmd.add_argument("--seed", type=int, default=1)
+    run_cmd.add_argument("--out", help="report path (default: stdout)")
+    cmp_cmd = commands.add_parser("compare", help="diff two reports")
+    cmp_cmd.add_argument("base")
+    cmp_cmd.add_argument("new")
+    cmp_cmd.add_argument("--threshold", type=float, default=10.0, help="percent change counted as a regression")
+    cmp_cmd.add_argument("--all", action="store_true", help="show every percentile and the mean")
+    args = parser.parse_args()
+    return run(args) if args.command == "run" else compare(args)
+
+if __name__ == "__main__":
+    sys.exit(main())
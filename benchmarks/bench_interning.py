@@ -0,0 +1,117 @@
+"""
+Request-path cost of string keys versus the interned SymbolTable codes.
+
+Profiles arrive as JSON (as herbal_server.py receives them), so every request brings fresh
+strings whose hashes are not cached yet. For the same stream the suite measures, with the
+string-keyed canonical key of earlier versions (sorted priority names, sorted condition
+names, dict lookups for the condition mask) and with the interned one (profile.axes,
+profile.mask):
+
+    key us      _build_profile + _canonical_key, per request
+    hit us      generate_formula answered by a warm FormulaCache, per request
+    peak B      tracemalloc peak of _build_profile + _canonical_key (temporaries included)
+    key B       retained size of one cache key (tuples, strings, ints)
+
+    python benchmarks/bench_interning.py --requests 20000
+"""
+import argparse
+import json
+import logging
+import os
+import statistics
+import sys
+import time
+import tracemalloc
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from herbal_engine import FormulaCache, HerbalFormulator
+from bench_concurrency import DEFAULT_DB, random_profiles
+
+class StringKeyed(HerbalFormulator):
+    """The request path as it was before interning: priority and condition names all the way down."""
+
+    def _load_columns(self, columns):
+        super()._load_columns(columns)
+        self._axis_index = dict(self._symbols.axis)
+        self._condition_bits = {key: 1 << n for n, key in enumerate(self._symbols.conditions)}
+
+    def _intern(self, profile):
+        profile.mask = self._string_mask(profile) # Read by the safety stage
+
+    def _string_mask(self, profile):
+        bits = self._condition_bits
+        mask = 0
+        for key, active in profile.conditions.items():
+            if active and key in bits: mask |= bits[key]
+        return mask
+
+    def _canonical_key(self, profile):
+        return (
+            tuple(sorted(p for p in profile.priorities if p in self._axis_index)),
+            tuple(sorted(k for k, v in profile.conditions.items() if v and k in self._condition_bits)),
+            tuple(predicate(profile) for predicate in self._interactions.predicates),
+        )
+
+    def _priority_weights(self, profiles):
+        weights = np.zeros((len(profiles), len(self._axes)))
+        for row, profile in enumerate(profiles):
+            for prio in profile.priorities:
+                col = self._axis_index.get(prio)
+                if col is not None: weights[row, col] += 1
+        return weights
+
+def deep_size(obj) -> int:
+    if isinstance(obj, tuple): return sys.getsizeof(obj) + sum(deep_size(x) for x in obj)
+    return sys.getsizeof(obj) if isinstance(obj, str) or type(obj) is int and obj > 256 else 0 # Small ints are shared
+
+def best(fn, payloads, repeats: int) -> float:
+    """Fastest of `repeats` passes of fn over freshly decoded payloads, in us per request (decoding untimed)."""
+    times = []
+    for _ in range(repeats):
+        profiles = [json.loads(p) for p in payloads]
+        start = time.perf_counter()
+        for p in profiles: fn(p)
+        times.append((time.perf_counter() - start) / len(payloads) * 1e6)
+    return min(times)
+
+def measure(engine: HerbalFormulator, payloads, repeats: int):
+    key = lambda p: engine._canonical_key(engine._build_profile(p))
+    key_us = best(key, payloads, repeats)
+    results = [engine.generate_formula(json.loads(p)) for p in payloads] # Fills the cache
+    hit_us = best(engine.generate_formula, payloads, repeats)
+
+    peaks = []
+    for p in payloads[:500]:
+        profile_dict = json.loads(p)
+        tracemalloc.start()
+        key(profile_dict)
+        peaks.append(tracemalloc.get_traced_memory()[1])
+        tracemalloc.stop()
+    key_bytes = statistics.fmean(deep_size(key(json.loads(p))) for p in payloads)
+    return key_us, hit_us, statistics.median(peaks), key_bytes, results
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--db", default=DEFAULT_DB)
+    parser.add_argument("--requests", type=int, default=20000)
+    parser.add_argument("--repeats", type=int, default=5, help="timed passes; the fastest is reported")
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+    logging.disable(logging.INFO)
+    payloads = [json.dumps(p) for p in random_profiles(args.requests, seed=args.seed)]
+
+    print(f"{'keys':>9} {'key us':>8} {'hit us':>8} {'peak B':>8} {'key B':>7}")
+    rows = {}
+    for name, cls in (("strings", StringKeyed), ("interned", HerbalFormulator)):
+        engine = cls(args.db, cache=FormulaCache(len(payloads)))
+        *row, results = measure(engine, payloads, args.repeats)
+        rows[name] = (row, results)
+        print(f"{name:>9} {row[0]:>8.2f} {row[1]:>8.2f} {row[2]:>8.0f} {row[3]:>7.0f}")
+    if rows["strings"][1] != rows["interned"][1]: raise RuntimeError("interned keys changed the formulas")
+    (s_key, s_hit, *_), (i_key, i_hit, *_) = rows["strings"][0], rows["interned"][0]
+    print(f"\nkey {s_key / i_key:.2f}x  cache hit {s_hit / i_hit:.2f}x")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,103 @@
+"""
+Memory and loop cost of the catalog representation: a list of per-plant dataclasses (the
+layout HerbalFormulator used before PlantTable) versus the struct-of-arrays PlantTable.
+
+Retained memory is measured with tracemalloc after building each representation from the
+same JSON text (parsed records are dropped, so only what the structure keeps is counted).
+The loop timings score one profile and sum the caps of the primary plants.
+
+    python benchmarks/bench_memory.py --sizes 19 10000 100000
+"""
+import argparse
+import gc
+import json
+import os
+import sys
+import time
+import tracemalloc
+from dataclasses import dataclass, field
+from typing import Any, Dict, List
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from herbal_catalog import encode_catalog
+from herbal_engine import PlantTable
+from bench_batch import scaled_records
+from bench_concurrency import DEFAULT_DB
+
+PRIORITIES = ["sleep", "anxiety"]
+
+@dataclass(frozen=True)
+class LegacyPlant:
+    id: str
+    name: str
+    family_botanical: str
+    family_functional: str
+    role: str
+    min_percent: float
+    max_percent: float
+    constraints: Dict[str, Any] = field(default_factory=dict)
+    scores: Dict[str, int] = field(default_factory=dict)
+    synergies: List[Dict[str, Any]] = field(default_factory=list)
+    antagonisms: List[Dict[str, Any]] = field(default_factory=list)
+    family: str = ""
+    attributes: List[str] = field(default_factory=list)
+
+def build_legacy(text: str):
+    return [LegacyPlant(**item) for item in json.loads(text)]
+
+def build_table(text: str):
+    return PlantTable(encode_catalog(json.loads(text), "bench"))
+
+def retained(build, text: str):
+    """(bytes still allocated after build, peak bytes during build)."""
+    gc.collect()
+    tracemalloc.start()
+    obj = build(text)
+    gc.collect()
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return obj, current, peak
+
+def legacy_loops(plants):
+    scores = [sum(p.scores.get(prio, 0) for prio in PRIORITIES) for p in plants]
+    caps = sum(p.max_percent for p in plants if p.role == 'primary')
+    return scores, caps
+
+def table_loops(table: PlantTable):
+    axes = table.columns.axes
+    weights = [float(sum(prio == axis for prio in PRIORITIES)) for axis in axes]
+    scores = table.scores @ weights
+    caps = table.max_percent[table.role_codes == table.roles.index('primary')].sum()
+    return scores, caps
+
+def best_of(fn, arg, repeats: int = 5) -> float:
+    times = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        fn(arg)
+        times.append(time.perf_counter() - start)
+    return min(times)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--db", default=DEFAULT_DB)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[19, 10000, 100000])
+    args = parser.parse_args()
+
+    print(f"{'plants':>8} {'layout':>10} {'retained MB':>12} {'B/plant':>8} {'peak MB':>8} {'loops ms':>9}")
+    for n in args.sizes:
+        text = json.dumps(scaled_records(args.db, n))
+        legacy, legacy_bytes, legacy_peak = retained(build_legacy, text)
+        table, table_bytes, table_peak = retained(build_table, text)
+        legacy_scores, legacy_caps = legacy_loops(legacy)
+        table_scores, table_caps = table_loops(table)
+        assert list(table_scores) == legacy_scores and abs(table_caps - legacy_caps) < 1e-6
+        for label, size, peak, seconds in (
+            ("dataclass", legacy_bytes, legacy_peak, best_of(legacy_loops, legacy)),
+            ("PlantTable", table_bytes, table_peak, best_of(table_loops, table)),
+        ):
+            print(f"{n:>8} {label:>10} {size / 1e6:>12.2f} {size / n:>8.0f} {peak / 1e6:>8.2f} {seconds * 1e3:>9.3f}")
+        del legacy, table
+
+if __name__ == "__main__":
+    main()
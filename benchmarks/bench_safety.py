@@ -0,0 +1,99 @@
+"""
+Safety stage with and without the per-condition-bitmask SafetyCache.
+
+Times the safety stage alone (HerbalFormulator._safety over freshly scored states) and the
+end-to-end generate_formula latency for the same request stream, once with the cache off
+(safety_cache_size=0, the condition index pass on every request) and once with it on, and
+reports the cache hit rate and the number of distinct condition masks in the stream. The
+stream mixes Streamlit UI profiles (herbal_table.ui_profile) with the random API profiles
+used by the other benchmarks.
+
+A second table times the catalog-wide exclusion mask of a batch of profiles: a
+ConstraintEngine.check_safety scan of every plant against HerbalFormulator.safe_mask
+(the ExclusionMatrix AND plus any-reduction), per profile.
+
+    python benchmarks/bench_safety.py --sizes 19 10000 --requests 5000
+"""
+import argparse
+import logging
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from herbal_catalog import write_catalog
+from herbal_engine import ConstraintEngine, HerbalFormulator, PlantState
+from herbal_table import ui_profile, SLIDERS, CHECKBOXES
+from bench_batch import scaled_records
+from bench_concurrency import DEFAULT_DB, random_profiles
+
+def request_stream(n: int, seed: int):
+    rng = random.Random(seed)
+    api = random_profiles(n, seed=seed)
+    return [ui_profile({s: rng.randint(0, 10) for s in SLIDERS}, {c: rng.random() < 0.15 for c in CHECKBOXES})
+            if rng.random() < 0.7 else api[k] for k in range(n)]
+
+def measure(engine: HerbalFormulator, profiles):
+    stage = []
+    for p in profiles:
+        profile = engine._build_profile(p)
+        states = engine._score_plants(profile)
+        start = time.perf_counter()
+        engine._safety(profile, states)
+        stage.append(time.perf_counter() - start)
+    start = time.perf_counter()
+    for p in profiles: engine.generate_formula(p)
+    return stage, (time.perf_counter() - start) / len(profiles)
+
+def scan_mask(engine: HerbalFormulator, profiles):
+    """safe_mask the way check_safety computes it, one plant at a time."""
+    rows = []
+    for p in profiles:
+        profile = engine._build_profile(p)
+        rows.append([ConstraintEngine.check_safety(PlantState(plant=plant), profile) for plant in engine.db])
+    return rows
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--db", default=DEFAULT_DB)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[19, 10000])
+    parser.add_argument("--requests", type=int, default=5000)
+    parser.add_argument("--batch", type=int, default=200, help="profiles in the exclusion mask batch")
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+    logging.disable(logging.INFO)
+    profiles = request_stream(args.requests, args.seed)
+
+    results = []
+    print(f"{'plants':>8} {'cache':>6} {'stage p50 us':>13} {'stage mean us':>14} {'request us':>11} {'hit rate':>9} {'masks':>6}")
+    with tempfile.TemporaryDirectory() as tmp:
+        for n in args.sizes:
+            path = os.path.join(tmp, f"plants_{n}.hcat")
+            write_catalog(scaled_records(args.db, n), path)
+            for size in (0, HerbalFormulator.SAFETY_CACHE_SIZE):
+                engine = HerbalFormulator(path, safety_cache_size=size)
+                stage, request = measure(engine, profiles)
+                stats = engine.safety_cache.stats() if engine.safety_cache else None
+                masks = len({engine._build_profile(p).mask for p in profiles})
+                print(f"{len(engine.db):>8} {'on' if size else 'off':>6} {statistics.median(stage) * 1e6:>13.2f} "
+                      f"{statistics.fmean(stage) * 1e6:>14.2f} {request * 1e6:>11.1f} "
+                      f"{stats['hit_rate'] if stats else 0:>9.1%} {masks:>6}")
+            batch = profiles[:args.batch]
+            start = time.perf_counter()
+            scanned = scan_mask(engine, batch)
+            scan = (time.perf_counter() - start) / len(batch)
+            start = time.perf_counter()
+            safe = engine.safe_mask(batch)
+            matrix = (time.perf_counter() - start) / len(batch)
+            if safe.tolist() != scanned: raise RuntimeError("safe_mask diverged from check_safety")
+            results.append((len(engine.db), scan, matrix))
+
+    print(f"\n{'plants':>8} {'scan us':>10} {'bit matrix us':>14} {'speedup':>8}  (exclusion mask per profile)")
+    for plants, scan, matrix in results:
+        print(f"{plants:>8} {scan * 1e6:>10.1f} {matrix * 1e6:>14.2f} {scan / matrix:>7.0f}x")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,61 @@
+"""
+Cold-start cost of HerbalFormulator: plants_db.json versus the binary .hcat catalog.
+
+For each catalog size the same records are written as JSON and as .hcat, then each is
+loaded several times in-process; the median load time and the first-request latency are
+reported. Sizes other than the real catalog's are synthetic (generate_plants_db.py).
+
+    python benchmarks/bench_startup.py --sizes 19 10000 100000
+"""
+import argparse
+import json
+import logging
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from herbal_catalog import write_catalog
+from herbal_engine import HerbalFormulator
+from bench_batch import scaled_records
+from bench_concurrency import DEFAULT_DB
+
+PROFILE = {"priorities": ["sleep", "anxiety"], "conditions": {"daytime_anxiety": True}, "anxiety_level": 6}
+
+def time_load(path: str, repeats: int):
+    loads = []
+    first = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        engine = HerbalFormulator(path)
+        loads.append(time.perf_counter() - start)
+        start = time.perf_counter()
+        engine.generate_formula(PROFILE)
+        first.append(time.perf_counter() - start)
+    return statistics.median(loads), statistics.median(first)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--db", default=DEFAULT_DB)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[19, 10000, 100000])
+    parser.add_argument("--repeats", type=int, default=5)
+    args = parser.parse_args()
+    logging.disable(logging.INFO)
+
+    print(f"{'plants':>8} {'format':>6} {'file MB':>8} {'load ms':>9} {'1st req ms':>11}")
+    with tempfile.TemporaryDirectory() as tmp:
+        for n in args.sizes:
+            records = scaled_records(args.db, n)
+            json_path = os.path.join(tmp, f"plants_{n}.json")
+            with open(json_path, "w", encoding="utf-8") as f:
+                json.dump(records, f, indent=4)
+            hcat_path = os.path.join(tmp, f"plants_{n}.hcat")
+            write_catalog(records, hcat_path)
+            for label, path in (("json", json_path), ("hcat", hcat_path)):
+                load_s, first_s = time_load(path, args.repeats)
+                print(f"{n:>8} {label:>6} {os.path.getsize(path) / 1e6:>8.2f} {load_s * 1e3:>9.1f} {first_s * 1e3:>11.2f}")
+
+if __name__ == "__main__":
+    main()
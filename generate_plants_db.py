@@ -1,13 +1,29 @@
 
+"""
+Writes plants_db.json (plus plants_db.hcat) from the hand-curated catalog, or, with --scale,
+a seeded synthetic catalog of N plants for load and scale testing:
+
+    python generate_plants_db.py
+    python generate_plants_db.py --scale 100000 --seed 7 --out plants_100k.json --hcat
+"""
+import argparse
+import hashlib
 import json
 import logging
+import os
+import random
+from collections import Counter
+from typing import Dict, Any, Iterator, List
+from herbal_catalog import write_catalog
 
 # Configure logging
 logging.basicConfig(level=logging.INFO, format='%(levelname)s: %(message)s')
 
-def generate_database():
+DEFAULT_PATH = "/Users/rodrigoperezcordero/Documents/TRABAJO/plants_db.json"
+
+def curated_plants() -> List[Dict[str, Any]]:
     """
-    Generates the plant database with rigorous adherence to "RELATIVE DOSING LIMITS.pdf"
+    The plant database with rigorous adherence to "RELATIVE DOSING LIMITS.pdf"
     and "Phase 2" Synergies/Antagonisms.
     Includes backward compatibility fields for MVP.
     """
@@ -334,18 +350,154 @@ def generate_database():
         }
     ]
 
-    file_path = "/Users/rodrigoperezcordero/Documents/TRABAJO/plants_db.json"
+    # Add 'family' and 'attributes' alias for backward compatibility with MVP engine
+    for p in plants_data:
+        p['family'] = p['family_functional']
+        p['attributes'] = []
+    return plants_data
+
+def generate_database(file_path: str = DEFAULT_PATH):
+    """Writes the curated catalog as JSON and as a binary catalog next to it."""
     try:
-        # Add 'family' and 'attributes' alias for backward compatibility with MVP engine
-        for p in plants_data:
-            p['family'] = p['family_functional']
-            p['attributes'] = []
-            
+        plants_data = curated_plants()
+        text = json.dumps(plants_data, indent=4)
         with open(file_path, "w", encoding="utf-8") as f:
-            json.dump(plants_data, f, indent=4)
+            f.write(text)
         logging.info(f"Successfully generated database with {len(plants_data)} plants.")
+
+        # Compact binary catalog next to the JSON, stamped with the JSON's content hash
+        binary_path = os.path.splitext(file_path)[0] + ".hcat"
+        write_catalog(plants_data, binary_path, hashlib.sha256(text.encode("utf-8")).hexdigest())
+        logging.info(f"Wrote binary catalog {binary_path}.")
     except Exception as e:
         logging.error(f"Failed to generate database: {e}")
 
+# --- Synthetic Catalogs ---
+
+SAME_FAMILY_SYNERGY = 0.6 # Share of synergy partners drawn from the plant's own family
+
+class _Distributions:
+    """Empirical distributions of the curated catalog that synthetic plants are sampled from."""
+
+    def __init__(self, plants: List[Dict[str, Any]]):
+        self.roles = [p['role'] for p in plants]
+        self.families = [p['family_functional'] for p in plants]
+        self.family_axes = {}
+        for p in plants: self.family_axes.setdefault(p['family_functional'], []).extend(p['scores'])
+        self.all_axes = sorted({axis for p in plants for axis in p['scores']})
+        self.axis_counts = [len(p['scores']) for p in plants]
+        self.score_values = [v for p in plants for v in p['scores'].values()]
+        self.ranges = {}
+        for p in plants: self.ranges.setdefault(p['role'], []).append((p['min_percent'], p['max_percent']))
+        self.botanical = {}
+        for p in plants: self.botanical.setdefault(p['family_functional'], []).append(p['family_botanical'])
+        self.rule_counts = [len(p['constraints'].get('conditions', [])) for p in plants]
+        self.rules = [r for p in plants for r in p['constraints'].get('conditions', [])]
+        self.family_limits = {}
+        for p in plants:
+            limit = p['constraints'].get('global_family_limit')
+            if limit: self.family_limits[p['family_functional']] = limit
+        self.synergy_counts = [len(p.get('synergies', [])) for p in plants]
+        self.antagonism_counts = [len(p.get('antagonisms', [])) for p in plants]
+        self.synergies = [{k: v for k, v in link.items() if k != 'with'} for p in plants for link in p.get('synergies', [])]
+        self.antagonisms = [{k: v for k, v in link.items() if k != 'with'} for p in plants for link in p.get('antagonisms', [])]
+
+def synthetic_plants(n: int, seed: int = 0) -> Iterator[Dict[str, Any]]:
+    """
+    Yields n plant records, deterministic for a given seed. Roles, functional families,
+    score axes and values, percent ranges, conditional rules, family limits and the
+    synergy/antagonism out-degree follow the curated catalog's empirical distributions;
+    synergy partners are biased towards the plant's own family. Every link points at a
+    plant of the same catalog. Only O(n) small integers are held, never the records.
+    """
+    dist = _Distributions(curated_plants())
+    rng = random.Random(seed)
+    roles = [rng.choice(dist.roles) for _ in range(n)]
+    families = [rng.choice(dist.families) for _ in range(n)]
+    members = {}
+    for i, family in enumerate(families): members.setdefault(family, []).append(i)
+    plant_id = "plant_{:0%dd}" % len(str(max(n - 1, 1)))
+
+    def partner(i: int, pool: List[int]) -> int:
+        j = rng.choice(pool) if len(pool) > 1 else rng.randrange(n)
+        return j if j != i else (j + 1) % n
+
+    for i in range(n):
+        family, role = families[i], roles[i]
+        pool = dist.family_axes.get(family) or dist.all_axes
+        distinct = list(dict.fromkeys(rng.sample(pool, len(pool)))) # Frequency-weighted order
+        axes = distinct[:rng.choice(dist.axis_counts)]
+        low, high = rng.choice(dist.ranges[role])
+        constraints = {}
+        if family in dist.family_limits: constraints['global_family_limit'] = dict(dist.family_limits[family])
+        rules = [dict(rng.choice(dist.rules)) for _ in range(rng.choice(dist.rule_counts))]
+        if rules: constraints['conditions'] = rules
+        plant = {
+            "id": plant_id.format(i),
+            "name": f"{family} Herb {i}",
+            "family_botanical": rng.choice(dist.botanical[family]),
+            "family_functional": family,
+            "role": role,
+            "min_percent": low,
+            "max_percent": high,
+            "constraints": constraints,
+            "scores": {axis: rng.choice(dist.score_values) for axis in axes},
+        }
+        if n > 1:
+            synergies = [{"with": plant_id.format(partner(i, members[family] if rng.random() < SAME_FAMILY_SYNERGY else range(n))),
+                          **rng.choice(dist.synergies)} for _ in range(rng.choice(dist.synergy_counts))]
+            antagonisms = [{"with": plant_id.format(partner(i, range(n))), **rng.choice(dist.antagonisms)}
+                           for _ in range(rng.choice(dist.antagonism_counts))]
+            if synergies: plant["synergies"] = synergies
+            if antagonisms: plant["antagonisms"] = antagonisms
+        plant["family"] = family
+        plant["attributes"] = []
+        yield plant
+
+def write_synthetic(n: int, seed: int, file_path: str, binary: bool = False) -> str:
+    """
+    Streams a synthetic catalog to file_path one plant per line, hashing as it writes, and
+    returns the sha256 of the file. With binary, a .hcat stamped with that hash is also
+    written; the binary encoder needs every record, so only then are they collected.
+    """
+    digest = hashlib.sha256()
+    records = [] if binary else None
+    with open(file_path, "w", encoding="utf-8") as f:
+        def put(text: str):
+            f.write(text)
+            digest.update(text.encode("utf-8"))
+        put("[")
+        for i, plant in enumerate(synthetic_plants(n, seed)):
+            put(("\n    " if i == 0 else ",\n    ") + json.dumps(plant))
+            if records is not None: records.append(plant)
+        put("\n]\n")
+    if binary:
+        write_catalog(records, os.path.splitext(file_path)[0] + ".hcat", digest.hexdigest())
+    return digest.hexdigest()
+
+def describe(plants: List[Dict[str, Any]]) -> str:
+    """One-line summary of the distributions a catalog realizes."""
+    n = len(plants)
+    roles = Counter(p['role'] for p in plants)
+    syn = sum(len(p.get('synergies', [])) for p in plants)
+    ant = sum(len(p.get('antagonisms', [])) for p in plants)
+    rules = sum(len(p['constraints'].get('conditions', [])) for p in plants)
+    return (f"{n} plants, roles " + ", ".join(f"{r} {c / n:.0%}" for r, c in sorted(roles.items())) +
+            f", {rules / n:.2f} rules, {syn / n:.2f} synergies, {ant / n:.2f} antagonisms per plant")
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate the plant catalog.")
+    parser.add_argument("--scale", type=int, default=0, help="write a synthetic catalog of this many plants")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--out", help=f"output JSON path (default: {DEFAULT_PATH}, or plants_<N>.json with --scale)")
+    parser.add_argument("--hcat", action="store_true", help="also write a binary catalog for a synthetic one")
+    args = parser.parse_args()
+    if not args.scale:
+        generate_database(args.out or DEFAULT_PATH)
+        return
+    out = args.out or f"plants_{args.scale}.json"
+    digest = write_synthetic(args.scale, args.seed, out, binary=args.hcat)
+    logging.info(f"Wrote synthetic catalog {out} ({args.scale} plants, seed {args.seed}, sha256 {digest[:12]}).")
+
 if __name__ == "__main__":
-    generate_database()
+    main()
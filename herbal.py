@@ -0,0 +1,215 @@
+"""
+Command line entry point for production runs.
+
+    python herbal.py batch profiles.jsonl > formulas.jsonl
+    cat profiles.jsonl | python herbal.py batch --workers 8 --unordered > formulas.jsonl
+    python herbal.py compile plants_db.json --out plants_db.hcat
+
+`batch` reads one profile JSON object per line (file or stdin) and writes one JSON line per
+profile to stdout: {"line": n, "formula": {...}} or, for a record that could not be
+formulated, {"line": n, "error": "..."}; a profile's "id" is echoed when present. Records
+are sent to a process pool in chunks and at most a fixed window of chunks is in flight, so
+memory stays bounded however long the input is. Output follows input order unless
+--unordered is given. Progress and throughput go to stderr. A failing record never stops
+the run; the exit status is 1 if any record failed.
+
+`compile` validates a JSON catalog (see herbal_catalog.validate_catalog; interaction
+conditions must parse too) and writes the versioned .hcat artifact with its precomputed
+indices, which HerbalFormulator loads without rebuilding anything. Every problem is
+reported on stderr with the plant it belongs to and nothing is written; the exit status
+is then 1. Links to plants missing from the catalog are errors unless
+--allow-missing-partners, which drops them with a warning.
+"""
+import argparse
+import hashlib
+import json
+import logging
+import os
+import sys
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from typing import Dict, Any, Iterable, Iterator, List, Optional, TextIO, Tuple
+
+from herbal_catalog import VERSION, CatalogError, encode_catalog, validate_catalog, write_columns
+from herbal_engine import HerbalFormulator, FormulaCache, compile_condition
+
+DEFAULT_DB = os.path.join(os.path.dirname(os.path.abspath(__file__)), "plants_db.json")
+
+# --- Worker side ---
+
+_engine = None
+
+def _init_worker(db_path: str, cache_size: int):
+    global _engine
+    logging.disable(logging.INFO)
+    _engine = HerbalFormulator(db_path, cache=FormulaCache(cache_size) if cache_size else None)
+
+def _result(line_no: int, profile: Dict[str, Any], formula: Optional[Dict[str, Any]] = None,
+            error: Optional[str] = None) -> Dict[str, Any]:
+    result = {"line": line_no}
+    if "id" in profile: result["id"] = profile["id"]
+    if error is None: result["formula"] = formula
+    else: result["error"] = error
+    return result
+
+def _formulate_chunk(chunk: List[Tuple[int, str]]) -> Tuple[List[str], int]:
+    """
+    Formulates one chunk of (line number, raw line). Every line yields exactly one output
+    line; returns them with the number of failed records.
+    """
+    results: List[Optional[Dict[str, Any]]] = [None] * len(chunk)
+    valid = []
+    for n, (line_no, text) in enumerate(chunk):
+        try:
+            profile = json.loads(text)
+        except json.JSONDecodeError as e:
+            results[n] = _result(line_no, {}, error=f"invalid JSON: {e}")
+            continue
+        if not isinstance(profile, dict):
+            results[n] = _result(line_no, {}, error="profile must be a JSON object")
+            continue
+        valid.append((n, profile))
+
+    try:
+        formulas = _engine.generate_formulas([p for _, p in valid])
+        for (n, profile), formula in zip(valid, formulas):
+            results[n] = _result(chunk[n][0], profile, formula)
+    except Exception:
+        # Isolate the failing record(s); the rest of the chunk still gets formulas
+        for n, profile in valid:
+            try:
+                results[n] = _result(chunk[n][0], profile, _engine.generate_formula(profile))
+            except Exception as e:
+                results[n] = _result(chunk[n][0], profile, error=f"{type(e).__name__}: {e}")
+    return [json.dumps(r) for r in results], sum("error" in r for r in results)
+
+# --- Driver ---
+
+def _chunks(lines: Iterable[str], size: int) -> Iterator[List[Tuple[int, str]]]:
+    chunk = []
+    for line_no, line in enumerate(lines, start=1):
+        if not line.strip(): continue
+        chunk.append((line_no, line))
+        if len(chunk) == size:
+            yield chunk
+            chunk = []
+    if chunk: yield chunk
+
+class _Progress:
+    def __init__(self, stream: Optional[TextIO], interval: float):
+        self.stream = stream
+        self.interval = interval
+        self.start = self.last = time.perf_counter()
+        self.records = 0
+        self.errors = 0
+
+    def add(self, records: int, errors: int):
+        self.records += records
+        self.errors += errors
+        now = time.perf_counter()
+        if self.stream and self.interval and now - self.last >= self.interval:
+            self.last = now
+            self.report("progress")
+
+    def report(self, label: str):
+        elapsed = time.perf_counter() - self.start
+        rate = self.records / elapsed if elapsed > 0 else 0.0
+        print(f"{label}: {self.records} records, {self.errors} errors, {elapsed:.1f}s, {rate:,.0f} records/s",
+              file=self.stream, flush=True)
+
+def run_batch(lines: Iterable[str], out: TextIO, db_path: str = DEFAULT_DB, workers: int = 0,
+              ordered: bool = True, chunk_size: int = 256, cache_size: int = 4096,
+              progress: Optional[TextIO] = sys.stderr, interval: float = 2.0) -> Tuple[int, int]:
+    """Streams formulas for `lines` to `out`; returns (records, failed records)."""
+    workers = workers or os.cpu_count() or 1
+    window = workers * 4 # Chunks in flight; bounds memory to window * chunk_size records
+    tracker = _Progress(progress, interval)
+    chunks = _chunks(lines, chunk_size)
+
+    def emit(result: Tuple[List[str], int]):
+        rendered, errors = result
+        for line in rendered: out.write(line + "\n")
+        tracker.add(len(rendered), errors)
+
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(db_path, cache_size)) as pool:
+        inflight = deque() if ordered else set()
+        for chunk in chunks:
+            if len(inflight) >= window:
+                if ordered:
+                    emit(inflight.popleft().result())
+                else:
+                    done, inflight = wait(inflight, return_when=FIRST_COMPLETED)
+                    for future in done: emit(future.result())
+            future = pool.submit(_formulate_chunk, chunk)
+            if ordered: inflight.append(future)
+            else: inflight.add(future)
+        if ordered:
+            while inflight: emit(inflight.popleft().result())
+        else:
+            while inflight:
+                done, inflight = wait(inflight, return_when=FIRST_COMPLETED)
+                for future in done: emit(future.result())
+    out.flush()
+    if progress: tracker.report("done")
+    return tracker.records, tracker.errors
+
+# --- Catalog compiler ---
+
+def run_compile(db_path: str, out: Optional[str] = None, allow_missing_partners: bool = False,
+                log: TextIO = sys.stderr) -> int:
+    """Validates db_path and writes its .hcat artifact (default: next to it); returns the exit status."""
+    out = out or os.path.splitext(db_path)[0] + ".hcat"
+    try:
+        with open(db_path, 'rb') as f:
+            raw = f.read()
+        records = json.loads(raw.decode('utf-8'))
+        dropped = validate_catalog(records, allow_missing_partners)
+        cols = encode_catalog(records, hashlib.sha256(raw).hexdigest())
+        problems = []
+        for text, source in zip(cols.expressions, cols.expression_sources):
+            try:
+                compile_condition(text)
+            except ValueError as e:
+                problems.append(f"{source}: {e}")
+        if problems: raise CatalogError(problems)
+    except (OSError, UnicodeDecodeError, json.JSONDecodeError, CatalogError) as e:
+        print(f"{db_path}: {e}", file=log)
+        return 1
+    for problem in dropped: print(f"warning: {problem} (link dropped)", file=log)
+    write_columns(cols, out)
+    print(f"{db_path} -> {out}: {cols.count} plants, {len(cols.rule_plant)} rules, "
+          f"{len(cols.syn_src) + len(cols.ant_src)} links, format v{VERSION}, catalog {cols.source_hash[:12]}", file=log)
+    return 0
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(prog="herbal", description="Herbal formulation tools.")
+    commands = parser.add_subparsers(dest="command", required=True)
+    batch = commands.add_parser("batch", help="formulate JSONL profiles to JSONL formulas")
+    batch.add_argument("input", nargs="?", default="-", help="JSONL file of profiles (default: stdin)")
+    batch.add_argument("--db", default=DEFAULT_DB)
+    batch.add_argument("--workers", type=int, default=0, help="worker processes (default: one per CPU)")
+    batch.add_argument("--unordered", action="store_true", help="emit results as they complete")
+    batch.add_argument("--chunk", type=int, default=256, help="profiles per worker task")
+    batch.add_argument("--cache-size", type=int, default=4096, help="per-worker FormulaCache entries (0 disables)")
+    batch.add_argument("--progress", type=float, default=2.0, help="seconds between stderr progress lines (0: summary only)")
+    batch.add_argument("--quiet", action="store_true", help="no stderr progress or summary")
+    compile_cmd = commands.add_parser("compile", help="validate a JSON catalog and write its .hcat artifact")
+    compile_cmd.add_argument("db", help="plants_db.json to compile")
+    compile_cmd.add_argument("--out", help="artifact path (default: the catalog path with .hcat)")
+    compile_cmd.add_argument("--allow-missing-partners", action="store_true",
+                             help="drop synergy/antagonism links to plants not in the catalog instead of failing")
+    args = parser.parse_args(argv)
+    if args.command == "compile": return run_compile(args.db, args.out, args.allow_missing_partners)
+
+    source = sys.stdin if args.input == "-" else open(args.input, "r", encoding="utf-8")
+    try:
+        _, errors = run_batch(source, sys.stdout, db_path=args.db, workers=args.workers, ordered=not args.unordered,
+                              chunk_size=args.chunk, cache_size=args.cache_size,
+                              progress=None if args.quiet else sys.stderr, interval=args.progress)
+    finally:
+        if source is not sys.stdin: source.close()
+    return 1 if errors else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,370 @@
+"""
+Columnar catalog encoding and the compact binary catalog format (.hcat).
+
+A catalog is compiled in two steps. validate_catalog checks the records (required fields,
+unique ids, valid roles and rule actions, 0 <= min_percent <= max_percent <= 100, numeric
+weights, consistent family caps, synergy/antagonism partners that exist) and raises a
+CatalogError listing every problem with the plant it belongs to. encode_catalog then turns
+them into integer-coded columns: plant ids/roles/families/axes become small integers into
+string tables, scores a dense plants x axes matrix, conditional rules and synergy/antagonism
+links flat arrays. The indices HerbalFormulator serves from are precomputed here too (role
+partitions, the condition index order, the interaction CSR row pointers, the family cap
+table, the exclusion bit matrix), so loading a compiled .hcat file does no derivation work.
+The full per-plant record is kept as a compact JSON blob and only decoded when a Plant
+view's nested fields are read.
+
+    python herbal.py compile plants_db.json --out plants_db.hcat
+
+File layout (little endian):
+
+    b"HCAT" | u16 version | u32 header length | header JSON | pad to 8 | array sections
+
+The header carries the string tables, the source JSON hash and, for every array, its
+dtype, shape and offset. Arrays are read with np.frombuffer over an mmap, so opening a
+catalog costs O(string tables) regardless of how many plants it holds.
+"""
+import hashlib
+import json
+import logging
+import mmap
+import struct
+from typing import List, Dict, Any, Optional, Tuple
+
+import numpy as np
+
+MAGIC = b"HCAT"
+VERSION = 4
+_PREAMBLE = struct.Struct("<4sHI")
+_ALIGN = 8
+
+ROLES = ('primary', 'secondary', 'support')
+RULE_ACTIONS = ('exclude', 'cap_percent', 'set_role', 'caution')
+ANTAGONISM_ACTIONS = ('penalize', 'exclude')
+REQUIRED = ('id', 'name', 'family_functional', 'role', 'min_percent', 'max_percent')
+
+def is_binary_catalog(path: str) -> bool:
+    with open(path, 'rb') as f:
+        return f.read(len(MAGIC)) == MAGIC
+
+class _Table:
+    """Append-only string (or JSON value) table assigning consecutive integer codes."""
+
+    def __init__(self):
+        self.codes = {}
+        self.values = []
+
+    def code(self, value: str) -> int:
+        code = self.codes.get(value)
+        if code is None:
+            code = self.codes[value] = len(self.values)
+            self.values.append(value)
+        return code
+
+class CatalogColumns:
+    """
+    Integer-coded, column-oriented view of a catalog.
+
+    Plant columns: ids, names, role_codes/roles, family_codes/families, min_percent,
+    max_percent (plus min/max_percent_literal, codes into values that keep the declared
+    int/float type for output), axes, scores, detail_offsets/detail_blob (compact record JSON).
+    family_caps holds one global_family_limit max_sum per family code (inf if none is
+    declared), plant_caps each plant's static constraints.cap (inf if none), max_bonus each plant's synergy bonus upper bound (both link directions,
+    conditions ignored) and role_order/role_bounds the plants of each role code
+    (role_order[role_bounds[r]:role_bounds[r + 1]], in catalog order). Rule columns (one row
+    per constraints['conditions'] entry, in
+    catalog then declaration order): rule_plant, rule_pos, rule_condition/conditions,
+    rule_action/actions, rule_extra/values (JSON of the remaining rule keys), with
+    rule_order/rule_bounds grouping them per condition code and exclusion_bits the plants x
+    condition words bit matrix of exclude rules. Link columns with prefix syn_/ant_: src,
+    dst, weight (code into values), cond (code into expressions, -1 if none), for
+    antagonisms action, and indptr (CSR row pointers by source plant). Links whose partner is
+    not in the catalog are dropped; their conditions stay in `expressions` so they are still
+    validated.
+    """
+    ARRAYS = (
+        'role_codes', 'role_order', 'role_bounds', 'family_codes', 'family_caps', 'plant_caps',
+        'min_percent', 'max_percent', 'min_percent_literal', 'max_percent_literal', 'scores', 'max_bonus',
+        'rule_plant', 'rule_pos', 'rule_condition', 'rule_action', 'rule_extra', 'rule_order', 'rule_bounds',
+        'exclusion_bits',
+        'syn_src', 'syn_dst', 'syn_weight', 'syn_cond', 'syn_indptr',
+        'ant_src', 'ant_dst', 'ant_weight', 'ant_action', 'ant_cond', 'ant_indptr',
+        'detail_offsets', 'detail_blob',
+    )
+    TABLES = ('ids', 'names', 'roles', 'families', 'axes', 'conditions', 'actions', 'values',
+              'expressions', 'expression_sources')
+
+    def __init__(self, count: int, source_hash: str):
+        self.count = count
+        self.source_hash = source_hash
+        self._mmap = None
+
+    def record(self, i: int) -> Dict[str, Any]:
+        """The full source record of plant i, decoded from the detail blob."""
+        start, end = int(self.detail_offsets[i]), int(self.detail_offsets[i + 1])
+        return json.loads(bytes(self.detail_blob[start:end]).decode('utf-8'))
+
+class CatalogError(ValueError):
+    """A catalog that failed validation; `problems` lists every violation found."""
+
+    def __init__(self, problems: List[str]):
+        self.problems = problems
+        super().__init__(f"{len(problems)} catalog problem(s):\n  " + "\n  ".join(problems))
+
+def _number(value: Any) -> bool:
+    return isinstance(value, (int, float)) and not isinstance(value, bool)
+
+def validate_catalog(records: Any, allow_missing_partners: bool = False) -> List[str]:
+    """
+    Checks parsed plants_db.json records and raises CatalogError naming every problem.
+    Synergy/antagonism partners missing from the catalog are problems too unless
+    allow_missing_partners, in which case they are returned (and later dropped by the encoder).
+    """
+    if not isinstance(records, list): raise CatalogError(["catalog must be a JSON list of plant objects"])
+    problems, missing = [], []
+    ids = {}
+    for n, r in enumerate(records):
+        if isinstance(r, dict) and isinstance(r.get('id'), str) and r['id']:
+            if r['id'] in ids: problems.append(f"plant '{r['id']}': duplicate id (also record #{ids[r['id']]})")
+            else: ids[r['id']] = n
+    for n, r in enumerate(records):
+        if not isinstance(r, dict):
+            problems.append(f"record #{n}: not an object")
+            continue
+        where = f"plant '{r['id']}'" if isinstance(r.get('id'), str) and r['id'] else f"record #{n}"
+        absent = [key for key in REQUIRED if key not in r]
+        if absent: problems.append(f"{where}: missing {', '.join(absent)}")
+        for key in ('id', 'name', 'family_functional'):
+            if key in r and not (isinstance(r[key], str) and r[key]): problems.append(f"{where}: {key} must be a non-empty string")
+        if 'role' in r and r['role'] not in ROLES:
+            problems.append(f"{where}: role {r['role']!r} is not one of {', '.join(ROLES)}")
+        low, high = r.get('min_percent'), r.get('max_percent')
+        for key, value in (('min_percent', low), ('max_percent', high)):
+            if key in r and not (_number(value) and 0 <= value <= 100):
+                problems.append(f"{where}: {key} {value!r} is not a number in [0, 100]")
+        if _number(low) and _number(high) and low > high:
+            problems.append(f"{where}: min_percent {low} is above max_percent {high}")
+        scores = r.get('scores', {})
+        if not isinstance(scores, dict) or not all(_number(v) for v in scores.values()):
+            problems.append(f"{where}: scores must map axes to numbers")
+
+        constraints = r.get('constraints', {})
+        if not isinstance(constraints, dict):
+            problems.append(f"{where}: constraints must be an object")
+            constraints = {}
+        if 'cap' in constraints and not _number(constraints['cap']):
+            problems.append(f"{where}: constraints.cap {constraints['cap']!r} is not a number")
+        limit = constraints.get('global_family_limit')
+        if limit is not None and not (isinstance(limit, dict) and _number(limit.get('max_sum', 100))):
+            problems.append(f"{where}: global_family_limit needs a numeric max_sum")
+        rules = constraints.get('conditions', [])
+        for pos, rule in enumerate(rules if isinstance(rules, list) else [None]):
+            at = f"{where}: constraints.conditions[{pos}]"
+            if not isinstance(rule, dict) or not isinstance(rule.get('condition'), str):
+                problems.append(f"{at}: needs a condition key")
+                continue
+            action = rule.get('action')
+            if action not in RULE_ACTIONS:
+                problems.append(f"{at}: action {action!r} is not one of {', '.join(RULE_ACTIONS)}")
+            elif action == 'set_role' and rule.get('value') not in ROLES:
+                problems.append(f"{at}: set_role value {rule.get('value')!r} is not one of {', '.join(ROLES)}")
+            elif action == 'cap_percent' and not all(_number(rule.get(k, 0)) for k in ('value', 'min_value')):
+                problems.append(f"{at}: cap_percent value and min_value must be numbers")
+
+        for attr, weight_key in (('synergies', 'bonus'), ('antagonisms', 'penalty')):
+            links = r.get(attr, [])
+            for pos, link in enumerate(links if isinstance(links, list) else [None]):
+                at = f"{where}: {attr}[{pos}]"
+                if not isinstance(link, dict) or not isinstance(link.get('with'), str):
+                    problems.append(f"{at}: needs a partner id in 'with'")
+                    continue
+                partner = link['with']
+                if partner == r.get('id'): problems.append(f"{at}: links the plant to itself")
+                elif partner not in ids:
+                    (missing if allow_missing_partners else problems).append(f"{at}: partner '{partner}' is not in the catalog")
+                if not _number(link.get(weight_key, 0)): problems.append(f"{at}: {weight_key} must be a number")
+                if attr == 'antagonisms' and link.get('action', 'penalize') not in ANTAGONISM_ACTIONS:
+                    problems.append(f"{at}: action {link.get('action')!r} is not one of {', '.join(ANTAGONISM_ACTIONS)}")
+                if 'condition' in link and not isinstance(link['condition'], str):
+                    problems.append(f"{at}: condition must be an expression string")
+    if not problems:
+        try:
+            _family_caps(records, _Table())
+        except ValueError as e:
+            problems.append(str(e))
+    if problems: raise CatalogError(problems)
+    return missing
+
+def compile_catalog(records: Any, source_hash: str, allow_missing_partners: bool = False) -> 'CatalogColumns':
+    """
+    validate_catalog then encode_catalog. Runs on every engine load, so dropped links to
+    missing partners are only counted (at DEBUG); `herbal.py compile` lists them as warnings.
+    """
+    dropped = validate_catalog(records, allow_missing_partners)
+    if dropped: logging.debug("%d link(s) to plants missing from the catalog dropped", len(dropped))
+    return encode_catalog(records, source_hash)
+
+def _family_caps(records: List[Dict[str, Any]], families: _Table) -> Dict[int, Tuple[float, str]]:
+    """
+    Family code -> (max_sum, declaring plant id) from every plant's global_family_limit
+    (the rule's "family", defaulting to the plant's own). A family declared with two
+    different caps is ambiguous and rejected.
+    """
+    caps = {}
+    for r in records:
+        rule = r.get('constraints', {}).get('global_family_limit')
+        if not rule: continue
+        family = rule.get('family', r['family_functional'])
+        cap = float(rule.get('max_sum', 100))
+        code = families.code(family)
+        known = caps.setdefault(code, (cap, r['id']))
+        if known[0] != cap:
+            raise ValueError(f"Family '{family}' has conflicting global_family_limit max_sum: {known[0]:g} "
+                             f"(plant '{known[1]}') and {cap:g} (plant '{r['id']}')")
+    return caps
+
+def encode_catalog(records: List[Dict[str, Any]], source_hash: str) -> CatalogColumns:
+    """Encodes parsed plants_db.json records into columns. The records are not retained."""
+    n = len(records)
+    cols = CatalogColumns(n, source_hash)
+    index = {r['id']: i for i, r in enumerate(records)}
+    roles, families, conditions, actions, values, expressions = (_Table() for _ in range(6))
+    sources = {}
+
+    cols.ids = [r['id'] for r in records]
+    cols.names = [r['name'] for r in records]
+    cols.role_codes = np.array([roles.code(r['role']) for r in records], dtype=np.int8)
+    cols.family_codes = np.array([families.code(r['family_functional']) for r in records], dtype=np.int32)
+    caps = _family_caps(records, families)
+    cols.plant_caps = np.array([r.get('constraints', {}).get('cap', np.inf) for r in records], dtype=np.float64)
+    cols.min_percent = np.array([r['min_percent'] for r in records], dtype=np.float64)
+    cols.max_percent = np.array([r['max_percent'] for r in records], dtype=np.float64)
+    cols.min_percent_literal = np.array([values.code(json.dumps(r['min_percent'])) for r in records], dtype=np.int32)
+    cols.max_percent_literal = np.array([values.code(json.dumps(r['max_percent'])) for r in records], dtype=np.int32)
+
+    cols.axes = sorted({axis for r in records for axis in r.get('scores', {})})
+    axis_index = {axis: j for j, axis in enumerate(cols.axes)}
+    cols.scores = np.zeros((n, len(cols.axes)), dtype=np.float64)
+    for i, r in enumerate(records):
+        for axis, value in r.get('scores', {}).items():
+            cols.scores[i, axis_index[axis]] = value
+
+    rules = []
+    for i, r in enumerate(records):
+        for pos, rule in enumerate(r.get('constraints', {}).get('conditions', [])):
+            extra = {k: v for k, v in rule.items() if k not in ('condition', 'action')}
+            rules.append((i, pos, conditions.code(rule.get('condition')), actions.code(rule.get('action')),
+                          values.code(json.dumps(extra, sort_keys=True))))
+    rule_cols = list(zip(*rules)) or [()] * 5
+    for name, column in zip(('rule_plant', 'rule_pos', 'rule_condition', 'rule_action', 'rule_extra'), rule_cols):
+        setattr(cols, name, np.array(column, dtype=np.int32))
+
+    for prefix, attr, kind in (('syn', 'synergies', 'synergy'), ('ant', 'antagonisms', 'antagonism')):
+        links = []
+        for i, r in enumerate(records):
+            for link in r.get(attr, []):
+                condition = link.get('condition')
+                cond = -1
+                if condition:
+                    cond = expressions.code(condition)
+                    sources.setdefault(cond, f"Plant '{r['id']}' {kind} with '{link.get('with')}'")
+                j = index.get(link.get('with'))
+                if j is None: continue
+                if kind == 'synergy':
+                    weight, action = link.get('bonus', 0), 'bonus'
+                else:
+                    weight, action = link.get('penalty', 0), link.get('action', 'penalize')
+                links.append((i, j, values.code(json.dumps(weight)), cond, actions.code(action)))
+        link_cols = list(zip(*links)) or [()] * 5
+        for name, column in zip(('src', 'dst', 'weight', 'cond', 'action'), link_cols):
+            if prefix == 'syn' and name == 'action': continue
+            setattr(cols, f"{prefix}_{name}", np.array(column, dtype=np.int32))
+
+    blobs = [json.dumps(r, separators=(',', ':')).encode('utf-8') for r in records]
+    cols.detail_offsets = np.cumsum([0] + [len(b) for b in blobs], dtype=np.uint64)
+    cols.detail_blob = np.frombuffer(b"".join(blobs), dtype=np.uint8)
+
+    cols.family_caps = np.full(len(families.values), np.inf)
+    for code, (cap, _) in caps.items(): cols.family_caps[code] = cap
+    cols.roles, cols.families, cols.conditions = roles.values, families.values, conditions.values
+    cols.actions, cols.values, cols.expressions = actions.values, values.values, expressions.values
+    cols.expression_sources = [sources[c] for c in range(len(expressions.values))]
+    _index_columns(cols)
+    return cols
+
+def _index_columns(cols: CatalogColumns):
+    """The serving indices derived from the base columns, computed once per compile."""
+    cols.role_order = np.argsort(cols.role_codes, kind='stable').astype(np.int32)
+    cols.role_bounds = np.searchsorted(cols.role_codes[cols.role_order], np.arange(len(cols.roles) + 1)).astype(np.int32)
+    cols.rule_order = np.argsort(cols.rule_condition, kind='stable').astype(np.int32)
+    cols.rule_bounds = np.searchsorted(cols.rule_condition[cols.rule_order],
+                                       np.arange(len(cols.conditions) + 1)).astype(np.int32)
+    for prefix in ('syn', 'ant'):
+        src = getattr(cols, f"{prefix}_src")
+        setattr(cols, f"{prefix}_indptr", np.searchsorted(src, np.arange(cols.count + 1)).astype(np.int64))
+
+    cols.max_bonus = np.zeros(cols.count)
+    if len(cols.syn_weight):
+        codes, inverse = np.unique(cols.syn_weight, return_inverse=True)
+        weights = np.array([float(json.loads(cols.values[c])) for c in codes.tolist()])[inverse]
+        np.add.at(cols.max_bonus, cols.syn_src, weights)
+        np.add.at(cols.max_bonus, cols.syn_dst, weights)
+
+    # Bit c of row i: plant i has an exclude rule on condition code c
+    cols.exclusion_bits = np.zeros((cols.count, max(1, -(-len(cols.conditions) // 64))), dtype=np.uint64)
+    if 'exclude' in cols.actions:
+        rows = np.flatnonzero(cols.rule_action == cols.actions.index('exclude'))
+        conditions = cols.rule_condition[rows].astype(np.int64)
+        np.bitwise_or.at(cols.exclusion_bits, (cols.rule_plant[rows].astype(np.int64), conditions // 64),
+                         np.left_shift(np.uint64(1), (conditions % 64).astype(np.uint64)))
+
+def write_catalog(records: List[Dict[str, Any]], path: str, source_hash: Optional[str] = None,
+                  allow_missing_partners: bool = True):
+    """
+    Compiles records (see compile_catalog) into a .hcat file. source_hash defaults to the
+    hash of their JSON dump.
+    """
+    if source_hash is None:
+        source_hash = hashlib.sha256(json.dumps(records, indent=4).encode('utf-8')).hexdigest()
+    write_columns(compile_catalog(records, source_hash, allow_missing_partners), path)
+
+def write_columns(cols: CatalogColumns, path: str):
+    """Writes compiled columns as a .hcat file."""
+    arrays = {}
+    sections = []
+    offset = 0
+    for name in CatalogColumns.ARRAYS:
+        array = np.ascontiguousarray(getattr(cols, name))
+        array = array.astype(array.dtype.newbyteorder('<'), copy=False)
+        arrays[name] = {"dtype": array.dtype.str, "shape": list(array.shape), "offset": offset}
+        data = array.tobytes()
+        sections.append(data + b"\0" * (-len(data) % _ALIGN))
+        offset += len(sections[-1])
+
+    header = {"count": cols.count, "source_hash": cols.source_hash, "arrays": arrays}
+    header.update({name: getattr(cols, name) for name in CatalogColumns.TABLES})
+    header_bytes = json.dumps(header, separators=(',', ':')).encode('utf-8')
+    header_bytes += b" " * (-(_PREAMBLE.size + len(header_bytes)) % _ALIGN)
+    with open(path, 'wb') as f:
+        f.write(_PREAMBLE.pack(MAGIC, VERSION, len(header_bytes)))
+        f.write(header_bytes)
+        for data in sections: f.write(data)
+
+def read_catalog(path: str) -> CatalogColumns:
+    """Memory-maps a .hcat file. Arrays are read-only views into the mapping."""
+    with open(path, 'rb') as f:
+        mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    magic, version, header_len = _PREAMBLE.unpack_from(mapped, 0)
+    if magic != MAGIC or version != VERSION:
+        raise ValueError(f"{path}: not a v{VERSION} binary catalog")
+    header = json.loads(mapped[_PREAMBLE.size:_PREAMBLE.size + header_len].decode('utf-8'))
+    base = _PREAMBLE.size + header_len
+
+    cols = CatalogColumns(header['count'], header['source_hash'])
+    cols._mmap = mapped
+    for name in CatalogColumns.TABLES: setattr(cols, name, header[name])
+    for name, spec in header['arrays'].items():
+        dtype = np.dtype(spec['dtype'])
+        count = int(np.prod(spec['shape'])) if spec['shape'] else 1
+        array = np.frombuffer(mapped, dtype=dtype, count=count, offset=base + spec['offset'])
+        setattr(cols, name, array.reshape(spec['shape']))
+    return cols
@@ -0,0 +1,138 @@
+"""
+Dosage solver for HerbalFormulator.
+
+The percentages of a formula are the Euclidean projection of its role targets onto
+
+    lo_i <= x_i <= hi_i,    sum of x_i over family F <= cap_F,    sum of x_i = total
+
+that is, the doses meeting every bound and family cap that stay closest to the targets.
+By the KKT conditions x_i = clip(t_i - shift - mu_F(i), lo_i, hi_i): one shift for the
+total and a multiplier mu_F >= 0 per family, non-zero only while the family sits at its
+cap. For a given shift, each family's multiplier is the root of a piecewise linear
+function and is found exactly from its breakpoints. The shift is found by safeguarded
+Newton steps on the total, whose slope is minus the number of plants strictly inside their
+bounds in uncapped families, so a handful of plants converges in a few steps; starting
+from the previous solve's shift (a DosageSolver keeps it) usually takes one.
+
+If the upper bounds cannot reach the total, every family is filled to what it can hold
+and the result is marked SHORT. An empty selection has nothing to fill and is marked
+EMPTY. Lower bounds that cannot be met (a minimum above its
+maximum, a family's minimums above its cap, all minimums above the total) make the
+problem infeasible and solve() raises DosageInfeasible naming the violated constraint.
+"""
+from typing import Any, Callable, Dict, List, NamedTuple, Optional, Sequence
+
+OPTIMAL = "optimal" # Sums to the total
+SHORT = "short" # Upper bounds and caps hold less than the total; every family is full
+INFEASIBLE = "infeasible" # Set by callers that fall back after DosageInfeasible
+EMPTY = "empty" # No components: nothing to dose
+
+class DosageInfeasible(ValueError):
+    pass
+
+class Dosage(NamedTuple):
+    percents: List[float]
+    status: str # OPTIMAL, SHORT or EMPTY
+
+def _shift_root(a: Sequence[float], lo: Sequence[float], hi: Sequence[float], target: float) -> float:
+    """s with sum(clip(a_i - s, lo_i, hi_i)) == target, for target in [sum(lo), sum(hi)]."""
+    s = (sum(a) - target) / len(a)
+    if all(l <= x - s <= h for x, l, h in zip(a, lo, hi)): return s # Nobody at a bound
+    points = sorted({x - h for x, h in zip(a, hi)} | {x - l for x, l in zip(a, lo)})
+    prev_s = prev_f = None
+    for s in points:
+        f = sum(l if x - s < l else h if x - s > h else x - s for x, l, h in zip(a, lo, hi))
+        if f <= target:
+            if prev_s is None or prev_f == f: return s
+            # Linear between consecutive breakpoints
+            return prev_s + (prev_f - target) * (s - prev_s) / (prev_f - f)
+        prev_s, prev_f = s, f
+    return points[-1]
+
+class DosageSolver:
+    """Reusable across the formulas of a batch: each solve starts from the previous shift."""
+    MAX_STEPS = 64
+    TOL = 1e-9
+
+    def __init__(self):
+        self.shift: Optional[float] = None
+        self.solves = 0
+        self.steps = 0 # Newton or bisection steps over all solves
+
+    def solve(self, targets: Sequence[float], lo: Sequence[float], hi: Sequence[float], families: Sequence[Any],
+              caps: Dict[Any, float], total: float = 100.0, names: Optional[Callable[[int], str]] = None) -> Dosage:
+        """
+        Projects `targets` onto the bounds, the family caps (families[i] is plant i's family,
+        caps maps a family to its maximum sum; missing means uncapped) and the total.
+        names(i) names component i in a DosageInfeasible message; it is only called to raise one.
+        """
+        n = len(targets)
+        groups: Dict[Any, List[int]] = {}
+        for i, family in enumerate(families): groups.setdefault(family, []).append(i)
+
+        floor = capacity = 0.0
+        for i in range(n):
+            if lo[i] > hi[i] + self.TOL:
+                name = names(i) if names else f"component {i}"
+                raise DosageInfeasible(f"{name}: minimum {lo[i]}% is above its maximum {hi[i]}%")
+        for family, members in groups.items():
+            cap = caps.get(family, float('inf'))
+            low = sum(lo[i] for i in members)
+            if low > cap + self.TOL:
+                raise DosageInfeasible(f"family {family}: minimums sum to {low}%, above its {cap}% cap")
+            floor += low
+            capacity += min(cap, sum(hi[i] for i in members))
+        if floor > total + self.TOL:
+            raise DosageInfeasible(f"minimums sum to {floor}%, above the {total}% total")
+        status = OPTIMAL
+        if capacity < total - self.TOL: total, status = capacity, SHORT
+        self.solves += 1
+        if n == 0: return Dosage([], EMPTY)
+        tol = self.TOL
+        blocks = [(members, caps.get(family)) for family, members in groups.items()]
+
+        def evaluate(shift: float):
+            """Doses at `shift`, their gap to the total and the exact shift for the current active set."""
+            x = [0.0] * n
+            free, free_targets, rest = 0, 0.0, total
+            for members, cap in blocks:
+                part = []
+                for i in members:
+                    v = targets[i] - shift
+                    part.append(lo[i] if v < lo[i] else hi[i] if v > hi[i] else v)
+                if cap is not None and sum(part) > cap + tol:
+                    a = [targets[i] - shift for i in members]
+                    mu = _shift_root(a, [lo[i] for i in members], [hi[i] for i in members], cap)
+                    part = [lo[i] if v - mu < lo[i] else hi[i] if v - mu > hi[i] else v - mu for v, i in zip(a, members)]
+                    rest -= cap # A family at its cap sums to it whatever the shift
+                else:
+                    for v, i in zip(part, members):
+                        if lo[i] < v < hi[i]:
+                            free += 1
+                            free_targets += targets[i]
+                        else:
+                            rest -= v
+                for i, v in zip(members, part): x[i] = v
+            # Free plants sit at t_i - shift, so this shift closes the gap exactly if nothing changes bound
+            return x, sum(x) - total, (free_targets - rest) / free if free else None
+
+        # Below `left` every plant sits at its maximum, above `right` at its minimum
+        left = min(t - h for t, h in zip(targets, hi)) - 1.0
+        right = max(t - l for t, l in zip(targets, lo)) + 1.0
+        shift = self.shift if self.shift is not None and left < self.shift < right else (sum(targets) - total) / n
+        exact = False
+        for _ in range(self.MAX_STEPS):
+            self.steps += 1
+            x, gap, step = evaluate(shift)
+            if abs(gap) <= tol:
+                # Finish on a shift derived from the active set, so warm and cold starts agree to the bit
+                if exact or step is None or step == shift: break
+                shift, exact = step, True
+                continue
+            if gap > 0: left = shift
+            else: right = shift
+            # Newton on the piecewise linear total; bisect when the step leaves the bracket (or it is flat)
+            exact = step is not None and left < step < right
+            shift = step if exact else (left + right) / 2
+        self.shift = shift
+        return Dosage([float(v) for v in x], status)
@@ -1,37 +1,130 @@
 
+import hashlib
+import heapq
 import json
 import logging
-from dataclasses import dataclass, field
-from typing import List, Dict, Any, Optional
+import operator
+import os
+import re
+import threading
+import time
+import numpy as np
+from collections import OrderedDict
+from collections.abc import Mapping as MappingABC, Sequence as SequenceABC
+from dataclasses import FrozenInstanceError, dataclass, field, fields
+from itertools import groupby
+from typing import List, Dict, Any, Optional, Mapping, Sequence, Set, Tuple, Callable, NamedTuple, Union
+from herbal_catalog import ROLES, CatalogColumns, compile_catalog, is_binary_catalog, read_catalog
+from herbal_dosing import DosageInfeasible, DosageSolver, INFEASIBLE
+from herbal_metrics import MetricsRecorder, Probe
 
 # --- Configuration ---
 logging.basicConfig(level=logging.INFO, format='%(levelname)s: %(message)s')
 
 # --- Data Structures ---
 
-@dataclass
+def _column_field(column: str):
+    return property(lambda self: getattr(self._table, column)[self._index])
+
+def _detail_field(key: str, default: Callable):
+    return property(lambda self: self._table.detail(self._index).get(key, default()))
+
 class Plant:
-    id: str
-    name: str
-    family_botanical: str
-    family_functional: str
-    role: str # 'primary', 'secondary', 'support'
-    min_percent: float
-    max_percent: float
-    constraints: Dict[str, Any] = field(default_factory=dict)
-    scores: Dict[str, int] = field(default_factory=dict)
-    synergies: List[Dict[str, Any]] = field(default_factory=list)
-    antagonisms: List[Dict[str, Any]] = field(default_factory=list)
+    """
+    Read-only view of one catalog plant: row `index` of a PlantTable. Identity and dosing
+    fields are read from the table's columns; the nested rule/score/interaction fields are
+    decoded from the plant's source record on first access.
+    """
+    __slots__ = ('_table', '_index')
+    FIELDS = ('id', 'name', 'family_botanical', 'family_functional', 'role', 'min_percent', 'max_percent',
+              'constraints', 'scores', 'synergies', 'antagonisms', 'family', 'attributes')
+
+    def __init__(self, table: 'PlantTable', index: int):
+        object.__setattr__(self, '_table', table)
+        object.__setattr__(self, '_index', index)
+
+    id = _column_field('ids')
+    name = _column_field('names')
+    family_botanical = _detail_field('family_botanical', str)
+    family_functional = _column_field('family_names')
+    role = _column_field('role_names') # 'primary', 'secondary', 'support'
+    min_percent = _column_field('min_percent_values')
+    max_percent = _column_field('max_percent_values')
+    constraints = _detail_field('constraints', dict)
+    scores = _detail_field('scores', dict)
+    synergies = _detail_field('synergies', list)
+    antagonisms = _detail_field('antagonisms', list)
     # Compatibility fields for MVP JSON
-    family: str = ""
-    attributes: List[str] = field(default_factory=list)
-    
-    # Dynamic runtime properties
+    family = _detail_field('family', str)
+    attributes = _detail_field('attributes', list)
+
+    def __setattr__(self, name, value):
+        raise FrozenInstanceError(f"cannot assign to field '{name}'")
+
+    def __delattr__(self, name):
+        raise FrozenInstanceError(f"cannot delete field '{name}'")
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {name: getattr(self, name) for name in self.FIELDS}
+
+    def __eq__(self, other):
+        if not isinstance(other, Plant): return NotImplemented
+        return self.to_dict() == other.to_dict()
+
+    __hash__ = None # Like the former frozen dataclass: its dict fields made it unhashable
+
+    def __repr__(self):
+        return f"Plant(id={self.id!r}, name={self.name!r}, role={self.role!r})"
+
+class TraceEvent(NamedTuple):
+    """One decision the pipeline made about a plant; rendered to text only on request (explain=True)."""
+    kind: str # 'exclude', 'cap', 'role', 'synergy', 'penalty' or 'antagonism' (exclusion)
+    plant: Union[int, str] # Catalog index; the plant id once decoded (decode_event)
+    partner: Union[int, str, None] = None # Interaction partner, like plant
+    delta: Optional[float] = None # Relevance change (synergy bonus, antagonism penalty)
+    condition: Optional[str] = None # Condition key or expression that triggered the rule
+    value: Any = None # Cap percent or new role
+
+_EVENT_TEXT = {
+    'exclude': lambda e: f"Excluded due to {e.condition}",
+    'cap': lambda e: f"Capped at {e.value}% via {e.condition}",
+    'role': lambda e: f"Shifted to {e.value} via {e.condition}",
+    'synergy': lambda e: f"Synergy bonus +{e.delta}",
+    'penalty': lambda e: f"Penalty -{-e.delta} (antagonism with {e.partner})",
+    'antagonism': lambda e: f"Antagonism with {e.partner}",
+}
+
+def render_event(event: Sequence) -> str:
+    """Text of a decoded TraceEvent (or the plain list it is stored as in a FormulaTable)."""
+    event = TraceEvent._make(event)
+    return _EVENT_TEXT[event.kind](event)
+
+def decode_event(event: Sequence, ids: Sequence[str]) -> TraceEvent:
+    """The event with its plant and partner catalog indices replaced by the plant ids."""
+    event = TraceEvent._make(event)
+    return event._replace(plant=ids[event.plant], partner=None if event.partner is None else ids[event.partner])
+
+_PRIMARY, _SECONDARY = ROLES.index('primary'), ROLES.index('secondary') # Role codes with their own dose targets
+
+@dataclass
+class PlantState:
+    """Per-request evaluation state of a catalog plant. The Plant itself is never mutated."""
+    plant: Plant
+    index: int = -1 # Position in the catalog (HerbalFormulator.db)
     relevance_score: float = 0.0
-    final_role: str = "" # Can change (e.g. Primary -> Secondary)
+    final_role: int = -1 # Position in ROLES; can change (e.g. primary -> secondary)
     final_percent: float = 0.0
-    exclusion_reason: Optional[str] = None
-    adjustment_reason: Optional[str] = None
+    max_percent: float = 0.0 # Effective cap after conditional limits
+    min_percent: float = 0.0 # Effective minimum dose; a cap_percent rule lowers it to its min_value (or the cap)
+    exclusion: Optional[TraceEvent] = None # The 'exclude' or 'antagonism' event that removed the plant
+    # Where this plant's TraceEvents go; the states of one request share the request's list
+    trace: List[TraceEvent] = field(default_factory=list)
+
+    @property
+    def exclusion_reason(self) -> Optional[str]:
+        """Text of the exclusion, rendered on read: the pipeline itself only records the event."""
+        if self.exclusion is None: return None
+        return render_event(decode_event(self.exclusion, self.plant._table.ids))
 
 @dataclass
 class UserProfile:
@@ -40,117 +133,958 @@ class UserProfile:
     anxiety_level: int = 0
     insomnia_level: int = 0
     stress_level: int = 0
+    # Interned by HerbalFormulator._build_profile (see SymbolTable); empty on hand-built profiles
+    axes: Tuple[int, ...] = () # Sorted score-matrix columns of the known priorities, repeats kept
+    mask: int = 0 # Bit c set for each active condition of code c that some rule references
+
+# --- Condition Expressions ---
+
+_COMPARATORS = {
+    '>=': operator.ge, '>': operator.gt, '<=': operator.le, '<': operator.lt, '==': operator.eq,
+}
+_TOKEN_RE = re.compile(r"\s*(?:(\d+(?:\.\d+)?)|(>=|<=|==|>|<)|([()])|([A-Za-z_]\w*))")
+_LEVEL_FIELDS = {f.name[:-len('_level')] for f in fields(UserProfile) if f.name.endswith('_level')}
+
+def compile_condition(text: str) -> Callable[[UserProfile], bool]:
+    """
+    Compiles an interaction condition into a predicate over a UserProfile.
+
+    Grammar: `expr := term ('or' term)*`, `term := atom ('and' atom)*`,
+    `atom := '(' expr ')' | NAME [op NUMBER]` with op in >=, >, <=, <, ==.
+    `NAME op NUMBER` compares the profile's `NAME_level` field (e.g. "anxiety >= 7");
+    a bare NAME tests the profile condition flag (e.g. "hypertension").
+    Raises ValueError on malformed input so bad catalog entries fail at load.
+    """
+    tokens = []
+    pos = 0
+    text = text.strip()
+    while pos < len(text):
+        m = _TOKEN_RE.match(text, pos)
+        if not m or m.end() == pos:
+            raise ValueError(f"Invalid condition {text!r}: unexpected input at {text[pos:]!r}")
+        pos = m.end()
+        number, op, paren, name = m.groups()
+        if number is not None: tokens.append(('num', float(number)))
+        elif op is not None: tokens.append(('op', op))
+        elif paren is not None: tokens.append((paren, paren))
+        elif name in ('and', 'or'): tokens.append((name, name))
+        else: tokens.append(('name', name))
+    if not tokens:
+        raise ValueError("Empty condition")
+
+    def peek():
+        return tokens[0][0] if tokens else None
+
+    def take(kind):
+        if peek() != kind:
+            found = repr(tokens[0][1]) if tokens else "end of input"
+            raise ValueError(f"Invalid condition {text!r}: expected {kind}, found {found}")
+        return tokens.pop(0)[1]
+
+    def parse_expr():
+        terms = [parse_term()]
+        while peek() == 'or':
+            take('or')
+            terms.append(parse_term())
+        if len(terms) == 1: return terms[0]
+        return lambda profile: any(t(profile) for t in terms)
+
+    def parse_term():
+        atoms = [parse_atom()]
+        while peek() == 'and':
+            take('and')
+            atoms.append(parse_atom())
+        if len(atoms) == 1: return atoms[0]
+        return lambda profile: all(a(profile) for a in atoms)
+
+    def parse_atom():
+        if peek() == '(':
+            take('(')
+            inner = parse_expr()
+            take(')')
+            return inner
+        name = take('name')
+        if peek() != 'op':
+            return lambda profile: bool(profile.conditions.get(name, False))
+        compare = _COMPARATORS[take('op')]
+        value = take('num')
+        if name not in _LEVEL_FIELDS:
+            raise ValueError(f"Invalid condition {text!r}: unknown level {name!r} (expected one of {sorted(_LEVEL_FIELDS)})")
+        attr = f"{name}_level"
+        return lambda profile: compare(getattr(profile, attr), value)
+
+    predicate = parse_expr()
+    if tokens:
+        raise ValueError(f"Invalid condition {text!r}: unexpected {tokens[0][1]!r}")
+    return predicate
+
+# --- Interaction Index ---
+
+class Interaction(NamedTuple):
+    order: int # Declaration order within its table, keeps reason text stable
+    source: int # Catalog index of the plant declaring the interaction
+    partner: int # Catalog index of the partner plant
+    partner_id: str
+    weight: float # Synergy bonus or antagonism penalty, as declared
+    action: str # 'bonus', 'penalize' or 'exclude'
+    predicate: Optional[Callable[[UserProfile], bool]]
+    condition: Optional[str] # Source text of predicate
+
+class _LinkTable:
+    """
+    One interaction kind as CSR arrays over the catalog (links are encoded grouped by source,
+    in declaration order, with compiled row pointers). Row i is decoded into {partner index:
+    (Interaction, ...)} the first time plant i takes part in a gather and reused afterwards,
+    so loading does no work per link however many the catalog declares.
+    """
+
+    def __init__(self, columns: CatalogColumns, prefix: str, weights: List[Any], predicates: List[Callable]):
+        self._columns = columns
+        self._src = getattr(columns, f"{prefix}_src")
+        self._dst = getattr(columns, f"{prefix}_dst")
+        self._weight = getattr(columns, f"{prefix}_weight")
+        self._cond = getattr(columns, f"{prefix}_cond")
+        self._action = columns.ant_action if prefix == 'ant' else None
+        self._indptr = getattr(columns, f"{prefix}_indptr").tolist()
+        self._weights = weights
+        self._predicates = predicates
+        self._rows = {}
+
+    def row(self, i: int) -> Dict[int, Tuple[Interaction, ...]]:
+        row = self._rows.get(i)
+        if row is None:
+            row = {}
+            start, end = self._indptr[i], self._indptr[i + 1]
+            dst = self._dst[start:end].tolist()
+            weight = self._weight[start:end].tolist()
+            cond = self._cond[start:end].tolist()
+            action = self._action[start:end].tolist() if self._action is not None else None
+            for k, j in enumerate(dst):
+                link = Interaction(start + k, i, j, self._columns.ids[j], self._weights[weight[k]],
+                                   self._columns.actions[action[k]] if action else 'bonus',
+                                   self._predicates[cond[k]] if cond[k] >= 0 else None,
+                                   self._columns.expressions[cond[k]] if cond[k] >= 0 else None)
+                row.setdefault(j, []).append(link)
+            row = self._rows[i] = {j: tuple(links) for j, links in row.items()}
+        return row
+
+class InteractionIndex:
+    """
+    Integer-coded sparse adjacency of synergies and antagonisms, built once at load.
+    Each table maps a (plant index, partner index) pair to its declared interactions, so
+    the terms for a selected set come from one gather over its k^2 index pairs instead of
+    walking every selected plant's full interaction lists. Partners that are not in the
+    catalog can never be selected and are dropped; their conditions are still validated.
+    """
+
+    def __init__(self, columns: CatalogColumns):
+        predicates = []
+        for text, source in zip(columns.expressions, columns.expression_sources):
+            try:
+                predicates.append(compile_condition(text))
+            except ValueError as e:
+                raise ValueError(f"{source}: {e}") from None
+        weights = [json.loads(v) for v in columns.values]
+        self.synergies = _LinkTable(columns, 'syn', weights, predicates)
+        self.antagonisms = _LinkTable(columns, 'ant', weights, predicates)
+        self.predicates = tuple(predicates) # Distinct compiled conditions, in first-seen order
+
+    @staticmethod
+    def gather(table: _LinkTable, selected: Sequence[int], profile: UserProfile) -> List[Interaction]:
+        """Triggered interactions among the selected plant indices, in declaration order."""
+        hits = []
+        for i in selected:
+            row = table.row(i)
+            if not row: continue
+            for j in selected:
+                links = row.get(j)
+                if links: hits.extend(links)
+        if len(hits) > 1: hits.sort()
+        return [h for h in hits if h.predicate is None or h.predicate(profile)]
+
+class _ConditionIndex(MappingABC):
+    """
+    Condition code (bit of UserProfile.mask) -> [(plant index, rule position, rule)] over the
+    rule columns. Rows come grouped per condition by the compiled rule_order/rule_bounds
+    columns; a code's entry list is decoded the first time a request activates it, with
+    set_role rules also carrying their target as a ROLES code under 'role'.
+    """
+
+    def __init__(self, columns: CatalogColumns):
+        self._columns = columns
+        self._order = columns.rule_order
+        self._bounds = columns.rule_bounds.tolist()
+        self._extras = [json.loads(v) for v in columns.values]
+        self._entries = {}
+
+    def __getitem__(self, code: int) -> List[Tuple[int, int, Dict[str, Any]]]:
+        entries = self._entries.get(code)
+        if entries is None:
+            if code not in self: raise KeyError(code)
+            cols = self._columns
+            key = cols.conditions[code]
+            rows = self._order[self._bounds[code]:self._bounds[code + 1]]
+            entries = []
+            for i, pos, action, extra in zip(cols.rule_plant[rows].tolist(), cols.rule_pos[rows].tolist(),
+                                             cols.rule_action[rows].tolist(), cols.rule_extra[rows].tolist()):
+                rule = {'condition': key, 'action': cols.actions[action], **self._extras[extra]}
+                if rule['action'] == 'set_role': rule['role'] = ROLES.index(rule.get('value'))
+                entries.append((i, pos, rule))
+            self._entries[code] = entries
+        return entries
+
+    def __contains__(self, code) -> bool:
+        return type(code) is int and 0 <= code < len(self._columns.conditions)
+
+    def __iter__(self):
+        return iter(range(len(self._columns.conditions)))
+
+    def __len__(self):
+        return len(self._columns.conditions)
+
+class ExclusionMatrix:
+    """
+    The `exclude` rules as a plants x conditions bit matrix (the compiled exclusion_bits
+    column): bit c of row i is set when plant i has an exclude rule on condition code c (the
+    codes of UserProfile.mask), packed into uint64 words. A batch of
+    condition bitmasks is encoded the same way, so its unsafe plants are one bitwise AND plus
+    an any-reduction over the words. screen() also names each unsafe plant's excluding
+    condition, read off those rows.
+    """
+    WORD = 64
+    BLOCK = 1 << 22 # Profile x plant x word cells per AND, bounds the temporary on large catalogs
+
+    def __init__(self, columns: CatalogColumns):
+        self.bits = columns.exclusion_bits
+        self.words = self.bits.shape[1]
+        exclude = columns.actions.index('exclude') if 'exclude' in columns.actions else -1
+        # Rule rows are in catalog then declaration order, so each plant's rules are contiguous
+        rows = np.flatnonzero(columns.rule_action == exclude)
+        plants = columns.rule_plant[rows].astype(np.int64)
+        conditions = columns.rule_condition[rows].astype(np.int64)
+        unique, first, counts = np.unique(plants, return_index=True, return_counts=True)
+        self._first = np.full(len(self.bits), -1, dtype=np.int64) # Condition code of each plant's first exclude rule
+        self._first[unique] = conditions[first]
+        # Plants with several exclude rules: their condition codes in declaration order
+        self._ordered = {i: conditions[start:start + count].tolist()
+                         for i, start, count in zip(unique.tolist(), first.tolist(), counts.tolist()) if count > 1}
+        self._names = list(columns.conditions)
+
+    def encode(self, masks: Sequence[int]) -> np.ndarray:
+        """Condition bitmasks as a len(masks) x words uint64 matrix."""
+        out = np.zeros((len(masks), self.words), dtype=np.uint64)
+        for w in range(self.words):
+            out[:, w] = [(m >> (w * self.WORD)) & 0xFFFFFFFFFFFFFFFF for m in masks]
+        return out
+
+    def unsafe(self, masks: Sequence[int]) -> np.ndarray:
+        """len(masks) x plants boolean matrix: True where an active condition excludes the plant."""
+        words = self.encode(masks)
+        out = np.empty((len(masks), len(self.bits)), dtype=bool)
+        step = max(1, self.BLOCK // max(1, self.bits.size))
+        for start in range(0, len(masks), step):
+            block = words[start:start + step]
+            out[start:start + len(block)] = (self.bits[None, :, :] & block[:, None, :]).any(axis=2)
+        return out
+
+    def screen(self, masks: Sequence[int]) -> Tuple[np.ndarray, List[Dict[int, str]]]:
+        """
+        unsafe(masks) and, per mask, {plant index: excluding condition} for the True cells of
+        its row. A plant excluded by several active conditions reports its first exclude rule,
+        as ConstraintEngine.check_safety does.
+        """
+        unsafe = self.unsafe(masks)
+        exclusions = []
+        for mask, row in zip(masks, unsafe):
+            plants = np.flatnonzero(row)
+            found = {}
+            for i, code in zip(plants.tolist(), self._first[plants].tolist()):
+                ordered = self._ordered.get(i)
+                if ordered: code = next(c for c in ordered if (mask >> c) & 1)
+                found[i] = self._names[code]
+            exclusions.append(found)
+        return unsafe, exclusions
 
 # --- Constraint Engine ---
 
 class ConstraintEngine:
     """
     Enforces the 'RELATIVE DOSING LIMITS.pdf' rules and Phase 2 Antagonisms.
+    All methods operate on per-request PlantState objects; catalog Plants are read-only.
     """
     
     @staticmethod
-    def check_safety(plant: Plant, profile: UserProfile) -> bool:
+    def check_safety(state: PlantState, profile: UserProfile) -> bool:
         """Determines if a plant is SAFE to use based on standalone conditions."""
-        plant.exclusion_reason = None
-        constraints = plant.constraints.get('conditions', [])
+        state.exclusion = None
+        constraints = state.plant.constraints.get('conditions', [])
         for rule in constraints:
             condition_key = rule.get('condition')
             action = rule.get('action')
             if profile.conditions.get(condition_key, False):
                 if action == 'exclude':
-                    plant.exclusion_reason = f"Excluded due to {condition_key}"
+                    state.exclusion = TraceEvent('exclude', state.index, condition=condition_key)
+                    state.trace.append(state.exclusion)
                     return False
         return True
 
     @staticmethod
-    def check_antagonisms(selected_plants: List[Plant], profile: UserProfile) -> List[Plant]:
+    def check_antagonisms(selected: List[PlantState], profile: UserProfile,
+                          interactions: InteractionIndex, probe: Optional[Probe] = None) -> List[PlantState]:
         """
         Phase 2: Negative Combinations (Antagonisms).
         Checks pairs and applies penalties or exclusions.
         """
-        ids = {p.id for p in selected_plants}
+        by_index = {s.index: s for s in selected}
         to_exclude = set()
 
-        for p in selected_plants:
-            for ant in p.antagonisms:
-                opponent_id = ant.get('with')
-                if opponent_id in ids:
-                    condition = ant.get('condition')
-                    # Evaluate condition if any (simplified parser)
-                    triggered = True
-                    if condition:
-                        if ">=" in condition:
-                            key, val = condition.split(">=")
-                            key = key.strip()
-                            val = int(val.strip())
-                            user_val = getattr(profile, f"{key}_level", 0)
-                            if user_val < val: triggered = True # Wait, if user_val < val, triggered should be False
-                            else: triggered = True
-                            if user_val < val: triggered = False
-                    
-                    if triggered:
-                        action = ant.get('action', 'penalize')
-                        if action == 'exclude':
-                            to_exclude.add(p.id)
-                            p.exclusion_reason = f"Antagonism with {opponent_id}"
-                        else:
-                            penalty = ant.get('penalty', 0)
-                            p.relevance_score -= penalty
-                            p.adjustment_reason = str(p.adjustment_reason or "") + f" Penalty -{penalty} (antagonism with {opponent_id})"
+        for ant in InteractionIndex.gather(interactions.antagonisms, by_index, profile):
+            s = by_index[ant.source]
+            if probe: probe.antagonism(s.plant.id, ant.partner_id, ant.action)
+            if ant.action == 'exclude':
+                to_exclude.add(ant.source)
+                s.exclusion = TraceEvent('antagonism', ant.source, ant.partner, condition=ant.condition)
+                s.trace.append(s.exclusion)
+            else:
+                s.relevance_score -= ant.weight
+                s.trace.append(TraceEvent('penalty', ant.source, ant.partner, -ant.weight, ant.condition))
         
-        return [p for p in selected_plants if p.id not in to_exclude]
+        return [s for s in selected if s.index not in to_exclude]
 
     @staticmethod
-    def apply_conditional_limits(plant: Plant, profile: UserProfile):
-        """Adjusts plant.max_percent or plant.role based on conditions."""
-        constraints = plant.constraints.get('conditions', [])
+    def apply_conditional_limits(state: PlantState, profile: UserProfile):
+        """Adjusts state.max_percent or state.final_role based on conditions."""
+        constraints = state.plant.constraints.get('conditions', [])
         for rule in constraints:
             condition_key = rule.get('condition')
             action = rule.get('action')
             if profile.conditions.get(condition_key, False):
                 if action == 'cap_percent':
                     cap = rule.get('value', 100)
-                    if plant.max_percent > cap:
-                        plant.max_percent = cap
-                        plant.adjustment_reason = f"Capped at {cap}% via {condition_key}"
+                    if state.max_percent > cap:
+                        state.max_percent = cap
+                        state.min_percent = min(state.min_percent, rule.get('min_value', cap))
+                        state.trace.append(TraceEvent('cap', state.index, condition=condition_key, value=cap))
                 elif action == 'set_role':
                     new_role = rule.get('value')
-                    plant.final_role = new_role
-                    plant.adjustment_reason = f"Shifted to {new_role} via {condition_key}"
+                    state.final_role = ROLES.index(new_role)
+                    state.trace.append(TraceEvent('role', state.index, condition=condition_key, value=new_role))
+
+    @staticmethod
+    def build_condition_index(columns: CatalogColumns) -> '_ConditionIndex':
+        """
+        Inverted index: condition code -> [(plant index, rule position, rule)], in catalog
+        and declaration order. Built once at load so a request only visits active rules.
+        """
+        return _ConditionIndex(columns)
 
     @staticmethod
-    def validate_family_limits(selected_plants: List[Plant]) -> List[Plant]:
-        """Enforces global family caps (e.g. Sedatives <= 40%)."""
-        families = {}
-        for p in selected_plants:
-            fam = p.family_functional
-            if fam not in families: families[fam] = []
-            families[fam].append(p)
-            
-        for fam, plants in families.items():
-            limit_rule = plants[0].constraints.get('global_family_limit')
-            if not limit_rule: continue
-            
-            max_sum = limit_rule.get('max_sum', 100)
-            current_sum = sum(p.final_percent for p in plants)
-            
-            if current_sum > max_sum:
-                ratio = max_sum / current_sum
-                for p in plants: p.final_percent *= ratio
-        return selected_plants
+    def apply_condition_index(index: Mapping[int, List[Tuple[int, int, Dict[str, Any]]]], states: List[PlantState],
+                              profile: UserProfile, probe: Optional[Probe] = None,
+                              known: Optional[Dict[int, str]] = None) -> Tuple[Dict[int, str], Set[int]]:
+        """
+        Indexed equivalent of check_safety + apply_conditional_limits over the whole catalog,
+        for the conditions set in profile.mask. Costs O(active rules). Returns ({plant index: excluding condition}, indices whose role
+        was shifted by a set_role rule). No text is built: exclusions are recorded as events.
+        `known` is that exclusion map when already computed (ExclusionMatrix.screen); plants
+        in it are excluded without searching their rules.
+        """
+        hits = []
+        mask = profile.mask
+        while mask:
+            low = mask & -mask
+            hits.extend(index[low.bit_length() - 1])
+            mask ^= low
+        if not hits: return {}, set()
+        # Restore per-plant declaration order so exclusions and trace events match the scan
+        hits.sort(key=lambda h: (h[0], h[1]))
+
+        excluded = {}
+        shifted = set()
+        for i, group in groupby(hits, key=lambda h: h[0]):
+            rules = [h[2] for h in group]
+            state = states[i]
+            if known is not None: condition_key = known.get(i)
+            else: condition_key = next((r.get('condition') for r in rules if r.get('action') == 'exclude'), None)
+            if condition_key is not None:
+                excluded[i] = condition_key
+                state.exclusion = TraceEvent('exclude', i, condition=condition_key)
+                state.trace.append(state.exclusion)
+                if probe: probe.exclusion(condition_key)
+                logging.info("Safety Exclusion: %s - Excluded due to %s", state.plant.name, condition_key)
+                continue
+            for rule in rules:
+                condition_key = rule.get('condition')
+                action = rule.get('action')
+                if action == 'cap_percent':
+                    cap = rule.get('value', 100)
+                    if state.max_percent > cap:
+                        state.max_percent = cap
+                        state.min_percent = min(state.min_percent, rule.get('min_value', cap))
+                        state.trace.append(TraceEvent('cap', i, condition=condition_key, value=cap))
+                elif action == 'set_role':
+                    state.final_role = rule['role']
+                    state.trace.append(TraceEvent('role', i, condition=condition_key, value=rule.get('value')))
+                    shifted.add(i)
+        return excluded, shifted
+
+# --- Composition Search ---
+
+class CompositionSearch:
+    """
+    Branch-and-bound over role-constrained plant sets. Each role may hold at most as many
+    plants as the greedy top-k gives it; a set scores the relevance of its members plus the
+    synergy bonuses and minus the antagonism penalties triggered between them. Sets holding
+    both sides of an excluding antagonism, or whose minimum doses cannot fit a family limit
+    (or 100%), are infeasible.
+
+    Candidates are tried in descending optimistic value (relevance plus every positive pair
+    term they could still collect). Summing the optimistic values of a node's open slots never
+    underestimates what they can add, so the bound is admissible and a branch is cut as soon
+    as it cannot beat the incumbent. The greedy selection seeds the incumbent and is only
+    replaced by a strictly better set: without interaction terms the result is the greedy one.
+    A set is full when its doses can reach 100%: the sum over its families of the smaller of
+    the family limit and its members' maximum doses. A set that is not full never replaces a
+    full incumbent, so the search does not trade a complete formula for a short one.
+    The search expands at most `max_nodes` nodes and then returns the best set found so far,
+    so a truncated search still gives the same set for the same input on any machine.
+    """
+    EPS = 1e-9
+
+    def __init__(self, roles: List[Tuple[List[int], int]], scores: List[float], pairs: Dict[int, Dict[int, float]],
+                 forbidden: Dict[int, Set[int]], family: Dict[int, Tuple[int, float, float, float]], max_nodes: int):
+        self.scores = scores
+        self.pairs = pairs
+        self.forbidden = forbidden
+        self.family = family # Candidate -> (family code, min percent, max percent, family max_sum or inf)
+        self.max_nodes = max_nodes
+        self.optimistic = {i: scores[i] + sum(w for w in pairs.get(i, {}).values() if w > 0)
+                           for candidates, _ in roles for i in candidates}
+        self.roles = [(sorted(candidates, key=lambda i: (-self.optimistic[i], -scores[i], i)), slots)
+                      for candidates, slots in roles]
+        self.prefix = []
+        for candidates, _ in self.roles:
+            sums = [0.0]
+            for i in candidates: sums.append(sums[-1] + self.optimistic[i])
+            self.prefix.append(sums)
+        # Optimistic value of every role after r, fully open
+        self.rest = [0.0] * (len(self.roles) + 1)
+        for r in range(len(self.roles) - 1, -1, -1):
+            candidates, slots = self.roles[r]
+            self.rest[r] = self.rest[r + 1] + self.prefix[r][min(slots, len(candidates))]
+        self.best_value = -float('inf')
+        self.best: List[int] = []
+        self.best_full = False
+        self.nodes = 0
+        self.truncated = False # The node budget ran out before the search finished
+
+    def value(self, chosen: List[int]) -> Optional[float]:
+        """Objective of a complete set, or None if it is infeasible."""
+        total = 0.0
+        for n, i in enumerate(chosen):
+            if not self._fits(i, chosen[:n]): return None
+            total += self._gain(i, chosen[:n])
+        return total
+
+    def run(self, incumbent: List[int]) -> List[int]:
+        value = self.value(incumbent)
+        if value is not None: self.best_value, self.best, self.best_full = value, list(incumbent), self.full(incumbent)
+        if self.roles: self._extend(0, 0, self.roles[0][1], [], 0.0)
+        return self.best
+
+    def full(self, chosen: List[int]) -> bool:
+        """True when the doses of `chosen` can sum to 100% within their maximums and family limits."""
+        room: Dict[int, float] = {}
+        limits: Dict[int, float] = {}
+        for i in chosen:
+            family, _, hi, limit = self.family[i]
+            room[family] = room.get(family, 0.0) + hi
+            limits[family] = limit
+        return sum(min(total, limits[f]) for f, total in room.items()) >= 100 - self.EPS
+
+    def _gain(self, i: int, chosen: List[int]) -> float:
+        row = self.pairs.get(i)
+        return self.scores[i] + (sum(row.get(j, 0.0) for j in chosen) if row else 0.0)
+
+    def _fits(self, i: int, chosen: List[int]) -> bool:
+        blocked = self.forbidden.get(i)
+        if blocked and any(j in blocked for j in chosen): return False
+        family, min_percent, _, limit = self.family[i]
+        total, floor = min_percent, min_percent
+        for j in chosen:
+            other, other_min, _, _ = self.family[j]
+            floor += other_min
+            if other == family: total += other_min
+        return total <= limit + self.EPS and floor <= 100 + self.EPS
+
+    def _extend(self, r: int, start: int, left: int, chosen: List[int], value: float):
+        """Sets extending `chosen` with role r's candidates from `start` (at most `left` more), then later roles."""
+        if self.nodes >= self.max_nodes: self.truncated = True
+        if self.truncated: return
+        self.nodes += 1
+        if value > self.best_value + self.EPS:
+            full = self.full(chosen)
+            if full or not self.best_full: self.best_value, self.best, self.best_full = value, list(chosen), full
+        candidates, _ = self.roles[r]
+        prefix = self.prefix[r]
+        for pos in range(start, len(candidates) if left > 0 else start):
+            # Candidates are sorted by optimistic value, so once this bound fails every later one does
+            if value + prefix[min(pos + left, len(candidates))] - prefix[pos] + self.rest[r + 1] <= self.best_value + self.EPS:
+                break
+            i = candidates[pos]
+            if not self._fits(i, chosen): continue
+            chosen.append(i)
+            self._extend(r, pos + 1, left - 1, chosen, value + self._gain(i, chosen[:-1]))
+            chosen.pop()
+            if self.truncated: return
+        if r + 1 < len(self.roles) and value + self.rest[r + 1] > self.best_value + self.EPS:
+            self._extend(r + 1, 0, self.roles[r + 1][1], chosen, value)
+
+# --- Result Cache ---
+
+class FormulaCache:
+    """
+    Bounded LRU cache of formulas, keyed on a canonical profile (HerbalFormulator._canonical_key)
+    and the catalog content hash it was computed for, so a cache shared across engine instances
+    never serves results of a stale plants_db.json. After a reload, requests still running on
+    the old snapshot keep hitting their own entries; once nothing asks for them they drift to
+    the LRU end and are evicted first, instead of the whole cache being dropped on every switch.
+    """
+
+    def __init__(self, maxsize: int = 1024):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self.db_hash = None # Hash of the latest put
+        self._entries = OrderedDict() # (db_hash, key) -> formula
+        self._lock = threading.Lock()
+
+    def get(self, key: Tuple, db_hash: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            result = self._entries.get((db_hash, key))
+            if result is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end((db_hash, key))
+            self.hits += 1
+            return result
+
+    def put(self, key: Tuple, db_hash: str, result: Dict[str, Any]):
+        with self._lock:
+            self.db_hash = db_hash
+            self._entries[db_hash, key] = result
+            self._entries.move_to_end((db_hash, key))
+            while len(self._entries) > self.maxsize: self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits, "misses": self.misses, "size": len(self._entries), "maxsize": self.maxsize,
+                "hit_rate": self.hits / lookups if lookups else 0.0, "db_hash": self.db_hash,
+            }
+
+class SafetySnapshot(NamedTuple):
+    """Everything the safety stage produced for one set of active conditions (never mutated)."""
+    excluded: Dict[int, str]
+    shifted: Set[int]
+    changes: Dict[int, Tuple[float, float, int]] # Capped or shifted plant -> max/min percent, role code
+    trace: Tuple[TraceEvent, ...]
+
+    @classmethod
+    def capture(cls, states: '_RequestStates', excluded: Dict[int, str], shifted: Set[int]) -> 'SafetySnapshot':
+        """
+        Snapshot of fresh states that have only been through the safety stage. Excluded
+        plants are never selected, so only their `excluded` entry and trace events are kept.
+        """
+        changes = {i: (s.max_percent, s.min_percent, s.final_role) for i, s in states.items() if i not in excluded}
+        return cls(excluded, shifted, changes, tuple(states.trace))
+
+    def apply(self, states: '_RequestStates') -> Tuple[Dict[int, str], Set[int]]:
+        """
+        Replays the stage onto fresh states (any scores); returns (excluded, shifted) as the
+        stage does. The changes are applied as states are created, so replaying is O(1).
+        """
+        states.overrides = self.changes
+        states.trace.extend(self.trace)
+        return self.excluded, self.shifted
+
+class SafetyCache:
+    """
+    Bounded LRU of SafetySnapshots keyed on the active-condition bitmask
+    (UserProfile.mask). The safety stage depends on nothing else, and real
+    profiles only produce a few dozen masks, so most requests skip the stage entirely.
+    """
+
+    def __init__(self, maxsize: int = 256):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, mask: int) -> Optional[SafetySnapshot]:
+        with self._lock:
+            snapshot = self._entries.get(mask)
+            if snapshot is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(mask)
+            self.hits += 1
+            return snapshot
+
+    def __contains__(self, mask: int) -> bool:
+        """Membership without touching the LRU order or the hit counters."""
+        with self._lock:
+            return mask in self._entries
+
+    def put(self, mask: int, snapshot: SafetySnapshot):
+        with self._lock:
+            self._entries[mask] = snapshot
+            self._entries.move_to_end(mask)
+            while len(self._entries) > self.maxsize: self._entries.popitem(last=False)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {"hits": self.hits, "misses": self.misses, "size": len(self._entries), "maxsize": self.maxsize,
+                    "hit_rate": self.hits / lookups if lookups else 0.0}
+
+def _present(result: Dict[str, Any], explain: bool, version: Optional[str], ids: Sequence[str]) -> Dict[str, Any]:
+    """
+    Public form of an internal formula (which may be shared by the cache or table, so new
+    dicts are always built). Internal components carry the plant id and the request's
+    TraceEvents ride along as "trace", with catalog indices for plants; with explain the
+    events are decoded through `ids`, each component gets its rendered "reason" and the
+    ordered event list is returned, otherwise no text is produced at all. `version` is the
+    db_hash of the catalog snapshot that computed it ("catalog_version"), `ids` its plant ids.
+    """
+    components = [{"name": c["name"], "role": c["role"], "percent": c["percent"], "grams": c["grams"]}
+                  for c in result["components"]]
+    formula = {"total_grams": result["total_grams"], "dosing": result["dosing"], "components": components,
+               "catalog_version": version}
+    if explain:
+        events = [decode_event(e, ids) for e in result["trace"]]
+        for public, c in zip(components, result["components"]):
+            reasons = [render_event(e) for e in events if e.plant == c["id"] and e.kind not in ('exclude', 'antagonism')]
+            public["reason"] = "; ".join(reasons) or None
+        formula["trace"] = [{**{k: v for k, v in e._asdict().items() if v is not None}, "text": render_event(e)}
+                            for e in events]
+    return formula
+
+# --- Precompiled Formula Table ---
+
+class FormulaTable:
+    """
+    Read-only lookup artifact mapping canonical profile keys to formulas, compiled offline
+    for a finite profile space (see herbal_table.py). Formulas are stored once and shared
+    by every key that produces them. Tied to the catalog content hash it was compiled from,
+    whose symbol codes its keys are written in.
+    """
+    FORMAT = "herbal-formula-table"
+    VERSION = 6 # v2: component ids and the unrendered decision trace; v3: dosing status; v4: interned keys; v5: empty status; v6: trace by plant index
+
+    def __init__(self, db_hash: str, formulas: Dict[Tuple, Dict[str, Any]]):
+        self.db_hash = db_hash
+        self.formulas = formulas
+
+    def get(self, key: Tuple) -> Optional[Dict[str, Any]]:
+        return self.formulas.get(key)
+
+    def __len__(self):
+        return len(self.formulas)
+
+    @classmethod
+    def load(cls, path: str) -> 'FormulaTable':
+        with open(path, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+        if data.get('format') != cls.FORMAT or data.get('version') != cls.VERSION:
+            raise ValueError(f"{path}: not a {cls.FORMAT} v{cls.VERSION} artifact")
+        distinct = data['formulas']
+        formulas = {
+            (tuple(axes), mask, tuple(preds)): distinct[ref]
+            for (axes, mask, preds), ref in data['entries']
+        }
+        return cls(data['db_hash'], formulas)
+
+    def save(self, path: str) -> int:
+        """Writes the artifact (entries in a stable order) and returns the number of distinct formulas."""
+        distinct = {}
+        entries = []
+        for key, formula in sorted(self.formulas.items(), key=lambda kv: json.dumps(kv[0])):
+            ref = distinct.setdefault(json.dumps(formula, sort_keys=True), len(distinct))
+            entries.append([key, ref])
+        data = {
+            "format": self.FORMAT, "version": self.VERSION, "db_hash": self.db_hash,
+            "formulas": [json.loads(f) for f in distinct], "entries": entries,
+        }
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(data, f, separators=(',', ':'))
+        return len(distinct)
+
+# --- Symbol Table ---
+
+class SymbolTable:
+    """
+    Small-int codes for the strings the request path is keyed on, assigned once at load:
+    plant ids are catalog indices, priority axes score-matrix columns, rule conditions bits
+    of the condition mask, roles their position in ROLES and families their catalog codes.
+    A request's strings are interned once by HerbalFormulator._build_profile; the later
+    stages compare and hash the codes, and the code -> string lists decode them for the output.
+    """
+    __slots__ = ('ids', 'axes', 'conditions', 'roles', 'families', 'axis', 'condition', 'role', 'family')
+
+    def __init__(self, columns: CatalogColumns):
+        self.ids = columns.ids # Code -> string lists
+        self.axes, self.conditions = list(columns.axes), list(columns.conditions)
+        self.roles, self.families = list(ROLES), list(columns.families)
+        self.axis, self.condition, self.role, self.family = (
+            {name: code for code, name in enumerate(names)}
+            for names in (self.axes, self.conditions, self.roles, self.families))
+
+    def axis_codes(self, priorities: Sequence[str]) -> Tuple[int, ...]:
+        """Sorted columns of the known priority axes (a multiset: scoring sums them, order is irrelevant)."""
+        axis = self.axis
+        return tuple(sorted(axis[p] for p in priorities if p in axis))
+
+    def condition_mask(self, conditions: Mapping[str, bool]) -> int:
+        """Bitmask of the active conditions that some rule references."""
+        condition = self.condition
+        mask = 0
+        for key, active in conditions.items():
+            if active and key in condition: mask |= 1 << condition[key]
+        return mask
+
+# --- Catalog Views ---
+
+class PlantTable(SequenceABC):
+    """
+    Struct-of-arrays catalog: one column per plant attribute (role and family codes, min/max
+    percent, the plants x axes score matrix) instead of one object per plant. The engine works
+    on these columns and integer plant indices; indexing the table yields Plant views for the
+    public API and the admin table. Full records stay encoded until a view's detail is read.
+    """
+
+    def __init__(self, columns: CatalogColumns):
+        self.columns = columns
+        self.ids, self.names = columns.ids, columns.names
+        self.roles, self.families = columns.roles, columns.families
+        self.role_codes, self.family_codes = columns.role_codes, columns.family_codes
+        self.family_caps = columns.family_caps # global_family_limit max_sum per family code, inf if none
+        self.min_percent, self.max_percent = columns.min_percent, columns.max_percent
+        self.scores = columns.scores # Dense plants x axes
+        self.role_names = [self.roles[c] for c in self.role_codes.tolist()]
+        self.family_names = [self.families[c] for c in self.family_codes.tolist()]
+        literals = [json.loads(v) for v in columns.values]
+        # Declared values (int or float), as output and Plant views expose them
+        self.min_percent_values = [literals[c] for c in columns.min_percent_literal.tolist()]
+        self.max_percent_values = [literals[c] for c in columns.max_percent_literal.tolist()]
+        self._details = {}
+
+    def __len__(self):
+        return self.columns.count
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return tuple(self[j] for j in range(*i.indices(len(self))))
+        if i < 0: i += len(self)
+        if not 0 <= i < len(self): raise IndexError("plant index out of range")
+        return Plant(self, i)
+
+    def detail(self, i: int) -> Dict[str, Any]:
+        """Source record of plant i, decoded once and shared by its views."""
+        record = self._details.get(i)
+        if record is None:
+            record = self._details[i] = self.columns.record(i)
+        return record
+
+class _RequestStates(dict):
+    """Per-request PlantState by catalog index, created on first access so untouched plants cost nothing."""
+    __slots__ = ('engine', 'scores', 'trace', 'overrides')
+
+    def __init__(self, engine: 'HerbalFormulator', scores: List[float]):
+        super().__init__()
+        self.engine = engine
+        self.scores = scores
+        self.trace: List[TraceEvent] = [] # Every state's events, in the order they happened
+        self.overrides = None # SafetySnapshot.changes replayed onto states as they are created
+
+    def __missing__(self, i: int) -> PlantState:
+        state = self[i] = self.engine._new_state(i, self.scores[i], self.trace)
+        if self.overrides is not None and i in self.overrides:
+            state.max_percent, state.min_percent, state.final_role = self.overrides[i]
+        return state
 
 # --- Main Engine ---
 
 class HerbalFormulator:
-    def __init__(self, db_path: str):
-        with open(db_path, 'r', encoding='utf-8') as f:
-            data = json.load(f)
-            self.db = [Plant(**item) for item in data]
+    """
+    Stateless formulation engine. The catalog (self.db) is immutable after load and
+    every request evaluates against its own PlantState objects, so a single instance
+    can be shared between threads (e.g. Streamlit sessions) without locking.
+    """
+    BATCH_CHUNK = 256 # Profiles scored per matrix product in generate_formulas
+    ROLE_LIMITS = (('primary', 2), ('secondary', 3), ('support', 2)) # Selection order and per-role caps
+    MAX_PLANTS = 5
+    SEARCH_BUDGET = 2000 # CompositionSearch nodes a request may expand; 0 keeps the greedy selection
+    SEARCH_WIDTH = 8 # Extra candidates per role offered to the search, by relevance and by synergy potential
+    SAFETY_CACHE_SIZE = 256 # Active-condition sets whose safety stage output is memoized
+
+    def __init__(self, db_path: str, cache: Optional[FormulaCache] = None,
+                 recorder: Optional[MetricsRecorder] = None, search_budget: Optional[int] = None,
+                 safety_cache_size: Optional[int] = None):
+        if is_binary_catalog(db_path):
+            columns = read_catalog(db_path) # Memory-mapped
+        else:
+            with open(db_path, 'rb') as f:
+                raw = f.read()
+            # Validated like `herbal.py compile`; links to plants not in the catalog are dropped
+            columns = compile_catalog(json.loads(raw.decode('utf-8')), hashlib.sha256(raw).hexdigest(),
+                                      allow_missing_partners=True)
+        self.db = PlantTable(columns) # Sequence of read-only Plant views
+        self.db_hash = columns.source_hash # Hash of the source plants_db.json content
+        self.cache = cache # Opt-in result cache, e.g. FormulaCache(maxsize=4096)
+        self.table = None # Optional FormulaTable, see load_formula_table
+        self.recorder = recorder # Opt-in stage timings and counters, see metrics()
+        self.search_budget = self.SEARCH_BUDGET if search_budget is None else search_budget
+        size = self.SAFETY_CACHE_SIZE if safety_cache_size is None else safety_cache_size
+        self.safety_cache = SafetyCache(size) if size > 0 else None # See safety_cache.stats() for hit rates
+        self._load_columns(columns)
         logging.info(f"Loaded {len(self.db)} plants.")
 
-    def generate_formula(self, profile_dict: Dict[str, Any]) -> Dict[str, Any]:
+    def _load_columns(self, columns: CatalogColumns):
+        """Builds the request-path structures from the integer-coded catalog columns."""
+        self._symbols = SymbolTable(columns)
+        self._axes = self._symbols.axes
+        self._score_matrix = self.db.scores
+        self._roles = [self._symbols.role[role] for role in self.db.role_names] # ROLES code per plant
+        self._max_percent = self.db.max_percent_values
+        self._condition_index = ConstraintEngine.build_condition_index(columns)
+        self._exclusions = ExclusionMatrix(columns)
+        self._interactions = InteractionIndex(columns)
+        bounds = columns.role_bounds.tolist()
+        # By ROLES code; roles the catalog never declares keep an empty partition
+        self._role_partitions = [[] for _ in ROLES]
+        for code, role in enumerate(columns.roles):
+            self._role_partitions[self._symbols.role[role]] = columns.role_order[bounds[code]:bounds[code + 1]].tolist()
+        self._role_limits = tuple((self._symbols.role[role], role, limit)
+                                  for role, limit in self.ROLE_LIMITS) # Selection order as (code, role, limit)
+        self._role_labels = [role.capitalize() for role in ROLES] # By ROLES code
+        self._min_percent = columns.min_percent.tolist()
+        self._max_bonus = columns.max_bonus.tolist() # Synergy bonus upper bound per plant
+        self._family_codes = columns.family_codes.tolist()
+        self._family_caps = columns.family_caps.tolist()
+        self._plant_caps = columns.plant_caps.tolist() # Static `cap` per plant, inf if none
+
+    def load_formula_table(self, path: str):
+        """Answers profiles covered by a precompiled FormulaTable in O(1); others are computed live."""
+        table = FormulaTable.load(path)
+        if table.db_hash != self.db_hash:
+            raise ValueError(f"{path} was compiled for a different catalog (db hash {table.db_hash[:12]}, "
+                             f"loaded {self.db_hash[:12]}); recompile it with herbal_table.py")
+        self.table = table
+        logging.info(f"Loaded formula table with {len(table)} profile keys.")
+
+    def generate_formula(self, profile_dict: Dict[str, Any], explain: bool = False) -> Dict[str, Any]:
+        """
+        Formula for one profile. With explain, every component gets a "reason" and the result
+        a "trace": the ordered decision events (exclusions, caps, role shifts, synergies,
+        antagonisms) with their rendered text.
+        """
+        if self.recorder is not None: return self._generate_recorded(profile_dict, explain)
+        profile = self._build_profile(profile_dict)
+        if self.cache is None and self.table is None:
+            result = self._formulate(profile, self._score_plants(profile))
+            return _present(result, explain, self.db_hash, self._symbols.ids)
+        key = self._canonical_key(profile)
+        result = self._lookup(key)
+        if result is None:
+            result = self._formulate(profile, self._score_plants(profile))
+            if self.cache is not None: self.cache.put(key, self.db_hash, result)
+        return _present(result, explain, self.db_hash, self._symbols.ids)
+
+    def _generate_recorded(self, profile_dict: Dict[str, Any], explain: bool) -> Dict[str, Any]:
+        """generate_formula with stage timings and counters published to self.recorder."""
+        probe = self.recorder.probe()
+        profile = self._build_profile(profile_dict)
+        key = self._canonical_key(profile) if self.cache is not None or self.table is not None else None
+        result = self._lookup(key) if key is not None else None
+        if result is not None:
+            self.recorder.lookup(time.perf_counter() - probe.start)
+            return _present(result, explain, self.db_hash, self._symbols.ids)
+        states = self._score_plants(profile)
+        probe.stage('scoring')
+        result = self._formulate(profile, states, probe)
+        probe.finish()
+        if self.cache is not None: self.cache.put(key, self.db_hash, result)
+        return _present(result, explain, self.db_hash, self._symbols.ids)
+
+    def snapshot(self) -> 'HerbalFormulator':
+        """The engine serving the next request: this one (a ReloadingFormulator swaps them)."""
+        return self
+
+    def metrics(self) -> Dict[str, Any]:
+        """Snapshot of the recorder (see herbal_metrics.render_prometheus); empty when not instrumented."""
+        return self.recorder.snapshot() if self.recorder is not None else {}
+
+    def generate_formulas(self, profile_dicts: List[Dict[str, Any]], explain: bool = False) -> List[Dict[str, Any]]:
+        """
+        Batch entry point. Scores every profile with a single profiles x axes @ axes x plants
+        product and screens the chunk's uncached condition masks against the ExclusionMatrix
+        in one pass, then runs selection and dosing per row. Output matches generate_formula.
+        """
+        recorder = self.recorder
+        profiles = [self._build_profile(d) for d in profile_dicts]
+        results = [None] * len(profiles)
+        pending = list(range(len(profiles)))
+        keys = {}
+        if self.cache is not None or self.table is not None:
+            pending = []
+            for n, profile in enumerate(profiles):
+                started = time.perf_counter() if recorder is not None else 0.0
+                keys[n] = self._canonical_key(profile)
+                known = self._lookup(keys[n])
+                if known is None: pending.append(n)
+                else:
+                    results[n] = _present(known, explain, self.db_hash, self._symbols.ids)
+                    if recorder is not None: recorder.lookup(time.perf_counter() - started)
+
+        solver = DosageSolver() # One warm-started dosage solver for the whole batch
+        # Chunk rows so the profiles x plants relevance block stays bounded on large catalogs
+        for start in range(0, len(pending), self.BATCH_CHUNK):
+            chunk = pending[start:start + self.BATCH_CHUNK]
+            started = time.perf_counter()
+            relevance = self._priority_weights([profiles[n] for n in chunk]) @ self._score_matrix.T
+            scoring = (time.perf_counter() - started) / len(chunk) # Each row's share of the product
+            masks = list(dict.fromkeys(profiles[n].mask for n in chunk
+                                       if self.safety_cache is None or profiles[n].mask not in self.safety_cache))
+            screened = dict(zip(masks, self._exclusions.screen(masks)[1])) if masks else {}
+            for row, n in enumerate(chunk):
+                probe = recorder.probe() if recorder is not None else None
+                if probe: probe.account('scoring', scoring)
+                states = _RequestStates(self, relevance[row].tolist())
+                result = self._formulate(profiles[n], states, probe, solver, screened.get(profiles[n].mask))
+                if probe: probe.finish()
+                if self.cache is not None: self.cache.put(keys[n], self.db_hash, result)
+                results[n] = _present(result, explain, self.db_hash, self._symbols.ids)
+        return results
+
+    def _lookup(self, key: Tuple) -> Optional[Dict[str, Any]]:
+        """Precompiled table first, then the LRU cache. Returned formulas are shared."""
+        if self.table is not None:
+            result = self.table.get(key)
+            if result is not None: return result
+        if self.cache is not None:
+            return self.cache.get(key, self.db_hash)
+        return None
+
+    def _build_profile(self, profile_dict: Dict[str, Any]) -> UserProfile:
         profile = UserProfile(
-            priorities=profile_dict.get('priorities', []),
+            priorities=list(profile_dict.get('priorities', [])),
             conditions=profile_dict.get('conditions', {}).copy(),
             anxiety_level=profile_dict.get('anxiety_level', 0),
             insomnia_level=profile_dict.get('insomnia_level', 0),
@@ -162,117 +1096,377 @@ class HerbalFormulator:
         if profile.anxiety_level >= 5: profile.conditions['active_anxiety'] = True
         if profile.insomnia_level >= 7: profile.conditions['insomnia'] = True
         if profile.stress_level >= 7: profile.conditions['high_stress'] = True
-        
-        # 1. Base Scoring
-        scored = self._score_plants(profile)
-        
-        # 2. Safety Filtering & Conditional Limits
-        safe = []
-        for p in scored:
-            if ConstraintEngine.check_safety(p, profile):
-                ConstraintEngine.apply_conditional_limits(p, profile)
-                if not p.final_role: p.final_role = p.role
-                safe.append(p)
-            else:
-                logging.info(f"Safety Exclusion: {p.name} - {p.exclusion_reason}")
-        
+        self._intern(profile)
+        return profile
+
+    def _intern(self, profile: UserProfile):
+        """Encodes the profile's priorities and conditions once; every later stage reads the codes."""
+        profile.axes = self._symbols.axis_codes(profile.priorities)
+        profile.mask = self._symbols.condition_mask(profile.conditions)
+
+    def _canonical_key(self, profile: UserProfile) -> Tuple:
+        """
+        Everything the pipeline output depends on, after threshold auto-mapping, as interned
+        codes: the multiset of known priority axes (profile.axes), the active conditions that
+        some rule references (profile.mask) and the truth value of every interaction condition.
+        """
+        return profile.axes, profile.mask, tuple(predicate(profile) for predicate in self._interactions.predicates)
+
+    def _formulate(self, profile: UserProfile, states: '_RequestStates', probe: Optional[Probe] = None,
+                   solver: Optional[DosageSolver] = None, excluded: Optional[Dict[int, str]] = None) -> Dict[str, Any]:
+        """
+        Pipeline stages 2-5 over the stage-1 scores (states are created on first touch).
+        A probe, when given, is marked at the end of every stage; a solver carries the
+        dosage warm start from one formula of a batch to the next, and `excluded` the
+        batch's screened exclusions for this profile's mask.
+        """
+        # 2. Safety Filtering & Conditional Limits (only rules of active conditions are visited)
+        safety = self._safety(profile, states, probe, excluded)
+        if probe: probe.stage('safety')
+        return self._compose(profile, states, safety.excluded, safety.shifted, probe, solver)
+
+    def safe_mask(self, profile_dicts: List[Dict[str, Any]]) -> np.ndarray:
+        """profiles x plants boolean matrix: False where a plant is excluded for that profile's conditions."""
+        masks = [self._build_profile(d).mask for d in profile_dicts]
+        return ~self._exclusions.unsafe(masks)
+
+    def screen_safety(self, profile_dicts: List[Dict[str, Any]]) -> Tuple[np.ndarray, List[Dict[int, str]]]:
+        """safe_mask plus, per profile, {plant index: excluding condition} (see ExclusionMatrix.screen)."""
+        unsafe, exclusions = self._exclusions.screen([self._build_profile(d).mask for d in profile_dicts])
+        return ~unsafe, exclusions
+
+    def _safety(self, profile: UserProfile, states: '_RequestStates', probe: Optional[Probe] = None,
+                excluded: Optional[Dict[int, str]] = None) -> SafetySnapshot:
+        """
+        Stage 2 on fresh states, memoized per condition bitmask: a cached SafetySnapshot is
+        replayed onto the states instead of visiting the rules. `excluded` is the mask's
+        screened exclusion map, if the caller has it. Returns the stage's snapshot.
+        """
+        mask = profile.mask
+        snapshot = self.safety_cache.get(mask) if self.safety_cache is not None else None
+        if snapshot is None:
+            excluded, shifted = ConstraintEngine.apply_condition_index(self._condition_index, states, profile, probe, excluded)
+            snapshot = SafetySnapshot.capture(states, excluded, shifted)
+            if self.safety_cache is not None: self.safety_cache.put(mask, snapshot)
+            return snapshot
+        if probe:
+            for event in snapshot.trace:
+                if event.kind == 'exclude': probe.exclusion(event.condition)
+        snapshot.apply(states)
+        return snapshot
+
+    def _compose(self, profile: UserProfile, states: '_RequestStates', excluded: Dict[int, str], shifted: Set[int],
+                 probe: Optional[Probe] = None, solver: Optional[DosageSolver] = None) -> Dict[str, Any]:
+        """Pipeline stages 3-5 over scored states that have been through the safety stage."""
         # 3. Selection (Composition)
-        composition_map = self._select_composition(safe, profile)
+        composition_map = self._select_composition(states, excluded, shifted, profile)
         # Flatten for formula processing
-        selected_plants = []
-        for list_p in composition_map.values(): selected_plants.extend(list_p)
+        selected = []
+        for list_s in composition_map.values(): selected.extend(list_s)
+        if probe: probe.stage('selection')
 
         # 4. Phase 2: Apply Synergies and Check Antagonisms on selected set
-        selected_plants = self._apply_synergies(selected_plants, profile)
-        selected_plants = ConstraintEngine.check_antagonisms(selected_plants, profile)
+        selected = self._apply_synergies(selected, profile)
+        if probe: probe.stage('synergies')
+        selected = ConstraintEngine.check_antagonisms(selected, profile, self._interactions, probe)
+        if probe: probe.stage('antagonisms')
 
         # 5. Dosage Calculation
-        final_formula = self._calculate_dosages(selected_plants, profile)
+        final_formula, status = self._calculate_dosages(selected, profile, solver)
+        if probe: probe.stage('dosing')
         
-        return self._format_output(final_formula)
+        result = self._format_output(final_formula, status, states.trace)
+        if probe: probe.stage('formatting')
+        return result
+
+    def _new_state(self, i: int, score: float, trace: List[TraceEvent]) -> PlantState:
+        return PlantState(plant=Plant(self.db, i), index=i, relevance_score=score, final_role=self._roles[i],
+                          max_percent=self._max_percent[i], min_percent=self._min_percent[i], trace=trace)
 
-    def _score_plants(self, profile: UserProfile) -> List[Plant]:
-        for plant in self.db:
-            score = 0
-            for prio in profile.priorities:
-                score += plant.scores.get(prio, 0)
-            plant.relevance_score = float(score)
-        return sorted(self.db, key=lambda x: x.relevance_score, reverse=True)
+    def _priority_weights(self, profiles: List[UserProfile]) -> np.ndarray:
+        """profiles x axes matrix counting each known priority axis."""
+        weights = np.zeros((len(profiles), len(self._axes)))
+        for row, profile in enumerate(profiles):
+            for col in profile.axes: weights[row, col] += 1
+        return weights
 
-    def _apply_synergies(self, selected: List[Plant], profile: UserProfile) -> List[Plant]:
+    def _score_plants(self, profile: UserProfile) -> '_RequestStates':
+        """Stage 1: base relevance of every plant (one matrix-vector product)."""
+        scores = self._score_matrix @ self._priority_weights([profile])[0]
+        return _RequestStates(self, scores.tolist())
+
+    def _apply_synergies(self, selected: List[PlantState], profile: UserProfile) -> List[PlantState]:
         """Phase 2: Positive Combinations (Synergies)."""
-        ids = {p.id for p in selected}
-        for p in selected:
-            for syn in p.synergies:
-                if syn.get('with') in ids:
-                    # Apply bonus
-                    bonus = syn.get('bonus', 0)
-                    p.relevance_score += bonus
-                    p.adjustment_reason = str(p.adjustment_reason or "") + f" Synergy bonus +{bonus}"
+        by_index = {s.index: s for s in selected}
+        for syn in InteractionIndex.gather(self._interactions.synergies, by_index, profile):
+            s = by_index[syn.source]
+            s.relevance_score += syn.weight
+            s.trace.append(TraceEvent('synergy', syn.source, syn.partner, syn.weight, syn.condition))
         return selected
 
-    def _select_composition(self, ranked_plants: List[Plant], profile: UserProfile) -> Dict[str, List[Plant]]:
-        selection = {"primary": [], "secondary": [], "support": []}
-        candidates = [p for p in ranked_plants if p.relevance_score > 0]
-        
-        # Primary (1-2)
-        primary_candidates = [p for p in candidates if p.final_role == 'primary']
-        if primary_candidates:
-            selection['primary'].append(primary_candidates[0])
-            if len(primary_candidates) > 1: selection['primary'].append(primary_candidates[1])
-                
-        # Secondary (2-3)
-        secondary_candidates = [p for p in candidates if p.final_role == 'secondary']
-        for p in secondary_candidates:
-            if len(selection['secondary']) < 3: selection['secondary'].append(p)
-        
-        # Support (Max 2, Total Max 5)
-        support_candidates = [p for p in candidates if p.final_role == 'support']
-        for p in support_candidates:
-             current_total = sum(len(v) for v in selection.values())
-             if current_total < 5 and len(selection['support']) < 2:
-                 selection['support'].append(p)
-
-        return selection
-
-    def _calculate_dosages(self, all_plants: List[Plant], profile: UserProfile) -> List[Plant]:
-        """Assigns percentages based on roles and constraints."""
-        primaries = [p for p in all_plants if p.final_role == 'primary']
-        secondaries = [p for p in all_plants if p.final_role == 'secondary']
-        supports = [p for p in all_plants if p.final_role == 'support']
-        
-        if len(primaries) == 1: primaries[0].final_percent = 40.0
-        elif len(primaries) == 2:
-            for p in primaries: p.final_percent = 30.0
-            
-        for p in secondaries: p.final_percent = 20.0
-        for p in supports: p.final_percent = 10.0
-            
-        # Apply Caps
-        for p in all_plants:
-            if p.final_percent > p.max_percent: p.final_percent = p.max_percent
-
-        # Family Limits
-        all_plants = ConstraintEngine.validate_family_limits(all_plants)
-        
-        # Normalize
-        total = sum(p.final_percent for p in all_plants)
-        if total > 100:
-            ratio = 100 / total
-            for p in all_plants: p.final_percent *= ratio
-        return all_plants
-
-    def _format_output(self, plants: List[Plant]) -> Dict[str, Any]:
+    def _select_composition(self, states: '_RequestStates', excluded: Dict[int, str], shifted: Set[int],
+                            profile: UserProfile) -> Dict[int, List[PlantState]]:
+        """
+        Top-k per role over the load-time role partitions (O(n log k), no full sort), then
+        CompositionSearch over the per-role candidates in case synergies, antagonisms or
+        family limits make another set better. Plants moved by a set_role rule are taken
+        out of their base partition and offered to the one they were shifted into. Keyed by
+        role code, in ROLE_LIMITS order.
+        """
+        greedy = {}
+        roles = []
+        scores = states.scores
+        remaining = self.MAX_PLANTS
+        for code, role, limit in self._role_limits:
+            pool = [i for i in self._role_partitions[code] if i not in excluded and i not in shifted]
+            pool.extend(i for i in shifted if states[i].final_role == code)
+            positive = [i for i in pool if scores[i] > 0]
+            k = min(limit, remaining)
+            # Equal scores keep catalog order, as the previous stable sort did
+            best = heapq.nlargest(k, positive, key=lambda i: (scores[i], -i)) if k > 0 else []
+            greedy[code] = best
+            roles.append((self._search_candidates(positive, best, scores), len(best)))
+            remaining -= len(best)
+        if self.search_budget > 0: greedy = self._search_composition(roles, greedy, states, profile)
+        return {code: [states[i] for i in chosen] for code, chosen in greedy.items()}
+
+    def _search_candidates(self, positive: List[int], best: List[int], scores: List[float]) -> List[int]:
+        """A role's greedy picks, the next SEARCH_WIDTH by relevance and up to SEARCH_WIDTH that synergies could lift past the last pick."""
+        if not best or self.search_budget <= 0: return best
+        bonus = self._max_bonus
+        floor = scores[best[-1]]
+        candidates = heapq.nlargest(len(best) + self.SEARCH_WIDTH, positive, key=lambda i: (scores[i], -i))
+        candidates += heapq.nlargest(self.SEARCH_WIDTH, (i for i in positive if scores[i] + bonus[i] > floor),
+                                     key=lambda i: (scores[i] + bonus[i], -i))
+        return list(dict.fromkeys(candidates))
+
+    def _search_composition(self, roles: List[Tuple[List[int], int]], greedy: Dict[int, List[int]],
+                            states: '_RequestStates', profile: UserProfile) -> Dict[int, List[int]]:
+        """Runs CompositionSearch unless no interaction or family term can change the greedy selection."""
+        scores = states.scores
+        candidates = [i for pool, _ in roles for i in pool]
+        members = set(candidates)
+        pairs: Dict[int, Dict[int, float]] = {}
+        forbidden: Dict[int, Set[int]] = {}
+        for table in (self._interactions.synergies, self._interactions.antagonisms):
+            for i in candidates:
+                for j, links in table.row(i).items():
+                    if j not in members or j == i: continue
+                    for link in links:
+                        if link.predicate is not None and not link.predicate(profile): continue
+                        if link.action == 'exclude':
+                            forbidden.setdefault(i, set()).add(j)
+                            forbidden.setdefault(j, set()).add(i)
+                            continue
+                        weight = link.weight if link.action == 'bonus' else -link.weight
+                        total = pairs.setdefault(i, {}).get(j, 0.0) + weight
+                        pairs[i][j] = pairs.setdefault(j, {})[i] = total
+        family = {}
+        for i in candidates:
+            hi = min(states[i].max_percent, self._plant_caps[i])
+            family[i] = (self._family_codes[i], min(states[i].min_percent, hi), hi, self._family_caps[self._family_codes[i]])
+        search = CompositionSearch(roles, scores, pairs, forbidden, family, self.search_budget)
+        incumbent = [i for chosen in greedy.values() for i in chosen]
+        if not pairs and not forbidden and search.value(incumbent) is not None: return greedy
+        chosen = set(search.run(incumbent))
+        return {code: sorted((i for i in pool if i in chosen), key=lambda i: (-scores[i], i))
+                for (code, _, _), (pool, _) in zip(self._role_limits, roles)}
+
+    def _calculate_dosages(self, selected: List[PlantState], profile: UserProfile,
+                           solver: Optional[DosageSolver] = None) -> Tuple[List[PlantState], str]:
+        """
+        Role targets (a lone primary 40%, two primaries 30% each, secondaries 20%, supports
+        10%) projected by DosageSolver onto each plant's min/max percent, its static `cap`
+        and conditional caps, and the family caps, summing to 100%. Returns the states and
+        the solver status; when the minimums cannot be met the status is INFEASIBLE and the
+        doses are solved without them.
+        """
+        ids = self._symbols.ids
+        primaries = sum(1 for s in selected if s.final_role == _PRIMARY)
+        targets = [(40.0 if primaries == 1 else 30.0) if s.final_role == _PRIMARY else
+                   20.0 if s.final_role == _SECONDARY else 10.0 for s in selected]
+        plant_caps = self._plant_caps
+        hi = [min(s.max_percent, plant_caps[s.index]) for s in selected]
+        lo = [min(s.min_percent, h) for s, h in zip(selected, hi)]
+        families = [self._family_codes[s.index] for s in selected]
+        caps = {f: self._family_caps[f] for f in families}
+        solver = solver or DosageSolver()
+        try:
+            percents, status = solver.solve(targets, lo, hi, families, caps, names=lambda k: ids[selected[k].index])
+        except DosageInfeasible as e:
+            logging.info("Dosage infeasible: %s", e)
+            percents, status = solver.solve(targets, [0.0] * len(selected), hi, families, caps)[0], INFEASIBLE
+        for s, percent in zip(selected, percents): s.final_percent = percent
+        return selected, status
+
+    def _format_output(self, selected: List[PlantState], status: str, trace: List[TraceEvent]) -> Dict[str, Any]:
+        """
+        Internal formula. Component ids, names and role labels are decoded from their codes
+        here; the trace rides along unrendered, by plant index, for _present to decode under
+        explain. Nothing before this stage turns a code back into a string.
+        """
+        ids, names, labels = self._symbols.ids, self.db.names, self._role_labels
         return {
             "total_grams": 4.0,
+            "dosing": status,
             "components": [
                 {
-                    "name": p.name,
-                    "role": p.final_role.capitalize(),
-                    "percent": round(p.final_percent, 1),
-                    "grams": round((p.final_percent / 100) * 4.0, 2),
-                    "reason": p.adjustment_reason.strip() if p.adjustment_reason else None
+                    "id": ids[s.index],
+                    "name": names[s.index],
+                    "role": labels[s.final_role],
+                    "percent": round(s.final_percent, 1),
+                    "grams": round((s.final_percent / 100) * 4.0, 2),
                 }
-                for p in plants
-            ]
+                for s in selected
+            ],
+            "trace": tuple(trace),
         }
+
+# --- Incremental Sessions ---
+
+class FormulaSession:
+    """
+    One evolving profile (e.g. a Streamlit session) formulated incrementally. update(**changes)
+    merges profile fields and recomputes only the stages whose inputs changed: scoring depends
+    on the multiset of known priorities, the safety stage on the active rule conditions (after
+    threshold auto-mapping), and selection through dosing on both plus the interaction
+    conditions. A change that leaves the canonical key as it was (a slider moved without
+    crossing a threshold) reuses the previous formula outright. With a ReloadingFormulator
+    every update runs on its current snapshot, and a swapped catalog starts over.
+    """
+    FIELDS = {'priorities', 'conditions', 'anxiety_level', 'insomnia_level', 'stress_level'}
+
+    def __init__(self, engine: Union[HerbalFormulator, 'ReloadingFormulator'], profile: Optional[Dict[str, Any]] = None,
+                 explain: bool = False):
+        self.engine = engine
+        self.explain = explain
+        self.profile: Dict[str, Any] = {}
+        self.runs = {"scoring": 0, "safety": 0, "composition": 0, "reused": 0} # Stage executions so far
+        self._bind(None)
+        if profile: self.update(**profile)
+
+    def _bind(self, snapshot: Optional[HerbalFormulator]):
+        """Drops every memoized stage; they belong to one catalog snapshot."""
+        self._snapshot = snapshot
+        self._key = None
+        self._result = None
+        self._scores_key = self._scores = None
+        self._safety_key = self._safety = None
+
+    def update(self, **changes) -> Dict[str, Any]:
+        """Applies profile field changes and returns the formula (as generate_formula would)."""
+        unknown = set(changes) - self.FIELDS
+        if unknown: raise TypeError(f"unknown profile fields: {', '.join(sorted(unknown))}")
+        self.profile.update(changes)
+        engine = self.engine.snapshot()
+        if engine is not self._snapshot: self._bind(engine)
+        profile = engine._build_profile(self.profile)
+        key = engine._canonical_key(profile)
+        if key == self._key:
+            self.runs["reused"] += 1
+        else:
+            result = engine._lookup(key)
+            if result is None:
+                result = self._formulate(profile, key)
+                if engine.cache is not None: engine.cache.put(key, engine.db_hash, result)
+            self._key, self._result = key, result
+        return _present(self._result, self.explain, engine.db_hash, engine._symbols.ids)
+
+    def _formulate(self, profile: UserProfile, key: Tuple) -> Dict[str, Any]:
+        engine = self._snapshot
+        if key[0] != self._scores_key:
+            self._scores_key, self._scores = key[0], engine._score_plants(profile).scores
+            self.runs["scoring"] += 1
+        states = _RequestStates(engine, self._scores)
+        if key[1] != self._safety_key:
+            self._safety_key, self._safety = key[1], engine._safety(profile, states)
+            self.runs["safety"] += 1
+        else:
+            self._safety.apply(states)
+        excluded, shifted = self._safety.excluded, self._safety.shifted
+        self.runs["composition"] += 1
+        return engine._compose(profile, states, excluded, shifted)
+
+# --- Hot Reload ---
+
+class ReloadingFormulator:
+    """
+    HerbalFormulator that picks up catalog edits without a restart. The serving engine is an
+    immutable snapshot: reload() builds a complete new HerbalFormulator (catalog, indices,
+    formula table) off the request path and swaps it in with a single reference assignment.
+    Each request binds the snapshot once, so requests in flight finish on the version they
+    started with and later ones see the new one; every formula names its snapshot in
+    "catalog_version". With an interval, a daemon thread polls the file's mtime and size and
+    reloads on change. A catalog that fails to load is logged and the current snapshot keeps
+    serving. Other attributes (db, db_hash, metrics(), ...) are those of the current snapshot.
+    """
+
+    def __init__(self, db_path: str, interval: Optional[float] = None, **engine_args):
+        self.db_path = db_path
+        self.engine_args = engine_args # HerbalFormulator keyword arguments (cache, recorder, ...), shared by snapshots
+        self.table_path = None
+        self.reloads = 0 # Snapshots swapped in after the first
+        self.errors = 0 # Reloads that failed to build
+        self._lock = threading.Lock() # One build at a time
+        self._stat = self._file_stat()
+        self._engine = HerbalFormulator(db_path, **engine_args)
+        self._stop = threading.Event()
+        self._watcher = None
+        if interval:
+            self._watcher = threading.Thread(target=self._watch, args=(interval,), name="catalog-watcher", daemon=True)
+            self._watcher.start()
+
+    def snapshot(self) -> HerbalFormulator:
+        return self._engine
+
+    def generate_formula(self, profile_dict: Dict[str, Any], explain: bool = False) -> Dict[str, Any]:
+        return self._engine.generate_formula(profile_dict, explain)
+
+    def generate_formulas(self, profile_dicts: List[Dict[str, Any]], explain: bool = False) -> List[Dict[str, Any]]:
+        return self._engine.generate_formulas(profile_dicts, explain)
+
+    def load_formula_table(self, path: str):
+        """As HerbalFormulator.load_formula_table; later snapshots load it too while it matches their catalog."""
+        self._engine.load_formula_table(path)
+        self.table_path = path
+
+    def reload(self) -> bool:
+        """Rebuilds from db_path and swaps the new snapshot in; False if the catalog content is unchanged."""
+        with self._lock:
+            self._stat = self._file_stat()
+            engine = HerbalFormulator(self.db_path, **self.engine_args)
+            if engine.db_hash == self._engine.db_hash: return False
+            if self.table_path is not None:
+                try:
+                    engine.load_formula_table(self.table_path)
+                except (OSError, ValueError) as e:
+                    logging.warning("Formula table not reloaded: %s", e)
+            self._engine = engine
+            self.reloads += 1
+        logging.info("Catalog reloaded: version %s", engine.db_hash[:12])
+        return True
+
+    def close(self):
+        """Stops the watcher thread."""
+        self._stop.set()
+        if self._watcher is not None: self._watcher.join()
+
+    def __getattr__(self, name: str):
+        if name == '_engine': raise AttributeError(name) # Not built yet
+        return getattr(self._engine, name)
+
+    def _file_stat(self) -> Optional[Tuple[int, int]]:
+        try:
+            stat = os.stat(self.db_path)
+        except OSError:
+            return None
+        return stat.st_mtime_ns, stat.st_size
+
+    def _watch(self, interval: float):
+        while not self._stop.wait(interval):
+            if self._file_stat() == self._stat: continue
+            try:
+                self.reload()
+            except Exception as e: # A half-written or invalid catalog: keep serving, retry on the next change
+                self.errors += 1
+                logging.error("Catalog reload failed, still serving %s: %s", self._engine.db_hash[:12], e)
@@ -0,0 +1,150 @@
+"""
+Opt-in pipeline instrumentation for HerbalFormulator.
+
+Pass a MetricsRecorder to the engine (HerbalFormulator(db, recorder=MetricsRecorder())) and
+every computed formula records the duration of each pipeline stage into a fixed-bucket
+histogram, plus counters of safety exclusions per condition and antagonism hits per plant
+pair. A request collects its observations locally (a Probe) and publishes them under one
+lock acquisition when it finishes. Without a recorder the engine skips all of this behind a
+single None check per stage.
+
+engine.metrics() returns a plain-dict snapshot; render_prometheus() turns one into the
+Prometheus text exposition format.
+"""
+import threading
+import time
+from bisect import bisect_left
+from typing import Dict, Any, List, Tuple
+
+STAGES = ("scoring", "safety", "selection", "synergies", "antagonisms", "dosing", "formatting")
+# Upper bounds in seconds, 1us .. 1s in 1-2.5-5 steps
+BUCKETS = tuple(float(f"{m}e{e}") for e in range(-6, 0) for m in (1, 2.5, 5)) + (1.0,)
+
+class Histogram:
+    __slots__ = ('counts', 'sum', 'count')
+
+    def __init__(self):
+        self.counts = [0] * (len(BUCKETS) + 1) # Last slot is +Inf
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        self.counts[bisect_left(BUCKETS, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def snapshot(self) -> Dict[str, Any]:
+        cumulative = []
+        total = 0
+        for bound, n in zip(BUCKETS + (float('inf'),), self.counts):
+            total += n
+            cumulative.append([bound, total])
+        return {"count": self.count, "sum": self.sum, "buckets": cumulative}
+
+class Probe:
+    """Per-request collector. stage(name) closes the stage that started at the previous mark."""
+    __slots__ = ('recorder', 'start', 'last', 'stages', 'exclusions', 'antagonisms')
+
+    def __init__(self, recorder: 'MetricsRecorder'):
+        self.recorder = recorder
+        self.start = self.last = time.perf_counter()
+        self.stages = []
+        self.exclusions = []
+        self.antagonisms = []
+
+    def stage(self, name: str):
+        now = time.perf_counter()
+        self.stages.append((name, now - self.last))
+        self.last = now
+
+    def account(self, name: str, seconds: float):
+        """A stage measured elsewhere (a row's share of batch scoring); counts toward the request total."""
+        self.stages.append((name, seconds))
+        self.start -= seconds
+
+    def exclusion(self, condition: str):
+        self.exclusions.append(condition)
+
+    def antagonism(self, plant_id: str, partner_id: str, action: str):
+        self.antagonisms.append((plant_id, partner_id, action))
+
+    def finish(self):
+        self.recorder._publish(self, time.perf_counter() - self.start)
+
+class MetricsRecorder:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def probe(self) -> Probe:
+        return Probe(self)
+
+    def reset(self):
+        with self._lock:
+            self.requests = 0
+            self.lookups = 0 # Requests answered by the formula table or cache
+            self.stages = {name: Histogram() for name in STAGES + ("request",)}
+            self.exclusions: Dict[str, int] = {}
+            self.antagonisms: Dict[Tuple[str, str, str], int] = {}
+
+    def _publish(self, probe: Probe, total: float):
+        with self._lock:
+            self.requests += 1
+            self.stages["request"].observe(total)
+            for name, seconds in probe.stages: self.stages[name].observe(seconds)
+            for condition in probe.exclusions:
+                self.exclusions[condition] = self.exclusions.get(condition, 0) + 1
+            for pair in probe.antagonisms:
+                self.antagonisms[pair] = self.antagonisms.get(pair, 0) + 1
+
+    def lookup(self, seconds: float):
+        """A request answered without running the pipeline."""
+        with self._lock:
+            self.requests += 1
+            self.lookups += 1
+            self.stages["request"].observe(seconds)
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "requests": self.requests,
+                "lookups": self.lookups,
+                "stages": {name: h.snapshot() for name, h in self.stages.items()},
+                "exclusions": dict(self.exclusions),
+                "antagonisms": [{"plant": p, "partner": q, "action": a, "count": n}
+                                for (p, q, a), n in sorted(self.antagonisms.items())],
+            }
+
+def _label(value: str) -> str:
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+def _number(value: float) -> str:
+    return "+Inf" if value == float('inf') else repr(float(value)) if isinstance(value, float) else str(value)
+
+def render_prometheus(snapshot: Dict[str, Any], prefix: str = "herbal") -> str:
+    """Prometheus text exposition (version 0.0.4) of a MetricsRecorder snapshot."""
+    lines: List[str] = [
+        f"# HELP {prefix}_requests_total Formulas requested.",
+        f"# TYPE {prefix}_requests_total counter",
+        f"{prefix}_requests_total {snapshot['requests']}",
+        f"# HELP {prefix}_lookups_total Formulas answered from the formula table or cache.",
+        f"# TYPE {prefix}_lookups_total counter",
+        f"{prefix}_lookups_total {snapshot['lookups']}",
+        f"# HELP {prefix}_stage_seconds Duration of formulation pipeline stages (stage=\"request\" is end to end).",
+        f"# TYPE {prefix}_stage_seconds histogram",
+    ]
+    for stage, h in snapshot["stages"].items():
+        for bound, count in h["buckets"]:
+            lines.append(f'{prefix}_stage_seconds_bucket{{stage="{_label(stage)}",le="{_number(bound)}"}} {count}')
+        lines.append(f'{prefix}_stage_seconds_sum{{stage="{_label(stage)}"}} {_number(h["sum"])}')
+        lines.append(f'{prefix}_stage_seconds_count{{stage="{_label(stage)}"}} {h["count"]}')
+    lines += [f"# HELP {prefix}_safety_exclusions_total Plants excluded by safety rules, per condition.",
+              f"# TYPE {prefix}_safety_exclusions_total counter"]
+    for condition, count in sorted(snapshot["exclusions"].items()):
+        lines.append(f'{prefix}_safety_exclusions_total{{condition="{_label(condition)}"}} {count}')
+    lines += [f"# HELP {prefix}_antagonisms_total Antagonism penalties and exclusions applied, per plant pair.",
+              f"# TYPE {prefix}_antagonisms_total counter"]
+    for a in snapshot["antagonisms"]:
+        lines.append(f'{prefix}_antagonisms_total{{plant="{_label(a["plant"])}",partner="{_label(a["partner"])}",'
+                     f'action="{_label(a["action"])}"}} {a["count"]}')
+    return "\n".join(lines) + "\n"
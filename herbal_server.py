@@ -0,0 +1,268 @@
+"""
+Asyncio HTTP front end for HerbalFormulator (standard library only).
+
+    POST /formula           profile JSON object             -> formula
+    POST /formulas:batch    {"profiles": [profile, ...]}    -> {"formulas": [formula, ...]}
+    GET  /health                                            -> admission counters
+
+The event loop only parses and routes; generate_formula is CPU-bound and runs on a process
+pool (default) or a thread pool sharing one engine. Admission is bounded instead of queueing
+without limit: at most max_queue interactive requests (running or waiting for a worker) and
+max_batches batches are admitted at once, and anything beyond that is answered 503 with
+Retry-After straight away. A batch is submitted to the pool one chunk at a time, so each
+admitted batch holds at most one worker and interactive requests interleave with its chunks;
+with workers > max_batches a slow batch can never take every worker.
+
+Every formula carries the "catalog_version" of the catalog that computed it. With
+--reload-interval each engine watches the catalog file and swaps in a rebuilt snapshot when
+it changes (see ReloadingFormulator); requests in flight finish on the old one.
+
+    python herbal_server.py --db plants_db.json --port 8080 --workers 4 --executor process
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Dict, Any, List, Optional, Tuple
+
+from herbal_engine import HerbalFormulator, FormulaCache, ReloadingFormulator
+
+REASONS = {200: "OK", 400: "Bad Request", 404: "Not Found", 405: "Method Not Allowed", 411: "Length Required",
+           413: "Payload Too Large", 431: "Request Header Fields Too Large", 500: "Internal Server Error", 503: "Service Unavailable"}
+MAX_HEADERS = 100
+
+logger = logging.getLogger("herbal_server")
+
+class HTTPError(Exception):
+    def __init__(self, status: int, message: str):
+        super().__init__(message)
+        self.status = status
+
+# --- Worker side (one engine per pool process, or one shared by all threads) ---
+
+_engine = None
+
+def _init_worker(db_path: str, cache_size: int, reload_interval: float = 0.0):
+    global _engine
+    logging.disable(logging.INFO)
+    cache = FormulaCache(cache_size) if cache_size else None
+    if reload_interval: _engine = ReloadingFormulator(db_path, interval=reload_interval, cache=cache)
+    else: _engine = HerbalFormulator(db_path, cache=cache)
+
+def _formula(profile: Dict[str, Any]) -> Dict[str, Any]:
+    try:
+        return _engine.generate_formula(profile)
+    except (TypeError, ValueError, AttributeError, KeyError) as e:
+        raise ValueError(f"invalid profile: {e}") from None
+
+def _formulas(profiles: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    try:
+        return _engine.generate_formulas(profiles)
+    except (TypeError, ValueError, AttributeError, KeyError) as e:
+        raise ValueError(f"invalid profile: {e}") from None
+
+# --- Service ---
+
+class FormulaServer:
+    def __init__(self, db_path: str, executor: str = "process", workers: int = 0, max_queue: int = 64,
+                 max_batches: int = 2, batch_chunk: int = 64, max_batch_size: int = 10000,
+                 max_body: int = 8 * 1024 * 1024, cache_size: int = 4096, reload_interval: float = 0.0):
+        self.db_path = db_path
+        self.executor = executor
+        self.workers = workers or os.cpu_count() or 1
+        self.max_queue = max_queue
+        self.max_batches = max_batches
+        self.batch_chunk = batch_chunk
+        self.max_batch_size = max_batch_size
+        self.max_body = max_body
+        self.cache_size = cache_size
+        self.reload_interval = reload_interval # Seconds between catalog file checks; 0 never reloads
+        self.pending = 0 # Admitted interactive requests
+        self.batches = 0 # Admitted batches
+        self.shed = 0 # Requests answered 503
+        self._pool: Optional[Executor] = None
+        self._server: Optional[asyncio.base_events.Server] = None
+
+    async def start(self, host: str = "127.0.0.1", port: int = 8080) -> asyncio.base_events.Server:
+        if self.executor == "process":
+            self._pool = ProcessPoolExecutor(max_workers=self.workers, initializer=_init_worker,
+                                             initargs=(self.db_path, self.cache_size, self.reload_interval))
+        elif self.executor == "thread":
+            _init_worker(self.db_path, self.cache_size, self.reload_interval) # The engine is re-entrant; threads share it
+            self._pool = ThreadPoolExecutor(max_workers=self.workers)
+        else:
+            raise ValueError(f"unknown executor {self.executor!r} (expected 'process' or 'thread')")
+        self._server = await asyncio.start_server(self._handle, host, port)
+        return self._server
+
+    async def close(self):
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+        if self._pool is not None:
+            self._pool.shutdown(wait=True)
+
+    @property
+    def port(self) -> int:
+        return self._server.sockets[0].getsockname()[1]
+
+    # --- HTTP ---
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            while True:
+                try:
+                    request = await self._read_request(reader)
+                except HTTPError as e: # The stream position is unknown: answer and drop the connection
+                    self._write(writer, e.status, {"error": str(e)}, keep_alive=False)
+                    await writer.drain()
+                    break
+                if request is None: break
+                method, path, version, headers, body = request
+                status, payload = await self._route(method, path, body)
+                connection = headers.get("connection", "").lower()
+                keep_alive = connection == "keep-alive" if version == "HTTP/1.0" else connection != "close"
+                self._write(writer, status, payload, keep_alive)
+                await writer.drain()
+                if not keep_alive: break
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    @staticmethod
+    async def _readline(reader: asyncio.StreamReader, status: int, what: str) -> bytes:
+        """reader.readline(), with a line past the stream limit answered as `status`."""
+        try:
+            return await reader.readline()
+        except (ValueError, asyncio.LimitOverrunError): # readline wraps LimitOverrunError in ValueError
+            raise HTTPError(status, f"{what} is too long") from None
+
+    async def _read_request(self, reader: asyncio.StreamReader) -> Optional[Tuple[str, str, str, Dict[str, str], bytes]]:
+        line = await self._readline(reader, 400, "request line")
+        if not line: return None
+        try:
+            method, path, version = line.decode("latin-1").split()
+        except ValueError:
+            raise HTTPError(400, "malformed request line") from None
+        headers = {}
+        while True:
+            line = await self._readline(reader, 431, "header line")
+            if line in (b"\r\n", b"\n", b""): break
+            if len(headers) >= MAX_HEADERS: raise HTTPError(400, "too many headers")
+            name, _, value = line.decode("latin-1").partition(":")
+            headers[name.strip().lower()] = value.strip()
+        if "chunked" in headers.get("transfer-encoding", "").lower():
+            raise HTTPError(411, "chunked bodies are not supported; send Content-Length")
+        try:
+            length = int(headers.get("content-length", 0))
+        except ValueError:
+            raise HTTPError(400, "invalid Content-Length") from None
+        if length > self.max_body: raise HTTPError(413, f"body exceeds {self.max_body} bytes")
+        body = await reader.readexactly(length) if length else b""
+        return method.upper(), path.split("?", 1)[0], version.upper(), headers, body
+
+    def _write(self, writer: asyncio.StreamWriter, status: int, payload: Any, keep_alive: bool):
+        body = json.dumps(payload).encode("utf-8")
+        head = [f"HTTP/1.1 {status} {REASONS.get(status, '')}", "Content-Type: application/json",
+                f"Content-Length: {len(body)}", f"Connection: {'keep-alive' if keep_alive else 'close'}"]
+        if status == 503: head.append("Retry-After: 1")
+        writer.write(("\r\n".join(head) + "\r\n\r\n").encode("latin-1") + body)
+
+    # --- Routing ---
+
+    async def _route(self, method: str, path: str, body: bytes) -> Tuple[int, Any]:
+        routes = {"/formula": ("POST", self._formula), "/formulas:batch": ("POST", self._batch),
+                  "/health": ("GET", self._health)}
+        try:
+            if path not in routes: raise HTTPError(404, f"no route for {path}")
+            allowed, handler = routes[path]
+            if method != allowed: raise HTTPError(405, f"{path} only accepts {allowed}")
+            return 200, await handler(body)
+        except HTTPError as e:
+            return e.status, {"error": str(e)}
+        except ValueError as e: # Raised by the workers for profiles the engine rejects
+            return 400, {"error": str(e)}
+        except Exception:
+            logger.exception(f"{method} {path} failed")
+            return 500, {"error": "internal error"}
+
+    async def _health(self, body: bytes) -> Dict[str, Any]:
+        return {"status": "ok", "executor": self.executor, "workers": self.workers,
+                "pending": self.pending, "batches": self.batches, "shed": self.shed}
+
+    async def _formula(self, body: bytes) -> Dict[str, Any]:
+        profile = _parse_json(body)
+        if not isinstance(profile, dict): raise HTTPError(400, "profile must be a JSON object")
+        if self.pending >= self.max_queue: self._shed("request queue is full")
+        self.pending += 1
+        try:
+            return await asyncio.get_running_loop().run_in_executor(self._pool, _formula, profile)
+        finally:
+            self.pending -= 1
+
+    async def _batch(self, body: bytes) -> Dict[str, Any]:
+        data = _parse_json(body)
+        profiles = data.get("profiles") if isinstance(data, dict) else None
+        if not isinstance(profiles, list) or not all(isinstance(p, dict) for p in profiles):
+            raise HTTPError(400, 'expected {"profiles": [profile objects]}')
+        if len(profiles) > self.max_batch_size:
+            raise HTTPError(413, f"batch exceeds {self.max_batch_size} profiles")
+        if self.batches >= self.max_batches: self._shed("batch capacity is full")
+        self.batches += 1
+        try:
+            loop = asyncio.get_running_loop()
+            formulas = []
+            for start in range(0, len(profiles), self.batch_chunk):
+                chunk = profiles[start:start + self.batch_chunk]
+                formulas.extend(await loop.run_in_executor(self._pool, _formulas, chunk))
+            return {"formulas": formulas}
+        finally:
+            self.batches -= 1
+
+    def _shed(self, message: str):
+        self.shed += 1
+        raise HTTPError(503, message)
+
+def _parse_json(body: bytes) -> Any:
+    try:
+        return json.loads(body.decode("utf-8"))
+    except (UnicodeDecodeError, json.JSONDecodeError) as e:
+        raise HTTPError(400, f"invalid JSON: {e}") from None
+
+async def serve(server: FormulaServer, host: str, port: int):
+    await server.start(host, port)
+    logger.warning(f"Serving {server.db_path} on http://{host}:{server.port} "
+                   f"({server.workers} {server.executor} workers, queue {server.max_queue})")
+    try:
+        await asyncio.Event().wait()
+    finally:
+        await server.close()
+
+def main():
+    parser = argparse.ArgumentParser(description="HTTP formulation service.")
+    parser.add_argument("--db", default=os.path.join(os.path.dirname(os.path.abspath(__file__)), "plants_db.json"))
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--executor", choices=("process", "thread"), default="process")
+    parser.add_argument("--workers", type=int, default=0, help="pool size (default: one per CPU)")
+    parser.add_argument("--max-queue", type=int, default=64, help="interactive requests admitted before 503")
+    parser.add_argument("--max-batches", type=int, default=2, help="batches admitted before 503")
+    parser.add_argument("--batch-chunk", type=int, default=64, help="profiles per pool task within a batch")
+    parser.add_argument("--cache-size", type=int, default=4096, help="per-engine FormulaCache entries (0 disables)")
+    parser.add_argument("--reload-interval", type=float, default=0.0,
+                        help="seconds between checks of the catalog file for edits (0: never reload)")
+    args = parser.parse_args()
+
+    server = FormulaServer(args.db, executor=args.executor, workers=args.workers, max_queue=args.max_queue,
+                           max_batches=args.max_batches, batch_chunk=args.batch_chunk, cache_size=args.cache_size,
+                           reload_interval=args.reload_interval)
+    try:
+        asyncio.run(serve(server, args.host, args.port))
+    except KeyboardInterrupt:
+        pass
+
+if __name__ == "__main__":
+    main()
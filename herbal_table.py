@@ -0,0 +1,114 @@
+"""
+Offline compiler for the formula lookup table.
+
+The Streamlit UI can only produce a finite profile space: seven 0-10 sliders mapped through
+`prio_map` (priority when >= 4) plus four checkboxes. This module enumerates that space in
+parallel, collapses it to distinct canonical keys (HerbalFormulator._canonical_key), computes
+one formula per key and writes a compact FormulaTable artifact the engine answers from in O(1).
+
+    python herbal_table.py --db plants_db.json --out formula_table.json --workers 4
+"""
+import argparse
+import itertools
+import logging
+import os
+import time
+from multiprocessing import Pool
+from typing import Dict, Any, List, Tuple
+
+from herbal_engine import HerbalFormulator, FormulaTable
+
+SLIDERS = ("anxiety", "insomnia", "digestion", "fatigue", "inflammation", "immunity", "focus")
+CHECKBOXES = ("pregnancy", "medications", "asteraceae", "gastritis")
+PRIORITY_THRESHOLD = 4
+
+def ui_profile(sliders: Dict[str, int], checks: Dict[str, bool]) -> Dict[str, Any]:
+    """The profile app.py builds from its slider and checkbox values."""
+    anxiety, insomnia = sliders["anxiety"], sliders["insomnia"]
+    digestion, focus = sliders["digestion"], sliders["focus"]
+    profile_data = {
+        "priorities": [],
+        "conditions": {
+            "pregnancy": checks["pregnancy"],
+            "medications": checks["medications"], # General polypharmacy
+            "medication_polypharmacy": checks["medications"],
+            "asteraceae_allergy": checks["asteraceae"],
+            "gastritis": checks["gastritis"],
+            "high_anxiety": (anxiety >= 7),
+            "insomnia": (insomnia >= 6), # Active insomnia condition
+            "daytime_anxiety": (anxiety >= 5 and insomnia < 5) # Heuristic for daytime
+        },
+        "anxiety_level": anxiety,
+        "insomnia_level": insomnia
+    }
+
+    # Map slider values to priority axes
+    prio_map = {
+        "anxiety": anxiety, "sleep": insomnia, "digestion": digestion,
+        "energy": sliders["fatigue"], "inflammation": sliders["inflammation"], "immunity": sliders["immunity"],
+        "focus": focus, "memory": focus, "stress": anxiety, "bloating": digestion
+    }
+
+    # Strictly order priorities
+    sorted_prio = sorted(prio_map.items(), key=lambda x: x[1], reverse=True)
+    profile_data["priorities"] = [k for k, v in sorted_prio if v >= PRIORITY_THRESHOLD]
+    return profile_data
+
+def slider_space(anxiety: int, insomnia: int):
+    """
+    All slider vectors for fixed anxiety/insomnia values. Those two also drive condition flags
+    and interaction thresholds, so every 0-10 value is enumerated by the caller. The other five
+    only decide whether their axes become priorities: values below the threshold are dropped and,
+    because the canonical key is order-free, every value at or above it is equivalent.
+    """
+    for rest in itertools.product((0, PRIORITY_THRESHOLD), repeat=len(SLIDERS) - 2):
+        yield dict(zip(SLIDERS, (anxiety, insomnia) + rest))
+
+_engine = None
+
+def _init_worker(db_path: str):
+    global _engine
+    logging.disable(logging.INFO)
+    _engine = HerbalFormulator(db_path)
+
+def _compile_slice(levels: Tuple[int, int]) -> Tuple[int, Dict[Tuple, Dict[str, Any]]]:
+    """Distinct keys (and their formulas) for one (anxiety, insomnia) slice of the space."""
+    formulas = {}
+    seen = 0
+    for sliders in slider_space(*levels):
+        for values in itertools.product((False, True), repeat=len(CHECKBOXES)):
+            profile = _engine._build_profile(ui_profile(sliders, dict(zip(CHECKBOXES, values))))
+            seen += 1
+            key = _engine._canonical_key(profile)
+            if key not in formulas:
+                formulas[key] = _engine._formulate(profile, _engine._score_plants(profile))
+    return seen, formulas
+
+def compile_table(db_path: str, workers: int = 0) -> Tuple[FormulaTable, int]:
+    """Returns the compiled table and the number of UI profiles enumerated."""
+    slices: List[Tuple[int, int]] = [(a, i) for a in range(11) for i in range(11)]
+    formulas = {}
+    seen = 0
+    with Pool(processes=workers or None, initializer=_init_worker, initargs=(db_path,)) as pool:
+        for count, part in pool.imap_unordered(_compile_slice, slices):
+            seen += count
+            for key, formula in part.items(): formulas.setdefault(key, formula)
+    db_hash = HerbalFormulator(db_path).db_hash
+    return FormulaTable(db_hash, formulas), seen
+
+def main():
+    logging.basicConfig(level=logging.INFO, format='%(levelname)s: %(message)s')
+    parser = argparse.ArgumentParser(description="Compile the UI profile space into a formula lookup table.")
+    parser.add_argument("--db", default=os.path.join(os.path.dirname(os.path.abspath(__file__)), "plants_db.json"))
+    parser.add_argument("--out", default="formula_table.json")
+    parser.add_argument("--workers", type=int, default=0, help="worker processes (default: one per CPU)")
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    table, seen = compile_table(args.db, args.workers)
+    distinct = table.save(args.out)
+    logging.info(f"Enumerated {seen} UI profiles -> {len(table)} canonical keys -> {distinct} formulas "
+                 f"in {time.perf_counter() - start:.1f}s; wrote {args.out} ({os.path.getsize(args.out):,} bytes)")
+
+if __name__ == "__main__":
+    main()
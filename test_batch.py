@@ -0,0 +1,48 @@
+import os
+import random
+import unittest
+from herbal_engine import HerbalFormulator
+
+DB_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "plants_db.json")
+AXES = ["anxiety", "sleep", "digestion", "energy", "inflammation", "immunity", "focus", "memory", "stress", "bloating", "unknown_axis"]
+CONDITIONS = ["pregnancy", "medication_polypharmacy", "asteraceae_allergy", "gastritis", "daytime_anxiety", "insomnia"]
+
+def random_profiles(n, seed=7):
+    rng = random.Random(seed)
+    return [
+        {
+            "priorities": rng.sample(AXES, rng.randint(0, 5)),
+            "conditions": {c: rng.random() < 0.25 for c in CONDITIONS},
+            "anxiety_level": rng.randint(0, 10),
+            "insomnia_level": rng.randint(0, 10),
+            "stress_level": rng.randint(0, 10),
+        }
+        for _ in range(n)
+    ]
+
+class TestBatchFormulas(unittest.TestCase):
+    def setUp(self):
+        self.engine = HerbalFormulator(DB_PATH)
+
+    def test_batch_matches_scalar(self):
+        profiles = random_profiles(600)
+        expected = [self.engine.generate_formula(p) for p in profiles]
+        self.assertEqual(self.engine.generate_formulas(profiles), expected)
+
+    def test_screened_safety_matches_scalar(self):
+        # Fresh engines, so the batch takes its exclusions from the matrix screen, not the safety cache
+        profiles = random_profiles(300, seed=3)
+        for size in (0, None):
+            scalar, batch = (HerbalFormulator(DB_PATH, safety_cache_size=size) for _ in range(2))
+            expected = [scalar.generate_formula(p, explain=True) for p in profiles]
+            self.assertEqual(batch.generate_formulas(profiles, explain=True), expected)
+
+    def test_empty_batch(self):
+        self.assertEqual(self.engine.generate_formulas([]), [])
+
+    def test_duplicate_priorities_count_twice(self):
+        profile = {"priorities": ["sleep", "sleep", "focus"], "conditions": {}}
+        self.assertEqual(self.engine.generate_formulas([profile]), [self.engine.generate_formula(profile)])
+
+if __name__ == '__main__':
+    unittest.main()
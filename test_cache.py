@@ -0,0 +1,108 @@
+import json
+import os
+import tempfile
+import unittest
+from herbal_engine import HerbalFormulator, FormulaCache, SafetyCache
+from test_batch import random_profiles
+
+DB_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "plants_db.json")
+
+class TestFormulaCache(unittest.TestCase):
+    def setUp(self):
+        self.plain = HerbalFormulator(DB_PATH)
+        self.cached = HerbalFormulator(DB_PATH, cache=FormulaCache(maxsize=32))
+
+    def test_cached_results_match_uncached(self):
+        profiles = random_profiles(300, seed=21) * 2
+        for p in profiles:
+            self.assertEqual(self.cached.generate_formula(p), self.plain.generate_formula(p))
+        self.assertEqual(self.cached.generate_formulas(profiles), self.plain.generate_formulas(profiles))
+        self.assertGreater(self.cached.cache.hits, 0)
+        self.assertLessEqual(self.cached.cache.stats()["size"], 32)
+
+    def test_equivalent_profiles_share_an_entry(self):
+        a = {"priorities": ["sleep", "anxiety", "not_an_axis"], "conditions": {"pregnancy": False}, "anxiety_level": 3}
+        b = {"priorities": ["anxiety", "sleep"], "conditions": {}, "anxiety_level": 4}
+        self.cached.generate_formula(a)
+        self.cached.generate_formula(b)
+        self.assertEqual((self.cached.cache.hits, self.cached.cache.misses), (1, 1))
+
+    def test_threshold_crossings_miss(self):
+        base = {"priorities": ["energy", "focus"], "conditions": {}}
+        self.cached.generate_formula({**base, "anxiety_level": 5})
+        self.cached.generate_formula({**base, "anxiety_level": 6}) # crosses "anxiety >= 6"
+        self.cached.generate_formula({**base, "anxiety_level": 7}) # crosses high_anxiety
+        self.assertEqual(self.cached.cache.misses, 3)
+
+    def test_lru_eviction(self):
+        cache = FormulaCache(maxsize=2)
+        for key in ("a", "b", "a", "c"):
+            if cache.get((key,), "h") is None: cache.put((key,), "h", {"components": []})
+        self.assertIsNotNone(cache.get(("a",), "h"))
+        self.assertIsNone(cache.get(("b",), "h"))
+
+    def test_returned_formula_is_a_copy(self):
+        profile = {"priorities": ["sleep"], "conditions": {}}
+        first = self.cached.generate_formula(profile)
+        first["components"][0]["percent"] = -1
+        self.assertEqual(self.cached.generate_formula(profile), self.plain.generate_formula(profile))
+
+    def test_db_hash_change_never_serves_stale(self):
+        shared = FormulaCache()
+        profile = {"priorities": ["sleep"], "conditions": {}}
+        HerbalFormulator(DB_PATH, cache=shared).generate_formula(profile)
+        with open(DB_PATH, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+        data[0]['max_percent'] = 30 # Still a valid range (min_percent is 25)
+        fd, path = tempfile.mkstemp(suffix=".json")
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            json.dump(data, f)
+        try:
+            edited = HerbalFormulator(path, cache=shared)
+            result = edited.generate_formula(profile)
+            self.assertEqual(shared.misses, 2)
+            self.assertEqual(shared.db_hash, edited.db_hash)
+            self.assertEqual(result, HerbalFormulator(path).generate_formula(profile))
+        finally:
+            os.remove(path)
+
+    def test_interleaved_hashes_keep_both_generations(self):
+        cache = FormulaCache(maxsize=8)
+        for n in range(3):
+            for db_hash in ("old", "new"): cache.put((n,), db_hash, {"hash": db_hash})
+        for n in range(3):
+            self.assertEqual(cache.get((n,), "old"), {"hash": "old"})
+            self.assertEqual(cache.get((n,), "new"), {"hash": "new"})
+        # Once only the new snapshot asks, the old entries are the first to go
+        for n in range(3): cache.get((n,), "new")
+        for n in range(3, 8): cache.put((n,), "new", {"hash": "new"})
+        self.assertTrue(all(cache.get((n,), "old") is None for n in range(3)))
+        self.assertTrue(all(cache.get((n,), "new") is not None for n in range(8)))
+
+class TestSafetyCache(unittest.TestCase):
+    def test_replayed_safety_matches_fresh(self):
+        plain = HerbalFormulator(DB_PATH, safety_cache_size=0)
+        engine = HerbalFormulator(DB_PATH)
+        self.assertIsNone(plain.safety_cache)
+        profiles = random_profiles(300, seed=22)
+        for p in profiles:
+            self.assertEqual(engine.generate_formula(p, explain=True), plain.generate_formula(p, explain=True))
+        self.assertEqual(engine.generate_formulas(profiles), plain.generate_formulas(profiles))
+        stats = engine.safety_cache.stats()
+        self.assertGreater(stats["hits"], stats["misses"])
+
+    def test_mask_ignores_everything_but_conditions(self):
+        engine = HerbalFormulator(DB_PATH)
+        engine.generate_formula({"priorities": ["sleep"], "conditions": {"pregnancy": True}})
+        engine.generate_formula({"priorities": ["energy", "focus"], "conditions": {"pregnancy": True},
+                                 "anxiety_level": 2})
+        self.assertEqual((engine.safety_cache.hits, engine.safety_cache.misses), (1, 1))
+
+    def test_lru_eviction(self):
+        cache = SafetyCache(maxsize=2)
+        for mask in (1, 2, 1, 3): cache.get(mask) or cache.put(mask, object())
+        self.assertIsNotNone(cache.get(1))
+        self.assertIsNone(cache.get(2))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,199 @@
+import json
+import os
+import tempfile
+import unittest
+import numpy as np
+from herbal_catalog import CatalogError, encode_catalog, validate_catalog, write_catalog, read_catalog, is_binary_catalog
+from herbal_engine import HerbalFormulator
+from test_batch import random_profiles
+
+DB_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "plants_db.json")
+
+class TestBinaryCatalog(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.tmp = tempfile.TemporaryDirectory()
+        cls.hcat = os.path.join(cls.tmp.name, "plants_db.hcat")
+        with open(DB_PATH) as f:
+            cls.records = json.load(f)
+        write_catalog(cls.records, cls.hcat)
+        cls.json_engine = HerbalFormulator(DB_PATH)
+        cls.binary_engine = HerbalFormulator(cls.hcat)
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.tmp.cleanup()
+
+    def test_outputs_match_json_catalog(self):
+        profiles = random_profiles(300, seed=9)
+        self.assertEqual([self.binary_engine.generate_formula(p) for p in profiles],
+                         [self.json_engine.generate_formula(p) for p in profiles])
+        self.assertEqual(self.binary_engine.generate_formulas(profiles), self.json_engine.generate_formulas(profiles))
+
+    def test_db_hash_is_source_json_hash(self):
+        self.assertEqual(self.binary_engine.db_hash, self.json_engine.db_hash)
+
+    def test_plants_round_trip_lazily(self):
+        engine = HerbalFormulator(self.hcat)
+        self.assertEqual(engine.db._details, {})
+        self.assertEqual(engine.db[3], self.json_engine.db[3])
+        self.assertEqual(list(engine.db._details), [3])
+        self.assertEqual(list(engine.db), list(self.json_engine.db))
+        for plant, record in zip(engine.db, self.records):
+            self.assertEqual({k: v for k, v in plant.to_dict().items() if k in record}, record)
+
+    def test_plant_views_read_columns(self):
+        table = self.json_engine.db
+        plant = table[-1]
+        self.assertEqual((plant.id, plant.role, plant.max_percent), (self.records[-1]['id'], self.records[-1]['role'], self.records[-1]['max_percent']))
+        self.assertIsInstance(plant.max_percent, type(self.records[-1]['max_percent']))
+        self.assertFalse(hasattr(plant, '__dict__'))
+        with self.assertRaises(IndexError):
+            table[len(table)]
+
+    def test_detects_format(self):
+        self.assertTrue(is_binary_catalog(self.hcat))
+        self.assertFalse(is_binary_catalog(DB_PATH))
+        bad = os.path.join(self.tmp.name, "bad.hcat")
+        with open(self.hcat, 'rb') as src, open(bad, 'wb') as dst:
+            data = bytearray(src.read())
+            data[4] = 99 # version
+            dst.write(data)
+        with self.assertRaises(ValueError):
+            read_catalog(bad)
+
+class TestCompiledIndices(unittest.TestCase):
+    def test_artifact_holds_the_serving_indices(self):
+        with open(DB_PATH) as f:
+            records = json.load(f)
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "plants.hcat")
+            write_catalog(records, path)
+            cols = read_catalog(path)
+            encoded = encode_catalog(records, cols.source_hash)
+            for name in ('role_order', 'role_bounds', 'rule_order', 'rule_bounds', 'syn_indptr', 'ant_indptr',
+                         'max_bonus', 'exclusion_bits', 'family_caps', 'plant_caps'):
+                np.testing.assert_array_equal(getattr(cols, name), getattr(encoded, name), err_msg=name)
+            engine = HerbalFormulator(path)
+        for role in cols.roles:
+            self.assertEqual(engine._role_partitions[engine._symbols.role[role]],
+                             [i for i, r in enumerate(records) if r['role'] == role])
+        for i, r in enumerate(records):
+            start, end = cols.syn_indptr[i], cols.syn_indptr[i + 1]
+            self.assertTrue((cols.syn_src[start:end] == i).all())
+
+class TestSymbolTable(unittest.TestCase):
+    def setUp(self):
+        self.engine = HerbalFormulator(DB_PATH)
+        self.symbols = self.engine._symbols
+
+    def test_codes_are_catalog_positions(self):
+        self.assertEqual([self.symbols.axis[a] for a in self.symbols.axes], list(range(len(self.symbols.axes))))
+        self.assertEqual([self.symbols.condition[c] for c in self.symbols.conditions], list(self.engine._condition_index))
+        self.assertEqual([self.symbols.roles[c] for c in self.engine._roles], self.engine.db.role_names)
+
+    def test_profiles_are_interned_once(self):
+        profile = self.engine._build_profile({"priorities": ["sleep", "unknown", "anxiety", "sleep"],
+                                              "conditions": {"pregnancy": True, "not_a_rule": True},
+                                              "stress_level": 8})
+        axis, condition = self.symbols.axis, self.symbols.condition
+        self.assertEqual(profile.axes, tuple(sorted([axis["sleep"], axis["sleep"], axis["anxiety"]])))
+        self.assertEqual(profile.mask, sum(1 << condition[c] for c in ("pregnancy", "high_stress") if c in condition))
+
+    def test_keys_ignore_priority_order_and_string_identity(self):
+        for p in random_profiles(200, seed=12):
+            fresh = json.loads(json.dumps({**p, "priorities": p.get("priorities", [])[::-1]}))
+            key = self.engine._canonical_key(self.engine._build_profile(p))
+            self.assertEqual(self.engine._canonical_key(self.engine._build_profile(fresh)), key)
+            self.assertTrue(all(isinstance(c, int) for c in key[0]) and isinstance(key[1], int))
+
+class TestValidation(unittest.TestCase):
+    def setUp(self):
+        with open(DB_PATH) as f:
+            self.records = json.load(f)
+
+    def problems(self):
+        with self.assertRaises(CatalogError) as caught:
+            validate_catalog(self.records, allow_missing_partners=True)
+        return caught.exception.problems
+
+    def test_shipped_catalog_is_valid_apart_from_missing_partners(self):
+        missing = validate_catalog(self.records, allow_missing_partners=True)
+        self.assertEqual(len(missing), 8)
+        with self.assertRaises(CatalogError):
+            validate_catalog(self.records)
+
+    def test_engine_load_summarizes_dropped_links(self):
+        with self.assertLogs(level='DEBUG') as logs:
+            HerbalFormulator(DB_PATH)
+        dropped = [r for r in logs.records if 'dropped' in r.getMessage()]
+        self.assertEqual([(r.levelname, r.getMessage()) for r in dropped],
+                         [('DEBUG', "8 link(s) to plants missing from the catalog dropped")])
+
+    def test_every_problem_is_reported_with_its_plant(self):
+        by_id = {r['id']: r for r in self.records}
+        by_id['valerian']['min_percent'] = 50
+        by_id['ginkgo']['role'] = 'helper'
+        by_id['rose']['synergies'].append({"with": "rose", "bonus": 0.5})
+        by_id['hibiscus']['antagonisms'][0]['action'] = 'ban'
+        by_id['anise']['constraints']['conditions'] = [{"condition": "pregnancy", "action": "set_role", "value": "lead"}]
+        self.records.append(dict(by_id['fennel']))
+        del self.records[3]['name']
+        problems = self.problems()
+        self.assertEqual(len(problems), 7)
+        text = "\n".join(problems)
+        for expected in ("plant 'valerian': min_percent 50 is above max_percent 40",
+                         "plant 'ginkgo': role 'helper' is not one of primary, secondary, support",
+                         f"plant 'rose': synergies[{len(by_id['rose']['synergies']) - 1}]: links the plant to itself",
+                         "plant 'hibiscus': antagonisms[0]: action 'ban' is not one of penalize, exclude",
+                         "plant 'anise': constraints.conditions[0]: set_role value 'lead' is not one of",
+                         f"plant '{self.records[3]['id']}': missing name",
+                         "plant 'fennel': duplicate id"):
+            self.assertIn(expected, text)
+
+    def test_malformed_json_values(self):
+        self.assertEqual(validate_catalog([], allow_missing_partners=True), [])
+        with self.assertRaises(CatalogError):
+            validate_catalog({"plants": []})
+        self.records[0]['scores'] = {"sleep": "high"}
+        self.assertIn("plant 'valerian': scores must map axes to numbers", self.problems())
+
+class TestFamilyCaps(unittest.TestCase):
+    def setUp(self):
+        with open(DB_PATH) as f:
+            self.records = json.load(f)
+
+    def test_one_cap_per_family_code(self):
+        cols = encode_catalog(self.records, "h")
+        caps = dict(zip(cols.families, cols.family_caps.tolist()))
+        self.assertEqual((caps["Sedative"], caps["Adaptogen"]), (40.0, 35.0))
+        self.assertTrue(np.isinf(caps["Digestive"]))
+
+    def test_plant_caps_column(self):
+        cols = encode_catalog(self.records, "h")
+        caps = dict(zip(cols.ids, cols.plant_caps.tolist()))
+        self.assertEqual((caps["green_tea"], caps["korean_ginseng"]), (15.0, 25.0))
+        self.assertTrue(np.isinf(caps["valerian"]))
+
+    def test_undeclared_members_share_the_cap(self):
+        for r in self.records:
+            if r['id'] != 'valerian': r['constraints'].pop('global_family_limit', None)
+        cols = encode_catalog(self.records, "h")
+        self.assertEqual(cols.family_caps[cols.families.index("Sedative")], 40.0)
+
+    def test_conflicting_caps_are_rejected(self):
+        rule = next(r for r in self.records if r['id'] == 'magnolia')['constraints']['global_family_limit']
+        rule['max_sum'] = 45
+        with self.assertRaisesRegex(ValueError, "Sedative.*40.*45.*magnolia"):
+            encode_catalog(self.records, "h")
+        fd, path = tempfile.mkstemp(suffix=".json")
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            json.dump(self.records, f)
+        try:
+            with self.assertRaises(ValueError):
+                HerbalFormulator(path)
+        finally:
+            os.remove(path)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,82 @@
+import io
+import json
+import os
+import tempfile
+import unittest
+from herbal import run_batch, run_compile
+from herbal_engine import HerbalFormulator
+from test_batch import random_profiles
+
+DB_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "plants_db.json")
+
+class TestBatchCommand(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.engine = HerbalFormulator(DB_PATH)
+        cls.profiles = [{"id": f"p{i}", **p} for i, p in enumerate(random_profiles(120, seed=12))]
+        cls.lines = [json.dumps(p) + "\n" for p in cls.profiles]
+
+    def run_lines(self, lines, **options):
+        out = io.StringIO()
+        records, errors = run_batch(lines, out, db_path=DB_PATH, workers=2, chunk_size=16, progress=None, **options)
+        return records, errors, [json.loads(line) for line in out.getvalue().splitlines()]
+
+    def test_ordered_output_matches_engine(self):
+        records, errors, results = self.run_lines(iter(self.lines))
+        self.assertEqual((records, errors), (120, 0))
+        self.assertEqual([r["line"] for r in results], list(range(1, 121)))
+        self.assertEqual([r["id"] for r in results], [p["id"] for p in self.profiles])
+        self.assertEqual([r["formula"] for r in results], self.engine.generate_formulas(self.profiles))
+
+    def test_unordered_covers_every_record(self):
+        _, _, results = self.run_lines(iter(self.lines), ordered=False)
+        self.assertEqual(sorted(r["line"] for r in results), list(range(1, 121)))
+
+    def test_failing_records_do_not_stop_the_run(self):
+        lines = self.lines[:5] + ["{oops\n", "\n", "[1]\n", json.dumps({"priorities": 3}) + "\n"] + self.lines[5:10]
+        records, errors, results = self.run_lines(lines)
+        self.assertEqual((records, errors), (13, 3)) # The blank line is skipped
+        failed = {r["line"] for r in results if "error" in r}
+        self.assertEqual(failed, {6, 8, 9})
+        self.assertEqual([r["formula"] for r in results if "formula" in r],
+                         self.engine.generate_formulas(self.profiles[:10]))
+
+class TestCompileCommand(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.out = os.path.join(self.tmp.name, "plants_db.hcat")
+        with open(DB_PATH, 'r', encoding='utf-8') as f:
+            self.records = json.load(f)
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def compile(self, records=None, **options):
+        path = DB_PATH
+        if records is not None:
+            path = os.path.join(self.tmp.name, "edited.json")
+            with open(path, 'w', encoding='utf-8') as f: json.dump(records, f)
+        log = io.StringIO()
+        return run_compile(path, self.out, log=log, **options), log.getvalue()
+
+    def test_dangling_partners_fail_unless_allowed(self):
+        status, log = self.compile()
+        self.assertEqual(status, 1)
+        self.assertIn("plant 'korean_ginseng': antagonisms[3]: partner 'licorice' is not in the catalog", log)
+        self.assertFalse(os.path.exists(self.out))
+        status, log = self.compile(allow_missing_partners=True)
+        self.assertEqual(status, 0)
+        self.assertIn("link dropped", log)
+        engine = HerbalFormulator(self.out)
+        profiles = random_profiles(50, seed=13)
+        self.assertEqual(engine.generate_formulas(profiles), HerbalFormulator(DB_PATH).generate_formulas(profiles))
+
+    def test_bad_condition_expression_is_reported(self):
+        self.records[1]["synergies"][0]["condition"] = "anxiety >>= 6"
+        status, log = self.compile(self.records, allow_missing_partners=True)
+        self.assertEqual(status, 1)
+        self.assertIn(f"Plant '{self.records[1]['id']}' synergy", log)
+        self.assertFalse(os.path.exists(self.out))
+
+if __name__ == "__main__":
+    unittest.main()
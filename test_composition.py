@@ -0,0 +1,114 @@
+import itertools
+import os
+import random
+import unittest
+from herbal_engine import HerbalFormulator, CompositionSearch
+from test_batch import random_profiles
+
+DB_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "plants_db.json")
+
+def brute_force(search, roles):
+    """Best objective over every role-constrained subset, by enumeration."""
+    best = -float('inf')
+    per_role = [[c for k in range(slots + 1) for c in itertools.combinations(pool, k)] for pool, slots in roles]
+    for combo in itertools.product(*per_role):
+        value = search.value([i for part in combo for i in part])
+        if value is not None: best = max(best, value)
+    return best
+
+def toy_problem(rng, n=12):
+    scores = [round(rng.uniform(0.5, 10), 1) for _ in range(n)]
+    pairs, forbidden = {}, {}
+    for i, j in itertools.combinations(range(n), 2):
+        roll = rng.random()
+        if roll < 0.15: w = rng.choice([0.5, 1.0, 3.0])
+        elif roll < 0.3: w = -rng.choice([0.5, 1.0, 4.0])
+        elif roll < 0.35:
+            forbidden.setdefault(i, set()).add(j)
+            forbidden.setdefault(j, set()).add(i)
+            continue
+        else: continue
+        pairs.setdefault(i, {})[j] = pairs.setdefault(j, {})[i] = w
+    caps = {f: rng.choice([40.0, float('inf')]) for f in (0, 1)} # One canonical cap per family code
+    family = {i: (f, rng.choice([10, 15, 25]), 100.0, caps[f]) for i, f in ((i, rng.randrange(2)) for i in range(n))}
+    indices = list(range(n))
+    rng.shuffle(indices)
+    roles = [(indices[:5], 2), (indices[5:10], 3), (indices[10:], 2)]
+    return roles, scores, pairs, forbidden, family
+
+class TestCompositionSearch(unittest.TestCase):
+    def test_matches_brute_force(self):
+        rng = random.Random(5)
+        for _ in range(40):
+            roles, scores, pairs, forbidden, family = toy_problem(rng)
+            search = CompositionSearch(roles, scores, pairs, forbidden, family, max_nodes=10 ** 6)
+            chosen = search.run([])
+            self.assertFalse(search.truncated)
+            self.assertAlmostEqual(search.value(chosen), brute_force(search, roles))
+
+    def test_synergy_beats_greedy(self):
+        roles = [([0, 1, 2], 2)]
+        search = CompositionSearch(roles, [5.0, 4.0, 3.5], {1: {2: 2.0}, 2: {1: 2.0}}, {},
+                                   {i: ("A", 0, 100.0, float('inf')) for i in range(3)}, max_nodes=100)
+        self.assertEqual(sorted(search.run([0, 1])), [1, 2])
+
+    def test_short_set_keeps_full_incumbent(self):
+        # [1, 2] scores higher but its maximum doses only reach 90%
+        family = {0: ("A", 0, 60.0, float('inf')), 1: ("A", 0, 50.0, float('inf')), 2: ("A", 0, 40.0, float('inf'))}
+        search = CompositionSearch([([0, 1, 2], 2)], [5.0, 4.0, 3.5], {1: {2: 2.0}, 2: {1: 2.0}}, {}, family, max_nodes=100)
+        self.assertEqual(sorted(search.run([0, 1])), [0, 1])
+        family[2] = ("B", 0, 40.0, 30.0) # A family limit counts against capacity too
+        search = CompositionSearch([([0, 1, 2], 2)], [5.0, 4.0, 3.5], {1: {2: 2.0}, 2: {1: 2.0}}, {}, family, max_nodes=100)
+        self.assertFalse(search.full([1, 2]))
+        self.assertEqual(sorted(search.run([0, 1])), [0, 1])
+
+    def test_expired_budget_keeps_incumbent(self):
+        roles, scores, pairs, forbidden, family = toy_problem(random.Random(1))
+        search = CompositionSearch(roles, scores, pairs, forbidden, family, max_nodes=0)
+        incumbent = [roles[0][0][0]]
+        self.assertEqual(search.run(incumbent), incumbent)
+        self.assertTrue(search.truncated)
+
+    def test_truncated_search_is_deterministic(self):
+        rng = random.Random(7)
+        for _ in range(20):
+            problem = toy_problem(rng)
+            runs = [CompositionSearch(*problem, max_nodes=5) for _ in range(2)]
+            self.assertEqual(runs[0].run([]), runs[1].run([]))
+            self.assertTrue(runs[0].truncated)
+            self.assertEqual(runs[0].nodes, 5)
+
+class TestEngineSelection(unittest.TestCase):
+    def setUp(self):
+        self.engine = HerbalFormulator(DB_PATH)
+        self.greedy = HerbalFormulator(DB_PATH, search_budget=0)
+        self.by_name = {p.name: p for p in self.engine.db}
+
+    def test_formulas_honor_limits(self):
+        for profile in random_profiles(300, seed=11):
+            formula = self.engine.generate_formula(profile)
+            self.assertNotEqual(formula["dosing"], "infeasible")
+            plants = [(self.by_name[c["name"]], c["percent"]) for c in formula["components"]]
+            self.assertLessEqual(len(plants), HerbalFormulator.MAX_PLANTS)
+            self.assertLessEqual(sum(percent for _, percent in plants), 100.3)
+            for p, _ in plants:
+                rule = p.constraints.get("global_family_limit")
+                if not rule: continue
+                family = sum(percent for q, percent in plants if q.family_functional == p.family_functional)
+                self.assertLessEqual(family, rule["max_sum"] + 0.3, formula)
+
+    def test_search_never_shortens_a_greedy_formula(self):
+        profiles = random_profiles(300, seed=11)
+        profiles.append({"priorities": ["inflammation", "digestion", "focus", "sleep"],
+                         "conditions": {"daytime_anxiety": True, "hypertension": True, "medication_polypharmacy": True}})
+        for profile in profiles:
+            if self.greedy.generate_formula(profile)["dosing"] != "optimal": continue
+            self.assertEqual(self.engine.generate_formula(profile)["dosing"], "optimal", profile)
+
+    def test_zero_budget_is_greedy(self):
+        profile = {"priorities": ["sleep", "anxiety"], "conditions": {}, "anxiety_level": 5}
+        names = [c["name"] for c in self.greedy.generate_formula(profile)["components"]]
+        self.assertEqual(names[:2], ["Valerian", "Magnolia"]) # Top two primaries, family limit or not
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,40 @@
+import os
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import FrozenInstanceError
+from herbal_engine import HerbalFormulator
+
+DB_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "plants_db.json")
+
+PROFILES = [
+    {"priorities": ["sleep", "anxiety"], "conditions": {"daytime_anxiety": True}, "anxiety_level": 6, "insomnia_level": 2},
+    {"priorities": ["energy", "focus"], "conditions": {}, "anxiety_level": 8},
+    {"priorities": ["digestion", "bloating"], "conditions": {"pregnancy": True}},
+    {"priorities": ["energy", "focus", "anxiety"], "conditions": {}, "anxiety_level": 6},
+]
+
+class TestReentrancy(unittest.TestCase):
+    def setUp(self):
+        self.engine = HerbalFormulator(DB_PATH)
+
+    def test_catalog_is_immutable(self):
+        with self.assertRaises(FrozenInstanceError):
+            self.engine.db[0].max_percent = 1
+
+    def test_no_state_leaks_between_calls(self):
+        """A conditional cap/role shift must not survive into the next request."""
+        baseline = self.engine.generate_formula(PROFILES[1])
+        self.engine.generate_formula(PROFILES[0])
+        self.assertEqual(self.engine.generate_formula(PROFILES[1]), baseline)
+        self.assertEqual(self.engine.generate_formula(PROFILES[0]), HerbalFormulator(DB_PATH).generate_formula(PROFILES[0]))
+
+    def test_threaded_results_match_serial(self):
+        expected = [self.engine.generate_formula(p) for p in PROFILES]
+        jobs = PROFILES * 50
+        with ThreadPoolExecutor(max_workers=8) as pool:
+            results = list(pool.map(self.engine.generate_formula, jobs))
+        for i, result in enumerate(results):
+            self.assertEqual(result, expected[i % len(PROFILES)])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,200 @@
+import json
+import os
+import random
+import tempfile
+import unittest
+import numpy as np
+from herbal_engine import HerbalFormulator, ConstraintEngine, InteractionIndex, PlantState, UserProfile, compile_condition
+from herbal_catalog import ROLES
+from test_batch import random_profiles
+
+DB_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "plants_db.json")
+CONDITIONS = ["pregnancy", "medication_polypharmacy", "asteraceae_allergy", "gastritis", "daytime_anxiety",
+              "insomnia", "high_anxiety", "medication_blood_thinners", "prolonged_use", "hypertension"]
+
+def random_condition_sets(n, seed=3):
+    rng = random.Random(seed)
+    return [{c: rng.random() < 0.3 for c in CONDITIONS} for _ in range(n)]
+
+class TestConditionIndex(unittest.TestCase):
+    def setUp(self):
+        self.engine = HerbalFormulator(DB_PATH)
+
+    def _fresh(self):
+        return [PlantState(plant=p, index=i, final_role=ROLES.index(p.role), max_percent=p.max_percent)
+                for i, p in enumerate(self.engine.db)]
+
+    def test_index_matches_per_plant_scan(self):
+        for conditions in random_condition_sets(200):
+            profile = self.engine._build_profile({"conditions": conditions})
+            scanned = self._fresh()
+            expected_excluded = {}
+            for i, s in enumerate(scanned):
+                if ConstraintEngine.check_safety(s, profile):
+                    ConstraintEngine.apply_conditional_limits(s, profile)
+                else:
+                    expected_excluded[i] = s.exclusion.condition
+            indexed = self._fresh()
+            excluded, shifted = ConstraintEngine.apply_condition_index(self.engine._condition_index, indexed, profile)
+            self.assertEqual(excluded, expected_excluded)
+            self.assertEqual(indexed, scanned)
+            self.assertEqual(shifted, {i for i, s in enumerate(scanned) if s.final_role != ROLES.index(s.plant.role)})
+
+    def test_inactive_conditions_touch_nothing(self):
+        states = self._fresh()
+        profile = self.engine._build_profile({"conditions": {"pregnancy": False, "not_a_rule": True}})
+        self.assertEqual(ConstraintEngine.apply_condition_index(self.engine._condition_index, states, profile), ({}, set()))
+        self.assertEqual(states, self._fresh())
+
+class TestExclusionMatrix(unittest.TestCase):
+    def _scan(self, engine, conditions):
+        profile = UserProfile(priorities=[], conditions=conditions)
+        reasons = {}
+        for i, p in enumerate(engine.db):
+            state = PlantState(plant=p, index=i, final_role=ROLES.index(p.role), max_percent=p.max_percent)
+            if not ConstraintEngine.check_safety(state, profile): reasons[i] = state.exclusion.condition
+        return reasons
+
+    def _check(self, engine, condition_sets):
+        profiles = [{"conditions": c} for c in condition_sets]
+        safe, exclusions = engine.screen_safety(profiles)
+        self.assertEqual(safe.shape, (len(profiles), len(engine.db)))
+        self.assertTrue(np.array_equal(safe, engine.safe_mask(profiles)))
+        for row, conditions in enumerate(condition_sets):
+            expected = self._scan(engine, conditions)
+            self.assertEqual(exclusions[row], expected)
+            self.assertEqual(set(np.flatnonzero(~safe[row]).tolist()), set(expected))
+
+    def test_matches_check_safety(self):
+        self._check(HerbalFormulator(DB_PATH), random_condition_sets(200, seed=5) + [{}])
+
+    def test_multi_word_masks_and_first_rule_reason(self):
+        with open(DB_PATH, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+        rng = random.Random(2)
+        extra = [f"rare_{k}" for k in range(150)]
+        for p in data:
+            rules = p.setdefault('constraints', {}).setdefault('conditions', [])
+            for key in rng.sample(extra, 12): rules.insert(rng.randrange(len(rules) + 1), {"condition": key, "action": "exclude"})
+        fd, path = tempfile.mkstemp(suffix=".json")
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            json.dump(data, f)
+        try:
+            engine = HerbalFormulator(path)
+            self.assertGreater(engine._exclusions.words, 1)
+            sets = [{c: rng.random() < 0.05 for c in CONDITIONS + extra} for _ in range(100)]
+            self._check(engine, sets)
+        finally:
+            os.remove(path)
+
+class TestFamilyLimits(unittest.TestCase):
+    def test_formulas_respect_family_caps(self):
+        engine = HerbalFormulator(DB_PATH)
+        table = engine.db
+        index = {name: i for i, name in enumerate(table.names)}
+        capped = 0
+        for formula in engine.generate_formulas(random_profiles(300, seed=4)):
+            totals = {}
+            for c in formula["components"]:
+                code = int(table.family_codes[index[c["name"]]])
+                totals[code] = totals.get(code, 0.0) + c["percent"]
+            for code, total in totals.items():
+                self.assertLessEqual(total, table.family_caps[code] + 0.05 * len(formula["components"]))
+                capped += total > table.family_caps[code] - 0.5
+        self.assertGreater(capped, 0) # Some formulas fill a family to its cap
+
+class TestRoleSelection(unittest.TestCase):
+    def setUp(self):
+        self.engine = HerbalFormulator(DB_PATH)
+
+    def test_set_role_moves_plant_between_partitions(self):
+        profile = {"priorities": ["sleep", "anxiety"], "conditions": {"daytime_anxiety": True}}
+        roles = {c['name']: c['role'] for c in self.engine.generate_formula(profile)['components']}
+        self.assertEqual(roles.get("Valerian"), "Secondary")
+        self.assertEqual(list(roles.values()).count("Primary"), 2)
+
+    def test_role_limits(self):
+        for conditions in random_condition_sets(100, seed=9):
+            profile = {"priorities": ["sleep", "anxiety", "focus", "digestion", "flavor"], "conditions": conditions}
+            roles = [c['role'] for c in self.engine.generate_formula(profile)['components']]
+            self.assertLessEqual(len(roles), 5)
+            self.assertLessEqual(roles.count("Primary"), 2)
+            self.assertLessEqual(roles.count("Secondary"), 3)
+            self.assertLessEqual(roles.count("Support"), 2)
+
+class TestInteractionIndex(unittest.TestCase):
+    def setUp(self):
+        self.engine = HerbalFormulator(DB_PATH)
+
+    def _scan(self, attr, selected, profile):
+        """Reference: walk each selected plant's declared list against the selected id set."""
+        ids = {self.engine.db[i].id for i in selected}
+        found = []
+        for i in selected:
+            for link in getattr(self.engine.db[i], attr):
+                condition = link.get('condition')
+                if link.get('with') in ids and (not condition or compile_condition(condition)(profile)):
+                    found.append((i, link.get('with')))
+        return sorted(found)
+
+    def test_gather_matches_list_scan(self):
+        rng = random.Random(11)
+        index = self.engine._interactions
+        for _ in range(300):
+            selected = rng.sample(range(len(self.engine.db)), rng.randint(1, 7))
+            profile = UserProfile(priorities=[], conditions={"hypertension": rng.random() < 0.5},
+                                  anxiety_level=rng.randint(0, 10), stress_level=rng.randint(0, 10))
+            for attr, table in (('synergies', index.synergies), ('antagonisms', index.antagonisms)):
+                hits = InteractionIndex.gather(table, selected, profile)
+                self.assertEqual(sorted((h.source, h.partner_id) for h in hits), self._scan(attr, selected, profile))
+                self.assertEqual([h.order for h in hits], sorted(h.order for h in hits))
+
+    def test_dangling_partners_are_dropped(self):
+        table = self.engine._interactions.antagonisms
+        partners = {h.partner_id for i in range(len(self.engine.db)) for links in table.row(i).values() for h in links}
+        self.assertNotIn("licorice", partners)
+        self.assertNotIn("hypotension", partners)
+
+class TestConditionExpressions(unittest.TestCase):
+    def _eval(self, text, **kwargs):
+        conditions = kwargs.pop('conditions', {})
+        return compile_condition(text)(UserProfile(priorities=[], conditions=conditions, **kwargs))
+
+    def test_comparators(self):
+        self.assertTrue(self._eval("anxiety >= 7", anxiety_level=7))
+        self.assertFalse(self._eval("anxiety > 7", anxiety_level=7))
+        self.assertTrue(self._eval("anxiety <= 7", anxiety_level=7))
+        self.assertFalse(self._eval("anxiety < 6", anxiety_level=6))
+        self.assertTrue(self._eval("stress == 3", stress_level=3))
+
+    def test_boolean_combinations(self):
+        expr = "anxiety >= 6 and insomnia < 5 or stress > 8"
+        self.assertTrue(self._eval(expr, anxiety_level=6, insomnia_level=2))
+        self.assertFalse(self._eval(expr, anxiety_level=6, insomnia_level=5))
+        self.assertTrue(self._eval(expr, stress_level=9))
+        self.assertFalse(self._eval("anxiety >= 6 and (insomnia < 5 or stress > 8)", insomnia_level=1))
+
+    def test_bare_name_is_condition_flag(self):
+        self.assertTrue(self._eval("hypertension", conditions={"hypertension": True}))
+        self.assertFalse(self._eval("hypertension"))
+
+    def test_malformed_expressions(self):
+        for bad in ["", "anxiety >=", "anxiety => 7", "mood >= 3", "anxiety >= 7 and", "(anxiety > 1", "anxiety >= 7)"]:
+            with self.assertRaises(ValueError, msg=bad):
+                compile_condition(bad)
+
+    def test_bad_expression_fails_at_load(self):
+        with open(DB_PATH, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+        data[0]['antagonisms'][0]['condition'] = "anxiety => 6"
+        fd, path = tempfile.mkstemp(suffix=".json")
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            json.dump(data, f)
+        try:
+            with self.assertRaisesRegex(ValueError, "valerian"):
+                HerbalFormulator(path)
+        finally:
+            os.remove(path)
+
+if __name__ == '__main__':
+    unittest.main()
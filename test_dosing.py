@@ -0,0 +1,78 @@
+import random
+import unittest
+from herbal_dosing import DosageSolver, DosageInfeasible, EMPTY, OPTIMAL, SHORT
+
+def random_problem(rng, n=5):
+    lo = [rng.choice([5, 10, 15, 25]) for _ in range(n)]
+    hi = [l + rng.choice([0, 5, 10, 15]) for l in lo]
+    families = [rng.choice("ABC") for _ in range(n)]
+    caps = {"A": 40.0, "B": 35.0}
+    targets = [rng.choice([40.0, 30.0, 20.0, 10.0]) for _ in range(n)]
+    return targets, lo, hi, families, caps
+
+def feasible(x, lo, hi, families, caps, total, tol=1e-6):
+    if any(v < l - tol or v > h + tol for v, l, h in zip(x, lo, hi)): return False
+    for family, cap in caps.items():
+        if sum(v for v, f in zip(x, families) if f == family) > cap + tol: return False
+    return abs(sum(x) - total) <= tol
+
+class TestDosageSolver(unittest.TestCase):
+    def test_projection_is_optimal(self):
+        """x is the projection of t iff (t - x) . (y - x) <= 0 for every feasible y."""
+        rng = random.Random(4)
+        solved = 0
+        for _ in range(300):
+            targets, lo, hi, families, caps = random_problem(rng)
+            try:
+                x, status = DosageSolver().solve(targets, lo, hi, families, caps)
+            except DosageInfeasible:
+                continue
+            total = sum(x)
+            self.assertTrue(feasible(x, lo, hi, families, caps, total))
+            if status == OPTIMAL: self.assertAlmostEqual(total, 100.0)
+            for _ in range(20): # Other points of the same feasible set
+                other = [rng.uniform(0, 50) for _ in targets]
+                try:
+                    y, other_status = DosageSolver().solve(other, lo, hi, families, caps)
+                except DosageInfeasible:
+                    continue
+                self.assertEqual(other_status, status)
+                self.assertLessEqual(sum((t - a) * (b - a) for t, a, b in zip(targets, x, y)), 1e-6)
+            solved += 1
+        self.assertGreater(solved, 50)
+
+    def test_warm_start_matches_cold_start(self):
+        rng = random.Random(9)
+        warm = DosageSolver()
+        for _ in range(200):
+            problem = random_problem(rng)
+            try:
+                cold = DosageSolver().solve(*problem)
+            except DosageInfeasible:
+                continue
+            self.assertEqual(warm.solve(*problem), cold)
+
+    def test_short_when_bounds_cannot_reach_total(self):
+        x, status = DosageSolver().solve([30.0, 20.0], [10, 5], [25, 10], ["A", "B"], {})
+        self.assertEqual((x, status), ([25.0, 10.0], SHORT))
+
+    def test_empty_selection_is_not_short(self):
+        self.assertEqual(DosageSolver().solve([], [], [], [], {}), ([], EMPTY))
+
+    def test_family_cap_and_total(self):
+        x, status = DosageSolver().solve([30.0, 30.0, 20.0, 20.0, 20.0], [20, 10, 5, 15, 15], [40, 15, 20, 35, 35],
+                                         ["S", "S", "S", "D", "D"], {"S": 40.0})
+        self.assertEqual(status, OPTIMAL)
+        self.assertAlmostEqual(sum(x), 100.0)
+        self.assertAlmostEqual(x[0] + x[1] + x[2], 40.0)
+
+    def test_infeasible_minimums(self):
+        with self.assertRaisesRegex(DosageInfeasible, "family S"):
+            DosageSolver().solve([30.0, 30.0], [25, 20], [40, 30], ["S", "S"], {"S": 40.0})
+        with self.assertRaisesRegex(DosageInfeasible, "above the 100.0% total"):
+            DosageSolver().solve([40.0] * 3, [35, 35, 35], [40, 40, 40], ["A", "B", "C"], {})
+        with self.assertRaisesRegex(DosageInfeasible, "valerian: minimum"):
+            DosageSolver().solve([40.0], [30], [20], ["S"], {}, names=["valerian"].__getitem__)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,70 @@
+import itertools
+import json
+import os
+import tempfile
+import unittest
+import herbal_table
+from herbal_engine import HerbalFormulator, FormulaTable
+from herbal_table import ui_profile, slider_space, CHECKBOXES, SLIDERS
+
+DB_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "plants_db.json")
+
+class TestFormulaTable(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        herbal_table._init_worker(DB_PATH)
+        seen, formulas = herbal_table._compile_slice((6, 2))
+        cls.seen = seen
+        cls.table = FormulaTable(herbal_table._engine.db_hash, formulas)
+        fd, cls.path = tempfile.mkstemp(suffix=".json")
+        os.close(fd)
+        cls.table.save(cls.path)
+
+    @classmethod
+    def tearDownClass(cls):
+        os.remove(cls.path)
+
+    def setUp(self):
+        self.live = HerbalFormulator(DB_PATH)
+        self.engine = HerbalFormulator(DB_PATH)
+        self.engine.load_formula_table(self.path)
+
+    def test_keys_are_deduplicated(self):
+        self.assertEqual(self.seen, 2 ** (len(SLIDERS) - 2) * 2 ** len(CHECKBOXES))
+        # Insomnia 2 -> 3 crosses no threshold: the slice collapses onto the same keys
+        _, other = herbal_table._compile_slice((6, 3))
+        self.assertEqual(set(other), set(self.table.formulas))
+        with open(self.path, 'r', encoding='utf-8') as f:
+            self.assertLess(len(json.load(f)["formulas"]), len(self.table))
+
+    def test_table_answers_match_live(self):
+        for focus, fatigue, checks in itertools.product(range(11), range(11), itertools.product((False, True), repeat=4)):
+            sliders = {"anxiety": 6, "insomnia": 2, "digestion": 3, "fatigue": fatigue,
+                       "inflammation": 0, "immunity": 5, "focus": focus}
+            profile = ui_profile(sliders, dict(zip(CHECKBOXES, checks)))
+            key = self.engine._canonical_key(self.engine._build_profile(profile))
+            self.assertIsNotNone(self.engine.table.get(key))
+            self.assertEqual(self.engine.generate_formula(profile), self.live.generate_formula(profile))
+
+    def test_profiles_outside_the_table_fall_back(self):
+        profile = ui_profile({s: 9 for s in SLIDERS}, {c: False for c in CHECKBOXES})
+        self.assertIsNone(self.engine.table.get(self.engine._canonical_key(self.engine._build_profile(profile))))
+        self.assertEqual(self.engine.generate_formula(profile), self.live.generate_formula(profile))
+        profiles = [profile, ui_profile(dict(next(slider_space(6, 2))), {c: True for c in CHECKBOXES})]
+        self.assertEqual(self.engine.generate_formulas(profiles), self.live.generate_formulas(profiles))
+
+    def test_stale_table_is_rejected(self):
+        with open(self.path, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+        data["db_hash"] = "0" * 64
+        fd, stale = tempfile.mkstemp(suffix=".json")
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            json.dump(data, f)
+        try:
+            with self.assertRaises(ValueError):
+                self.live.load_formula_table(stale)
+        finally:
+            os.remove(stale)
+
+if __name__ == '__main__':
+    unittest.main()
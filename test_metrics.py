@@ -0,0 +1,50 @@
+import os
+import unittest
+from herbal_engine import HerbalFormulator, FormulaCache
+from herbal_metrics import MetricsRecorder, STAGES, render_prometheus
+from test_batch import random_profiles
+
+DB_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "plants_db.json")
+
+class TestMetrics(unittest.TestCase):
+    def setUp(self):
+        self.plain = HerbalFormulator(DB_PATH)
+        self.engine = HerbalFormulator(DB_PATH, recorder=MetricsRecorder())
+
+    def test_instrumented_output_is_unchanged(self):
+        profiles = random_profiles(200, seed=8)
+        self.assertEqual([self.engine.generate_formula(p) for p in profiles],
+                         [self.plain.generate_formula(p) for p in profiles])
+        self.assertEqual(self.engine.generate_formulas(profiles), self.plain.generate_formulas(profiles))
+        snapshot = self.engine.metrics()
+        self.assertEqual(snapshot["requests"], 400)
+        for stage in STAGES + ("request",):
+            self.assertEqual(snapshot["stages"][stage]["count"], 400)
+            self.assertEqual(snapshot["stages"][stage]["buckets"][-1][1], 400)
+        self.assertEqual(self.plain.metrics(), {})
+
+    def test_counts_exclusions_and_antagonisms(self):
+        self.engine.generate_formula({"priorities": ["digestion", "bloating"], "conditions": {"pregnancy": True}})
+        self.engine.generate_formula({"priorities": ["sleep", "energy", "anxiety"], "conditions": {}, "anxiety_level": 6})
+        snapshot = self.engine.metrics()
+        self.assertEqual(snapshot["exclusions"], {"pregnancy": 1})
+        self.assertIn({"plant": "valerian", "partner": "green_tea", "action": "penalize", "count": 1}, snapshot["antagonisms"])
+
+    def test_cache_hits_are_lookups(self):
+        engine = HerbalFormulator(DB_PATH, cache=FormulaCache(16), recorder=MetricsRecorder())
+        profile = {"priorities": ["sleep"], "conditions": {}}
+        first = engine.generate_formula(profile)
+        self.assertEqual(engine.generate_formula(profile), first)
+        snapshot = engine.metrics()
+        self.assertEqual((snapshot["requests"], snapshot["lookups"], snapshot["stages"]["safety"]["count"]), (2, 1, 1))
+
+    def test_prometheus_text(self):
+        self.engine.generate_formula({"priorities": ["digestion"], "conditions": {"pregnancy": True}})
+        text = render_prometheus(self.engine.metrics())
+        self.assertIn("# TYPE herbal_stage_seconds histogram", text)
+        self.assertIn('herbal_stage_seconds_bucket{stage="dosing",le="+Inf"} 1', text)
+        self.assertIn('herbal_safety_exclusions_total{condition="pregnancy"} 1', text)
+        self.assertTrue(text.endswith("\n"))
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,113 @@
+import json
+import logging
+import os
+import tempfile
+import time
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+from herbal_engine import HerbalFormulator, FormulaCache, FormulaSession, ReloadingFormulator
+from test_batch import random_profiles
+
+DB_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "plants_db.json")
+
+def edited(records):
+    """A copy of the catalog with Valerian's range changed, so formulas differ."""
+    records = json.loads(json.dumps(records))
+    valerian = next(r for r in records if r['id'] == 'valerian')
+    valerian['max_percent'], valerian['min_percent'] = 20, 10
+    return records
+
+class TestReloadingFormulator(unittest.TestCase):
+    def setUp(self):
+        with open(DB_PATH, 'r', encoding='utf-8') as f:
+            self.original = json.load(f)
+        self.tmp = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmp.name, "plants_db.json")
+        self.write(self.original)
+        logging.disable(logging.CRITICAL)
+
+    def tearDown(self):
+        logging.disable(logging.NOTSET)
+        self.tmp.cleanup()
+
+    def write(self, records):
+        with open(self.path, 'w', encoding='utf-8') as f:
+            json.dump(records, f, indent=4)
+
+    def wait_for(self, condition, timeout=5.0):
+        deadline = time.monotonic() + timeout
+        while not condition():
+            if time.monotonic() > deadline: self.fail("timed out waiting for the watcher")
+            time.sleep(0.01)
+
+    def test_formulas_carry_catalog_version(self):
+        engine = HerbalFormulator(DB_PATH, cache=FormulaCache(16))
+        profiles = random_profiles(20, seed=3)
+        for formula in [engine.generate_formula(p) for p in profiles * 2] + engine.generate_formulas(profiles):
+            self.assertEqual(formula["catalog_version"], engine.db_hash)
+        self.assertEqual(FormulaSession(engine, profiles[0]).update()["catalog_version"], engine.db_hash)
+
+    def test_reload_swaps_snapshot(self):
+        engine = ReloadingFormulator(self.path)
+        profiles = random_profiles(100, seed=4)
+        old = engine.snapshot()
+        before = [engine.generate_formula(p) for p in profiles]
+        self.assertFalse(engine.reload()) # Same content
+        self.assertIs(engine.snapshot(), old)
+
+        self.write(edited(self.original))
+        self.assertTrue(engine.reload())
+        fresh = HerbalFormulator(self.path)
+        self.assertEqual(engine.db_hash, fresh.db_hash)
+        self.assertEqual(engine.generate_formulas(profiles), fresh.generate_formulas(profiles))
+        self.assertNotEqual([engine.generate_formula(p) for p in profiles], before)
+        # A request that bound the old snapshot still finishes on it
+        self.assertEqual([old.generate_formula(p) for p in profiles], before)
+        self.assertEqual(engine.reloads, 1)
+
+    def test_concurrent_requests_see_whole_snapshots(self):
+        versions = [self.original, edited(self.original)]
+        profiles = random_profiles(40, seed=5)
+        expected = {}
+        for records in versions:
+            self.write(records)
+            reference = HerbalFormulator(self.path)
+            expected[reference.db_hash] = [reference.generate_formula(p) for p in profiles]
+        engine = ReloadingFormulator(self.path, cache=FormulaCache(64))
+        with ThreadPoolExecutor(max_workers=6) as pool:
+            futures = [pool.submit(lambda n: (n, engine.generate_formula(profiles[n])), n % len(profiles))
+                       for n in range(1500)]
+            for k in range(6):
+                self.write(versions[k % 2])
+                engine.reload()
+            for future in futures:
+                n, formula = future.result()
+                self.assertEqual(formula, expected[formula["catalog_version"]][n])
+
+    def test_watcher_reloads_and_survives_bad_edits(self):
+        engine = ReloadingFormulator(self.path, interval=0.01)
+        try:
+            version = engine.db_hash
+            with open(self.path, 'w', encoding='utf-8') as f: f.write('[{"id": ') # Half-written file
+            self.wait_for(lambda: engine.errors >= 1)
+            self.assertEqual(engine.db_hash, version)
+            self.assertTrue(engine.generate_formula({"priorities": ["sleep"]})["components"])
+            self.write(edited(self.original))
+            self.wait_for(lambda: engine.reloads == 1)
+            self.assertEqual(engine.db_hash, HerbalFormulator(self.path).db_hash)
+        finally:
+            engine.close()
+
+    def test_session_follows_reload(self):
+        engine = ReloadingFormulator(self.path)
+        profile = {"priorities": ["sleep", "anxiety"], "conditions": {}, "anxiety_level": 4}
+        session = FormulaSession(engine, profile, explain=True)
+        self.write(edited(self.original))
+        engine.reload()
+        formula = session.update(insomnia_level=1)
+        self.assertEqual(formula, HerbalFormulator(self.path).generate_formula({**profile, "insomnia_level": 1},
+                                                                               explain=True))
+        self.assertEqual(session.runs["scoring"], 2)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,87 @@
+import asyncio
+import http.client
+import json
+import os
+import socket
+import threading
+import unittest
+from herbal_engine import HerbalFormulator
+from herbal_server import FormulaServer
+from test_batch import random_profiles
+
+DB_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "plants_db.json")
+
+class ServerTestCase(unittest.TestCase):
+    SERVER_OPTIONS = {}
+
+    @classmethod
+    def setUpClass(cls):
+        cls.loop = asyncio.new_event_loop()
+        cls.thread = threading.Thread(target=cls.loop.run_forever, daemon=True)
+        cls.thread.start()
+        cls.server = FormulaServer(DB_PATH, executor="thread", workers=2, batch_chunk=16, **cls.SERVER_OPTIONS)
+        asyncio.run_coroutine_threadsafe(cls.server.start("127.0.0.1", 0), cls.loop).result()
+        cls.engine = HerbalFormulator(DB_PATH)
+
+    @classmethod
+    def tearDownClass(cls):
+        asyncio.run_coroutine_threadsafe(cls.server.close(), cls.loop).result()
+        cls.loop.call_soon_threadsafe(cls.loop.stop)
+        cls.thread.join()
+        cls.loop.close()
+
+    def request(self, method, path, body=None, conn=None):
+        conn = conn or http.client.HTTPConnection("127.0.0.1", self.server.port, timeout=10)
+        data = body if isinstance(body, (bytes, type(None))) else json.dumps(body)
+        conn.request(method, path, body=data, headers={"Content-Type": "application/json"})
+        response = conn.getresponse()
+        return response.status, json.loads(response.read()), response
+
+class TestFormulaServer(ServerTestCase):
+    def test_formula_matches_engine(self):
+        conn = http.client.HTTPConnection("127.0.0.1", self.server.port, timeout=10)
+        for profile in random_profiles(20, seed=5): # One keep-alive connection
+            status, payload, _ = self.request("POST", "/formula", profile, conn)
+            self.assertEqual(status, 200)
+            self.assertEqual(payload, self.engine.generate_formula(profile))
+
+    def test_batch_matches_engine(self):
+        profiles = random_profiles(50, seed=6)
+        status, payload, _ = self.request("POST", "/formulas:batch", {"profiles": profiles})
+        self.assertEqual(status, 200)
+        self.assertEqual(payload["formulas"], self.engine.generate_formulas(profiles))
+
+    def test_client_errors(self):
+        self.assertEqual(self.request("POST", "/formula", b"{not json")[0], 400)
+        self.assertEqual(self.request("POST", "/formula", [1, 2])[0], 400)
+        self.assertEqual(self.request("POST", "/formula", {"priorities": 7})[0], 400)
+        self.assertEqual(self.request("POST", "/formulas:batch", {"profiles": {}})[0], 400)
+        self.assertEqual(self.request("GET", "/formula")[0], 405)
+        self.assertEqual(self.request("POST", "/nowhere", {})[0], 404)
+
+    def test_oversized_lines_get_a_response(self):
+        huge = "x" * 70000 # Past asyncio's default 64 KiB stream limit, small enough to be read in full
+        for head, status in ((f"GET /{huge} HTTP/1.1\r\n\r\n", 400),
+                             (f"GET /health HTTP/1.1\r\nX-Big: {huge}\r\n\r\n", 431)):
+            with socket.create_connection(("127.0.0.1", self.server.port), timeout=10) as sock:
+                sock.sendall(head.encode("latin-1"))
+                response = sock.makefile("rb").read()
+            self.assertTrue(response.startswith(f"HTTP/1.1 {status} ".encode()), response[:80])
+            self.assertIn(b"Connection: close", response)
+        self.assertEqual(self.request("GET", "/health")[0], 200)
+
+    def test_health(self):
+        status, payload, _ = self.request("GET", "/health")
+        self.assertEqual((status, payload["status"], payload["pending"]), (200, "ok", 0))
+
+class TestLoadShedding(ServerTestCase):
+    SERVER_OPTIONS = {"max_queue": 0, "max_batches": 0}
+
+    def test_saturated_service_sheds(self):
+        status, payload, response = self.request("POST", "/formula", {"priorities": ["sleep"]})
+        self.assertEqual((status, response.getheader("Retry-After")), (503, "1"))
+        self.assertEqual(self.request("POST", "/formulas:batch", {"profiles": []})[0], 503)
+        self.assertEqual(self.server.shed, 2)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,48 @@
+import os
+import random
+import unittest
+from herbal_engine import HerbalFormulator, FormulaCache, FormulaSession
+from herbal_table import ui_profile, SLIDERS, CHECKBOXES
+
+DB_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "plants_db.json")
+
+class TestFormulaSession(unittest.TestCase):
+    def setUp(self):
+        self.engine = HerbalFormulator(DB_PATH)
+        self.sliders = {"anxiety": 3, "insomnia": 2, "digestion": 4, "fatigue": 3, "inflammation": 2,
+                        "immunity": 2, "focus": 3}
+        self.checks = {name: False for name in CHECKBOXES}
+
+    def test_random_walk_matches_engine(self):
+        rng = random.Random(2)
+        for engine in (self.engine, HerbalFormulator(DB_PATH, cache=FormulaCache(64))):
+            session = FormulaSession(engine, explain=True)
+            for _ in range(300):
+                if rng.random() < 0.8: self.sliders[rng.choice(SLIDERS)] = rng.randint(0, 10)
+                else: self.checks[rng.choice(CHECKBOXES)] = rng.random() < 0.5
+                profile = ui_profile(self.sliders, self.checks)
+                self.assertEqual(session.update(**profile), self.engine.generate_formula(profile, explain=True))
+
+    def test_slider_within_threshold_skips_stages(self):
+        session = FormulaSession(self.engine, ui_profile(self.sliders, self.checks))
+        self.sliders["insomnia"] = 3 # Below the priority threshold, no condition flips
+        session.update(**ui_profile(self.sliders, self.checks))
+        self.assertEqual(session.runs, {"scoring": 1, "safety": 1, "composition": 1, "reused": 1})
+        self.sliders["insomnia"] = 4 # "sleep" becomes a priority; conditions unchanged
+        session.update(**ui_profile(self.sliders, self.checks))
+        self.assertEqual((session.runs["scoring"], session.runs["safety"]), (2, 1))
+        self.sliders["insomnia"] = 6 # Turns the insomnia condition on; priorities unchanged
+        session.update(**ui_profile(self.sliders, self.checks))
+        self.assertEqual((session.runs["scoring"], session.runs["safety"]), (2, 2))
+
+    def test_partial_updates(self):
+        session = FormulaSession(self.engine, {"priorities": ["sleep"], "conditions": {}})
+        formula = session.update(anxiety_level=8)
+        self.assertEqual(formula, self.engine.generate_formula({"priorities": ["sleep"], "conditions": {},
+                                                                "anxiety_level": 8}))
+        self.assertEqual(session.runs["scoring"], 1)
+        with self.assertRaises(TypeError):
+            session.update(sleep=3)
+
+if __name__ == "__main__":
+    unittest.main()
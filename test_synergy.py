@@ -13,7 +13,7 @@ def run_tests():
         "conditions": {},
         "anxiety_level": 5
     }
-    formula = formulator.generate_formula(profile_synergy)
+    formula = formulator.generate_formula(profile_synergy, explain=True)
     has_synergy = False
     for comp in formula['components']:
         print(f"{comp['name']}: {comp['percent']}% - Reason: {comp['reason']}")
@@ -27,7 +27,7 @@ def run_tests():
         "conditions": {},
         "anxiety_level": 6
     }
-    formula = formulator.generate_formula(profile_penalty)
+    formula = formulator.generate_formula(profile_penalty, explain=True)
     has_penalty = False
     for comp in formula['components']:
         print(f"{comp['name']}: {comp['percent']}% - Reason: {comp['reason']}")
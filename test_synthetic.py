@@ -0,0 +1,49 @@
+import hashlib
+import json
+import logging
+import os
+import tempfile
+import unittest
+from generate_plants_db import curated_plants, synthetic_plants, write_synthetic
+from herbal_engine import HerbalFormulator
+from test_batch import random_profiles
+
+class TestSyntheticCatalog(unittest.TestCase):
+    def test_seeded_and_deterministic(self):
+        self.assertEqual(list(synthetic_plants(300, seed=4)), list(synthetic_plants(300, seed=4)))
+        self.assertNotEqual(list(synthetic_plants(300, seed=4)), list(synthetic_plants(300, seed=5)))
+
+    def test_records_are_well_formed(self):
+        plants = list(synthetic_plants(2000, seed=1))
+        ids = {p["id"] for p in plants}
+        self.assertEqual(len(ids), 2000)
+        curated = curated_plants()
+        keys = {k for p in curated for k in p}
+        required = set.intersection(*(set(p) for p in curated))
+        self.assertLessEqual({p["role"] for p in plants}, {p["role"] for p in curated})
+        for p in plants:
+            self.assertTrue(required <= set(p) <= keys)
+            self.assertLessEqual(p["min_percent"], p["max_percent"])
+            for link in p.get("synergies", []) + p.get("antagonisms", []):
+                self.assertIn(link["with"], ids)
+                self.assertNotEqual(link["with"], p["id"])
+        links = sum(len(p.get("synergies", [])) for p in plants) / len(plants)
+        self.assertAlmostEqual(links, sum(len(p.get("synergies", [])) for p in curated) / len(curated), delta=0.2)
+
+    def test_streamed_file_loads(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "plants.json")
+            digest = write_synthetic(500, 2, path, binary=True)
+            with open(path, "rb") as f:
+                raw = f.read()
+            self.assertEqual(json.loads(raw), list(synthetic_plants(500, 2)))
+            self.assertEqual(digest, hashlib.sha256(raw).hexdigest())
+            engine = HerbalFormulator(path)
+            binary = HerbalFormulator(os.path.join(tmp, "plants.hcat"))
+            self.assertEqual(binary.db_hash, engine.db_hash)
+            profiles = random_profiles(50, seed=3)
+            self.assertEqual(binary.generate_formulas(profiles), engine.generate_formulas(profiles))
+
+if __name__ == "__main__":
+    logging.disable(logging.INFO)
+    unittest.main()
@@ -0,0 +1,56 @@
+import os
+import unittest
+from herbal_engine import HerbalFormulator, FormulaCache, TraceEvent, render_event
+from test_batch import random_profiles
+
+DB_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "plants_db.json")
+PROFILE = {"priorities": ["sleep", "energy", "anxiety"], "conditions": {"pregnancy": True}, "anxiety_level": 6}
+
+class TestDecisionTrace(unittest.TestCase):
+    def setUp(self):
+        self.engine = HerbalFormulator(DB_PATH)
+
+    def test_no_text_without_explain(self):
+        formula = self.engine.generate_formula(PROFILE)
+        self.assertNotIn("trace", formula)
+        for comp in formula["components"]:
+            self.assertEqual(set(comp), {"name", "role", "percent", "grams"})
+
+    def test_explain_renders_ordered_events(self):
+        formula = self.engine.generate_formula(PROFILE, explain=True)
+        kinds = [e["kind"] for e in formula["trace"]]
+        self.assertEqual(kinds[0], "exclude") # Safety runs before synergies and antagonisms
+        self.assertLess(kinds.index("synergy"), kinds.index("penalty"))
+        self.assertIn({"kind": "exclude", "plant": "ashwagandha", "condition": "pregnancy",
+                       "text": "Excluded due to pregnancy"}, formula["trace"])
+        valerian = next(c for c in formula["components"] if c["name"] == "Valerian")
+        self.assertEqual(valerian["reason"], "Synergy bonus +1.0; Penalty -1.0 (antagonism with korean_ginseng)")
+
+    def test_internal_trace_is_coded(self):
+        profile = self.engine._build_profile(PROFILE)
+        states = self.engine._score_plants(profile)
+        result = self.engine._formulate(profile, states)
+        self.assertTrue(all(isinstance(e.plant, int) for e in result["trace"]))
+        self.assertTrue(all(isinstance(s.final_role, int) for s in states.values()))
+        ashwagandha = next(s for s in states.values() if s.exclusion is not None and s.plant.id == "ashwagandha")
+        self.assertEqual(ashwagandha.exclusion_reason, "Excluded due to pregnancy")
+
+    def test_render_event(self):
+        self.assertEqual(render_event(TraceEvent('cap', 'green_tea', condition='hypertension', value=10)),
+                         "Capped at 10% via hypertension")
+        self.assertEqual(render_event(['role', 'licorice', None, None, 'pregnancy', 'Secondary']),
+                         "Shifted to Secondary via pregnancy")
+
+    def test_explain_does_not_change_formula(self):
+        cached = HerbalFormulator(DB_PATH, cache=FormulaCache(64))
+        profiles = random_profiles(100, seed=3)
+        plain = self.engine.generate_formulas(profiles)
+        for engine in (self.engine, cached):
+            explained = engine.generate_formulas(profiles, explain=True)
+            for a, b in zip(plain, explained):
+                self.assertEqual(a["components"], [{k: c[k] for k in ("name", "role", "percent", "grams")}
+                                                   for c in b["components"]])
+            self.assertEqual([engine.generate_formula(p) for p in profiles], plain)
+
+if __name__ == "__main__":
+    unittest.main()